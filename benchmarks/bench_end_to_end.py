@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+End-to-end benchmark of uploading Structured Data to a fake Wikibase.
+
+A FakeWikibaseServer is started in-process and seeded with synthetic files,
+after which the pywikibotsdc command line tool is run against it in a
+subprocess. Latency and error injection of the fake server are configurable
+so that throttling, retries and concurrency can be compared reproducibly.
+
+usage, from the root of the repository:
+    python -m benchmarks.bench_end_to_end [--files N] [--workers N]
+        [--save] [fake wikibase options]
+"""
+from __future__ import print_function, unicode_literals
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import benchmarks.harness as harness
+from benchmarks.fake_wikibase import config, fixtures, server
+
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(__file__), 'baseline_end_to_end.json')
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def handle_args(argv):
+    """Parse the command line arguments."""
+    parser = harness.make_parser(
+        __doc__.strip().splitlines()[0], DEFAULT_BASELINE)
+    parser.set_defaults(repeat=1)
+    parser.add_argument(
+        '--files', type=int, default=100,
+        help='number of files to upload (default: %(default)s)')
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='value of the --workers option (default: %(default)s)')
+    parser.add_argument(
+        '--tool-args', default='',
+        help='further space separated arguments passed on to pywikibotsdc')
+    parser.add_argument(
+        '--verbose', action='store_true',
+        help='show the output of pywikibotsdc')
+    server.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def run_once(args, directory):
+    """
+    Upload all files to a freshly seeded fake server.
+
+    @param args: the parsed command line arguments
+    @param directory: directory for the pywikibot config and the in-data
+    @return: (seconds, subprocess exit status, server statistics)
+    """
+    fake = server.from_args(args)
+    fixtures.seed(fake, args.files)
+    httpd = server.FakeWikibaseServer(fake)
+    httpd.start()
+    try:
+        config.write_user_config(directory, httpd.host)
+        data_file = os.path.join(directory, 'data.json')
+        with io.open(data_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(
+                {fixtures.file_title(number): fixtures.sdc_data(number)
+                 for number in range(args.files)}))
+
+        env = dict(os.environ, PYWIKIBOT_DIR=directory,
+                   FAKE_WIKIBASE_HOST=httpd.host, PYTHONPATH=REPO_ROOT)
+        command = [sys.executable, '-m', 'pywikibotsdc', data_file,
+                   '--workers', str(args.workers)] + args.tool_args.split()
+        output = None if args.verbose else subprocess.DEVNULL
+        start = time.time()
+        status = subprocess.call(
+            command, env=env, cwd=directory, stdout=output, stderr=output)
+        return time.time() - start, status, dict(fake.stats)
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def main(argv=None):
+    """Run the end-to-end benchmark and compare it to the baseline."""
+    args = handle_args(argv)
+    name = 'end_to_end[files={0},workers={1}]'.format(
+        args.files, args.workers)
+    baseline = harness.load_baseline(args.baseline)
+
+    timings = []
+    for _ in range(args.repeat):
+        directory = tempfile.mkdtemp(prefix='fake_wikibase_')
+        try:
+            seconds, status, stats = run_once(args, directory)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        if status:
+            print('pywikibotsdc exited with status {}'.format(status),
+                  file=sys.stderr)
+            return status
+        timings.append(seconds)
+        print('{0:.2f} s, {1:.1f} files/s'.format(
+            seconds, args.files / seconds))
+
+    results = {name: min(timings) / args.files}
+    print('{0}  {1:>10} per file{2}'.format(
+        name, harness.format_time(results[name]),
+        harness.format_change(results[name], baseline.get(name),
+                              args.threshold)))
+    print('server: ' + ', '.join(
+        '{0}={1}'.format(key, value) for key, value in sorted(stats.items())))
+    return harness.finish(results, baseline, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Micro-benchmarks of building the sdc payload.
+
+All pywikibot sites are replaced by the offline stubs used by the tests, and
+the property datatypes are fixed, so only the payload building is timed.
+
+usage, from the root of the repository:
+    python -m benchmarks.bench_payload [--save] [--filter REGEX]
+"""
+from __future__ import unicode_literals
+
+import os
+import sys
+
+import pywikibot
+
+import benchmarks.harness as harness
+import pywikibotsdc.sdc_upload as sdc_upload
+import pywikibotsdc.wikibase_json as wikibase_json
+from tests.stub_sites import StubRepo, offline_patches
+
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(__file__), 'baseline_payload.json')
+# one property per datatype, together with a typical value
+DATATYPE_VALUES = [
+    ('P1', 'wikibase-item', 'Q42'),
+    ('P2', 'commonsMedia', 'File:Example_image.jpg'),
+    ('P3', 'geo-shape', 'Data:Sweden/Uppsala.map'),
+    ('P4', 'tabular-data', 'Data:Population per year.tab'),
+    ('P5', 'monolingualtext', 'Ett exempel@sv'),
+    ('P6', 'globe-coordinate', '59.8586@lat,17.6389@lon'),
+    ('P7', 'quantity', '12.5@Q11573'),
+    ('P8', 'time', '1922-09-17T12:00:00Z'),
+    ('P9', 'string', 'a simple string'),
+    ('P10', 'url', 'https://example.com/a/b?c=d'),
+    ('P11', 'external-id', '1234-567X'),
+]
+DATATYPES = {pid: datatype for pid, datatype, _ in DATATYPE_VALUES}
+
+
+def _qualified_claim(num_qualifiers):
+    """Return a complex claim value with the given number of qualifiers."""
+    value = {'_': 'Q1', 'prominent': True}
+    for i in range(num_qualifiers):
+        pid, _, qual_value = DATATYPE_VALUES[i % len(DATATYPE_VALUES)]
+        value.setdefault(pid, []).append(qual_value)
+    return value
+
+
+# synthetic in-data of increasing size
+SDC_DATA = {
+    'simple': {'caption': {'en': 'A caption'}, 'P1': 'Q42'},
+    'all_datatypes': {pid: value for pid, _, value in DATATYPE_VALUES},
+    '20_qualifiers': {'P1': _qualified_claim(20)},
+    'long_list': {'P1': ['Q{}'.format(i) for i in range(1, 201)]},
+    'many_captions': {
+        'caption': {'l{0:03d}'.format(i): 'Caption number {}'.format(i)
+                    for i in range(300)}},
+}
+
+
+def build_benchmarks(repo):
+    """Return the (name, callable) pairs of all benchmarks."""
+    repo_info = wikibase_json.RepoInfo.from_site(repo)
+    benchmarks = [
+        ('is_prop_key', lambda: (
+            sdc_upload.is_prop_key('P12345'),
+            sdc_upload.is_prop_key('caption'))),
+        ('coord_precision', lambda: (
+            sdc_upload.coord_precision('59.8586'),
+            sdc_upload.coord_precision('1200'))),
+        ('iso_to_wbtime', lambda: sdc_upload.iso_to_wbtime(
+            '2014-07-11T08:14:46Z')),
+    ]
+
+    for pid, datatype, value in DATATYPE_VALUES:
+        claim = pywikibot.Claim(repo, pid, datatype=datatype)
+        benchmarks.append((
+            'format_claim_value[{}]'.format(datatype),
+            lambda claim=claim, value=value: sdc_upload.format_claim_value(
+                claim, value)))
+
+    complex_value = _qualified_claim(20)
+    benchmarks += [
+        ('make_claim[simple]', lambda: sdc_upload.make_claim(
+            'Q42', 'P1', repo)),
+        ('make_claim[20_qualifiers]', lambda: sdc_upload.make_claim(
+            complex_value, 'P1', repo)),
+        ('set_complex_claim_value[20_qualifiers]',
+         lambda: sdc_upload.set_complex_claim_value(
+             complex_value,
+             pywikibot.Claim(repo, 'P1', datatype='wikibase-item'))),
+    ]
+
+    def format_uncached(data):
+        sdc_upload.get_claim_cache().clear()
+        return sdc_upload.format_sdc_payload(repo, data)
+
+    for label, data in SDC_DATA.items():
+        benchmarks += [
+            # repeated claims are served by the claim cache
+            ('format_sdc_payload[{}]'.format(label),
+             lambda data=data: sdc_upload.format_sdc_payload(repo, data)),
+            ('format_sdc_payload[{},uncached]'.format(label),
+             lambda data=data: format_uncached(data)),
+            ('compile_sdc_payload[{}]'.format(label),
+             lambda data=data: wikibase_json.compile_sdc_payload(
+                 data, DATATYPES, repo_info)),
+        ]
+    return benchmarks
+
+
+def main(argv=None):
+    """Run the payload benchmarks against the offline stub sites."""
+    repo = StubRepo()
+    patches = offline_patches(repo, DATATYPES)
+    for patcher in patches:
+        patcher.start()
+    try:
+        return harness.main(
+            build_benchmarks(repo), __doc__.strip().splitlines()[0],
+            DEFAULT_BASELINE, argv)
+    finally:
+        for patcher in patches:
+            patcher.stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
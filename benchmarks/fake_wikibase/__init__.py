@@ -0,0 +1,7 @@
+# -*- coding: utf-8  -*-
+"""A local fake of the Commons and Wikidata APIs, for end-to-end benchmarks."""
+from benchmarks.fake_wikibase.config import write_user_config  # noqa: F401
+from benchmarks.fake_wikibase.server import (  # noqa: F401
+    FakeWikibase,
+    FakeWikibaseServer
+)
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Run the fake Commons and Wikidata until interrupted.
+
+usage, from the root of the repository:
+    python -m benchmarks.fake_wikibase [--port PORT] [--files N]
+        [--config-dir DIR] [fake wikibase options]
+
+Then run pywikibotsdc with PYWIKIBOT_DIR=DIR to upload to the fake wikis.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import json
+import os
+import sys
+
+from benchmarks.fake_wikibase import config, fixtures, server
+
+
+def main(argv=None):
+    """Start the server and, optionally, write config and example data."""
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument(
+        '--files', type=int, default=1000,
+        help='number of synthetic files to create (default: %(default)s)')
+    parser.add_argument(
+        '--config-dir',
+        help='write a user-config.py, and data.json with Structured Data for '
+             'all of the files, to this directory')
+    server.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    fake = server.from_args(args)
+    fixtures.seed(fake, args.files)
+    httpd = server.FakeWikibaseServer(fake, args.host, args.port)
+    if args.config_dir:
+        if not os.path.isdir(args.config_dir):
+            os.makedirs(args.config_dir)
+        config.write_user_config(args.config_dir, httpd.host)
+        with open(os.path.join(args.config_dir, 'data.json'), 'w') as f:
+            json.dump({fixtures.file_title(number): fixtures.sdc_data(number)
+                       for number in range(args.files)}, f)
+        print('Run: PYWIKIBOT_DIR={0} python -m pywikibotsdc {1}'.format(
+            args.config_dir, os.path.join(args.config_dir, 'data.json')))
+    print('Serving {0} files on http://{1}'.format(args.files, httpd.host))
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        print(json.dumps(dict(fake.stats), indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Pywikibot configuration for running against the fake wikis."""
+from __future__ import unicode_literals
+
+import io
+import os
+
+FAMILIES_DIR = os.path.join(os.path.dirname(__file__), 'families')
+USER_CONFIG = """# -*- coding: utf-8  -*-
+# Generated by benchmarks.fake_wikibase, points pywikibot at the fake wikis.
+import os
+
+os.environ['FAKE_WIKIBASE_HOST'] = {host!r}
+family_files['commons'] = {commons!r}
+family_files['wikidata'] = {wikidata!r}
+family = 'commons'
+mylang = 'commons'
+usernames['commons']['commons'] = {user!r}
+usernames['wikidata']['wikidata'] = {user!r}
+put_throttle = {put_throttle!r}
+maxlag = 5
+max_retries = {max_retries!r}
+retry_wait = 1
+retry_max = 2
+"""
+
+
+def write_user_config(directory, host, user='FakeBot', put_throttle=0,
+                      max_retries=5):
+    """
+    Write a user-config.py pointing pywikibot at the fake wikis.
+
+    Use the directory as PYWIKIBOT_DIR to use the config.
+
+    @param directory: directory in which to write user-config.py
+    @param host: the host:port of the FakeWikibaseServer
+    @param user: the bot user name
+    @param put_throttle: minimum seconds between edits
+    @param max_retries: how often pywikibot retries a failed request
+    @return: path to the user-config.py
+    """
+    path = os.path.join(directory, 'user-config.py')
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(USER_CONFIG.format(
+            host=host,
+            commons=os.path.join(FAMILIES_DIR, 'commons_family.py'),
+            wikidata=os.path.join(FAMILIES_DIR, 'wikidata_family.py'),
+            user=user, put_throttle=put_throttle, max_retries=max_retries))
+    return path
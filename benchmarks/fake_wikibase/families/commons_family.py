@@ -0,0 +1,28 @@
+# -*- coding: utf-8  -*-
+"""Family module for the fake Commons, see benchmarks.fake_wikibase."""
+from __future__ import unicode_literals
+
+import os
+
+from pywikibot import family
+
+
+class Family(family.Family):
+    """Family class for the fake Commons served on FAKE_WIKIBASE_HOST."""
+
+    name = 'commons'
+    langs = {
+        'commons': os.environ.get('FAKE_WIKIBASE_HOST', '127.0.0.1:8080'),
+    }
+
+    def protocol(self, code):
+        """Return http as the protocol."""
+        return 'http'
+
+    def scriptpath(self, code):
+        """Return the script path of the fake Commons."""
+        return '/commons/w'
+
+    def shared_data_repository(self, code):
+        """Return the fake Wikidata."""
+        return ('wikidata', 'wikidata')
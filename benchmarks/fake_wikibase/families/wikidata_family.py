@@ -0,0 +1,47 @@
+# -*- coding: utf-8  -*-
+"""Family module for the fake Wikidata, see benchmarks.fake_wikibase."""
+from __future__ import unicode_literals
+
+import os
+
+from pywikibot import family
+
+
+class Family(family.Family):
+    """Family class for the fake Wikidata served on FAKE_WIKIBASE_HOST."""
+
+    name = 'wikidata'
+    langs = {
+        'wikidata': os.environ.get('FAKE_WIKIBASE_HOST', '127.0.0.1:8080'),
+    }
+
+    def protocol(self, code):
+        """Return http as the protocol."""
+        return 'http'
+
+    def scriptpath(self, code):
+        """Return the script path of the fake Wikidata."""
+        return '/wikidata/w'
+
+    def interface(self, code):
+        """Return DataSite as the interface."""
+        return 'DataSite'
+
+    def shared_data_repository(self, code):
+        """Return the fake Wikidata itself."""
+        return ('wikidata', 'wikidata')
+
+    def calendarmodel(self, code):
+        """Default calendar model for WbTime datatype."""
+        return 'http://www.wikidata.org/entity/Q1985727'
+
+    def default_globe(self, code):
+        """Default globe for Coordinate datatype."""
+        return 'earth'
+
+    def globes(self, code):
+        """Supported globes for Coordinate datatype."""
+        return {
+            'earth': 'http://www.wikidata.org/entity/Q2',
+            'moon': 'http://www.wikidata.org/entity/Q405',
+        }
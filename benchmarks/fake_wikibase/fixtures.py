@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Synthetic files, properties and Structured Data for the fake wikis."""
+from __future__ import unicode_literals
+
+# properties commonly used for Structured Data on Commons
+PROPERTIES = {
+    'P170': 'wikibase-item',  # creator
+    'P180': 'wikibase-item',  # depicts
+    'P275': 'wikibase-item',  # copyright license
+    'P571': 'time',  # inception
+    'P625': 'globe-coordinate',  # coordinate location
+    'P1259': 'globe-coordinate',  # coordinates of the point of view
+    'P1476': 'monolingualtext',  # title
+    'P2048': 'quantity',  # height
+    'P6216': 'wikibase-item',  # copyright status
+    'P7482': 'wikibase-item',  # source of file
+    'P973': 'url',  # described at URL
+    'P1163': 'string',  # media type
+    'P2093': 'string',  # author name string
+}
+
+
+def file_title(number):
+    """Return the title of the n:th synthetic file."""
+    return 'File:Benchmark image {0:06d}.jpg'.format(number)
+
+
+def seed(fake, num_files):
+    """
+    Add the synthetic files and all PROPERTIES to a FakeWikibase.
+
+    @param fake: the FakeWikibase
+    @param num_files: number of files to add
+    """
+    for pid, datatype in PROPERTIES.items():
+        fake.add_property(pid, datatype)
+    for number in range(num_files):
+        fake.add_file(file_title(number), text='== Summary ==\nA benchmark')
+
+
+def sdc_data(number):
+    """Return realistic Structured Data for the n:th synthetic file."""
+    return {
+        'caption': {
+            'en': 'Benchmark image number {}'.format(number),
+            'sv': 'Prestandatestbild nummer {}'.format(number),
+        },
+        'P180': [
+            {'_': 'Q{}'.format(1000 + number), 'prominent': True},
+            'Q{}'.format(2000 + number % 50),
+        ],
+        'P170': {'_': '_some_value_', 'P2093': 'Anonymous'}
+        if number % 10 else 'Q42',
+        'P571': '19{0:02d}-0{1}-1{2}'.format(
+            number % 100, number % 9 + 1, number % 10),
+        'P1259': '59.{0:04d}@lat,17.{1:04d}@lon'.format(
+            number % 10000, (number * 7) % 10000),
+        'P2048': '{}@Q11573'.format(100 + number % 50),
+        'P1476': 'Bild {}@sv'.format(number),
+        'P275': 'Q18199165',
+        'P6216': 'Q50423863',
+        'P7482': 'Q66458942',
+        'P973': 'https://example.com/images/{}'.format(number),
+        'P1163': 'image/jpeg',
+    }
@@ -0,0 +1,710 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+A local stand-in for the Commons and Wikidata APIs.
+
+Implements the parts of the MediaWiki Action API, and of the Wikibase API,
+used by pywikibot and this project, with all state kept in memory. Commons
+is served under /commons/w/api.php and Wikidata under /wikidata/w/api.php.
+
+Each request can be delayed by a configurable latency and, at configurable
+rates, fail with the maxlag, ratelimited, badtoken or editconflict errors
+of the real API.
+"""
+from __future__ import unicode_literals
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+USER_NAME = 'FakeBot'
+DEFAULT_RIGHTS = ('read', 'edit', 'writeapi', 'bot', 'apihighlimits', 'purge')
+MW_VERSION = '1.36.0-wmf.1'
+CONCEPT_BASE_URI = 'http://www.wikidata.org/entity/'
+WIKIS = ('commons', 'wikidata')
+WRITE_ACTIONS = ('wbeditentity', 'edit', 'purge')
+# write actions needing a csrf token, unlike purge
+TOKEN_ACTIONS = ('wbeditentity', 'edit')
+FILE_NAMESPACE = 6
+
+_NAMESPACES = {
+    'commons': [
+        (0, '', '', None), (1, 'Talk', 'Talk', None),
+        (2, 'User', 'User', None), (4, 'Commons', 'Project', None),
+        (6, 'File', 'File', None), (7, 'File talk', 'File talk', None),
+        (14, 'Category', 'Category', None),
+        (486, 'Data', 'Data', None), (487, 'Data talk', 'Data talk', None),
+    ],
+    'wikidata': [
+        (0, '', '', 'wikibase-item'), (1, 'Talk', 'Talk', None),
+        (2, 'User', 'User', None), (4, 'Wikidata', 'Project', None),
+        (120, 'Property', 'Property', 'wikibase-property'),
+        (121, 'Property talk', 'Property talk', None),
+    ],
+}
+_NAMESPACE_ALIASES = {'commons': [(6, 'Image')], 'wikidata': []}
+_TOKEN_TYPES = ['createaccount', 'csrf', 'login', 'patrol', 'rollback',
+                'userrights', 'watch']
+# submodules of query per module type, and their parameter prefix
+_QUERY_MODULES = {
+    'prop': {'info': 'in', 'revisions': 'rv'},
+    'meta': {'siteinfo': 'si', 'tokens': '', 'userinfo': 'ui',
+             'wikibase': 'wb'},
+}
+
+
+class LostResponse(Exception):
+    """The request was handled but no response should be sent."""
+
+
+class ApiError(Exception):
+    """An error to be returned as an API error response."""
+
+    def __init__(self, code, info, headers=None, **extra):
+        """
+        Initializer.
+
+        @param code: the API error code
+        @param info: the human readable error message
+        @param headers: dict of extra HTTP headers of the response
+        @param extra: any other fields of the error
+        """
+        super(ApiError, self).__init__(info)
+        self.code = code
+        self.info = info
+        self.headers = headers or {}
+        self.extra = extra
+
+    def to_json(self):
+        """Return the API error response."""
+        error = {'code': self.code, 'info': self.info, '*': ''}
+        error.update(self.extra)
+        return {'error': error, 'servedby': 'fake-wikibase'}
+
+
+def normalise_title(title):
+    """Return the title as normalised by MediaWiki, treating Image as File."""
+    title = ' '.join(title.replace('_', ' ').split())
+    namespace, colon, rest = title.partition(':')
+    if colon and namespace.strip().lower() in ('file', 'image'):
+        rest = rest.strip()
+        return 'File:' + rest[:1].upper() + rest[1:]
+    return title[:1].upper() + title[1:]
+
+
+class FakeWikibase(object):
+    """
+    The in-memory state of the fake wikis, and the API actions acting on it.
+
+    All public methods are thread safe.
+    """
+
+    def __init__(self, base_url='http://127.0.0.1', read_latency=0.0,
+                 write_latency=0.0, maxlag_rate=0.0, ratelimit_rate=0.0,
+                 badtoken_rate=0.0, editconflict_rate=0.0,
+                 lost_response_rate=0.0, retry_after=1, rights=DEFAULT_RIGHTS,
+                 seed=None):
+        """
+        Initializer.
+
+        @param base_url: protocol, host and port at which the server is found
+        @param read_latency: delay of every read request, in seconds
+        @param write_latency: delay of every write request, in seconds
+        @param maxlag_rate: share of requests failing with maxlag
+        @param ratelimit_rate: share of writes failing with ratelimited
+        @param badtoken_rate: share of writes for which the csrf token is
+            invalidated before the request is handled
+        @param editconflict_rate: share of wbeditentity calls failing with
+            editconflict
+        @param lost_response_rate: share of wbeditentity calls which are
+            saved but whose connection is closed without a response
+        @param retry_after: value of the Retry-After header on maxlag
+        @param rights: the user rights of the bot account
+        @param seed: seed of the random error injection
+        """
+        self.base_url = base_url
+        self.read_latency = read_latency
+        self.write_latency = write_latency
+        self.maxlag_rate = maxlag_rate
+        self.ratelimit_rate = ratelimit_rate
+        self.badtoken_rate = badtoken_rate
+        self.editconflict_rate = editconflict_rate
+        self.lost_response_rate = lost_response_rate
+        self.retry_after = retry_after
+        self.rights = list(rights)
+
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._token_generation = 0
+        self._last_revision_id = 0
+        # title: {'pageid', 'text', 'revid', 'comment', 'timestamp',
+        #         'redirect'} per wiki
+        self.pages = {wiki: {} for wiki in WIKIS}
+        # Mid: {'labels', 'statements', 'lastrevid'}
+        self.mediainfo = {}
+        # Pid: datatype
+        self.properties = {}
+        self.stats = Counter()
+
+    # ---- seeding the state ----
+
+    def add_file(self, title, text='', redirect=None):
+        """
+        Add a file page to Commons.
+
+        @param title: title of the file, with or without namespace
+        @param text: wikitext of the file page
+        @param redirect: title of the file this file redirects to, if any
+        @return: the Mid of the file
+        """
+        title = normalise_title(title)
+        if not title.startswith('File:'):
+            title = normalise_title('File:' + title)
+        with self._lock:
+            pages = self.pages['commons']
+            page_id = len(pages) + 1
+            pages[title] = {
+                'pageid': page_id, 'ns': FILE_NAMESPACE, 'text': text,
+                'revid': self._next_revision_id(), 'comment': '',
+                'timestamp': '2021-01-01T00:00:00Z',
+                'redirect': redirect and normalise_title(redirect)}
+        return 'M{}'.format(page_id)
+
+    def add_property(self, pid, datatype):
+        """Add a property, with the given datatype, to Wikidata."""
+        with self._lock:
+            self.properties[pid.upper()] = datatype
+
+    def count(self, key, amount=1):
+        """Increase one of the statistics counters."""
+        with self._lock:
+            self.stats[key] += amount
+
+    def _next_revision_id(self):
+        self._last_revision_id += 1
+        return self._last_revision_id
+
+    # ---- request handling ----
+
+    def handle(self, wiki, params):
+        """
+        Handle a single API request.
+
+        @param wiki: "commons" or "wikidata"
+        @param params: dict of the request parameters
+        @return: (response json, dict of extra headers) tuple
+        @raises: LostResponse
+        """
+        action = params.get('action', 'main')
+        is_write = action in WRITE_ACTIONS
+        self.count('requests')
+        self.count('{0}:{1}'.format(wiki, action))
+        time.sleep(self.write_latency if is_write else self.read_latency)
+        try:
+            self._inject_errors(params, is_write)
+            handler = getattr(self, '_action_{}'.format(action), None)
+            if not handler:
+                raise ApiError(
+                    'badvalue',
+                    'Unrecognized value for parameter "action": {}'.format(
+                        action))
+            with self._lock:
+                response = handler(wiki, params)
+            if action == 'wbeditentity' and self._chance(
+                    self.lost_response_rate):
+                self.count('lost_responses')
+                raise LostResponse()
+            return response, {}
+        except ApiError as error:
+            self.count('error:{}'.format(error.code))
+            return error.to_json(), error.headers
+
+    def _chance(self, rate):
+        with self._lock:
+            return rate and self._random.random() < rate
+
+    def _inject_errors(self, params, is_write):
+        if 'maxlag' in params and self._chance(self.maxlag_rate):
+            lag = int(params['maxlag']) + 1
+            raise ApiError(
+                'maxlag',
+                'Waiting for db1: {} seconds lagged.'.format(lag),
+                headers={'Retry-After': str(self.retry_after),
+                         'X-Database-Lag': str(lag)},
+                host='db1', lag=lag, type='db')
+        if not is_write:
+            return
+        if self._chance(self.ratelimit_rate):
+            raise ApiError(
+                'ratelimited',
+                "As an anti-abuse measure, you are limited from performing "
+                "this action too many times in a short space of time, and "
+                "you have exceeded this limit. Please try again in a few "
+                "minutes.")
+        if self._chance(self.badtoken_rate):
+            with self._lock:
+                self._token_generation += 1
+        if (params.get('action') in TOKEN_ACTIONS
+                and params.get('token') != self._csrf_token()):
+            raise ApiError('badtoken', 'Invalid CSRF token.')
+        if (params.get('action') == 'wbeditentity'
+                and self._chance(self.editconflict_rate)):
+            raise ApiError('editconflict', 'Edit conflict.')
+
+    def _csrf_token(self):
+        return '{0:032x}+\\'.format(self._token_generation + 1)
+
+    def _action_main(self, wiki, params):
+        raise ApiError('help', 'Use an action parameter.')
+
+    def _action_paraminfo(self, wiki, params):
+        modules = [_module_info(path) for path in _split(params['modules'])]
+        return {'paraminfo': {'modules': modules}}
+
+    def _action_query(self, wiki, params):
+        response = {'batchcomplete': ''}
+        query = response['query'] = {}
+        for meta in _split(params.get('meta')):
+            handler = getattr(self, '_meta_{}'.format(meta), None)
+            if not handler:
+                raise ApiError(
+                    'badvalue',
+                    'Unrecognized value for parameter "meta": {}'.format(
+                        meta))
+            handler(wiki, params, query)
+        if params.get('pageids'):
+            page_ids = set(_split(params['pageids']))
+            params = dict(params, titles='|'.join(
+                title for title, page in self.pages[wiki].items()
+                if str(page['pageid']) in page_ids))
+        if params.get('titles'):
+            self._query_titles(wiki, params, query)
+        return response
+
+    def _meta_siteinfo(self, wiki, params, query):
+        path = '/{}/w'.format(wiki)
+        query['general'] = {
+            'mainpage': 'Main Page',
+            'base': '{0}{1}/index.php?title=Main_Page'.format(
+                self.base_url, path),
+            'sitename': 'Fake {}'.format(wiki),
+            'generator': 'MediaWiki {}'.format(MW_VERSION),
+            'phpversion': '7.2.0',
+            'case': 'first-letter',
+            'lang': 'en',
+            'fallback': [],
+            'fallback8bitEncoding': 'windows-1252',
+            'writeapi': '',
+            'maxarticlesize': 2097152,
+            'timezone': 'UTC',
+            'timeoffset': 0,
+            'articlepath': '/wiki/$1',
+            'scriptpath': path,
+            'script': path + '/index.php',
+            'server': self.base_url,
+            'servername': urlsplit(self.base_url).hostname,
+            'wikiid': '{}wiki'.format(wiki),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'maxuploadsize': 4294967296,
+            'legaltitlechars': " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~"
+                               "\\x80-\\xFF+",
+            'wikibase-conceptbaseuri': CONCEPT_BASE_URI,
+        }
+        query['namespaces'] = {}
+        for ns_id, name, canonical, content_model in _NAMESPACES[wiki]:
+            namespace = {'id': ns_id, 'case': 'first-letter', '*': name,
+                         'subpages': '', 'canonical': canonical}
+            if content_model:
+                namespace['defaultcontentmodel'] = content_model
+            if not ns_id:
+                del namespace['canonical']
+            query['namespaces'][str(ns_id)] = namespace
+        query['namespacealiases'] = [
+            {'id': ns_id, '*': alias}
+            for ns_id, alias in _NAMESPACE_ALIASES[wiki]]
+        query['extensions'] = [
+            {'name': 'WikibaseClient', 'type': 'wikibase'},
+            {'name': 'WikibaseMediaInfo'
+             if wiki == 'commons' else 'WikibaseRepository',
+             'type': 'wikibase'},
+        ]
+
+    def _meta_wikibase(self, wiki, params, query):
+        query['wikibase'] = {
+            'repo': {'url': {'base': self.base_url,
+                             'scriptpath': '/wikidata/w',
+                             'articlepath': '/wiki/$1'}},
+            'siteid': '{}wiki'.format(wiki),
+        }
+
+    def _meta_userinfo(self, wiki, params, query):
+        query['userinfo'] = {
+            'id': 1, 'name': USER_NAME, 'groups': ['*', 'user', 'bot'],
+            'rights': self.rights, 'editcount': 0, 'messages': False,
+            'ratelimits': {'edit': {'user': {'hits': 90, 'seconds': 60}}}}
+
+    def _meta_tokens(self, wiki, params, query):
+        types = _split(params.get('type')) or ['csrf']
+        query['tokens'] = {
+            '{}token'.format(token_type): (
+                self._csrf_token() if token_type == 'csrf'
+                else '{}token+\\'.format(token_type))
+            for token_type in types}
+
+    def _query_titles(self, wiki, params, query):
+        titles = _split(params['titles'])
+        normalized = []
+        redirects = []
+        pages = {}
+        missing = 0
+        for title in titles:
+            target = normalise_title(title)
+            if target != title:
+                normalized.append({'from': title, 'to': target})
+            page = self.pages[wiki].get(target)
+            if page and page['redirect'] and 'redirects' in params:
+                redirects.append({'from': target, 'to': page['redirect']})
+                target = page['redirect']
+                page = self.pages[wiki].get(target)
+            if not page:
+                missing += 1
+                pages[str(-missing)] = {
+                    'ns': _namespace_id(wiki, target), 'title': target,
+                    'missing': ''}
+                continue
+            entry = {
+                'pageid': page['pageid'], 'ns': page['ns'], 'title': target,
+                'contentmodel': 'wikitext', 'pagelanguage': 'en',
+                'touched': '2021-01-01T00:00:00Z', 'lastrevid': page['revid'],
+                'length': len(page['text'])}
+            if 'revisions' in _split(params.get('prop')):
+                entry['revisions'] = [self._revision(page)]
+            pages[str(page['pageid'])] = entry
+        if normalized:
+            query['normalized'] = normalized
+        if redirects:
+            query['redirects'] = redirects
+        query['pages'] = pages
+
+    def _revision(self, page):
+        return {
+            'revid': page['revid'], 'parentid': 0, 'user': USER_NAME,
+            'timestamp': page['timestamp'], 'comment': page['comment'],
+            'slots': {'main': {'contentmodel': 'wikitext',
+                               'contentformat': 'text/x-wiki',
+                               '*': page['text']}}}
+
+    def _action_wbgetentities(self, wiki, params):
+        entities = {}
+        props = _split(params.get('props'))
+        languages = _split(params.get('languages'))
+        for entity_id in _split(params.get('ids')):
+            entity_id = entity_id.upper()
+            if wiki == 'wikidata':
+                entities[entity_id] = self._property_entity(entity_id)
+            else:
+                entities[entity_id] = self._mediainfo_entity(
+                    entity_id, props, languages)
+        return {'entities': entities, 'success': 1}
+
+    def _property_entity(self, pid):
+        if pid not in self.properties:
+            return {'id': pid, 'missing': ''}
+        return {'type': 'property', 'id': pid,
+                'datatype': self.properties[pid]}
+
+    def _mediainfo_entity(self, mid, props=None, languages=None):
+        data = self.mediainfo.get(mid)
+        if not data:
+            return {'id': mid, 'missing': ''}
+        entity = {'type': 'mediainfo', 'id': mid,
+                  'lastrevid': data['lastrevid']}
+        if not props or 'labels' in props:
+            entity['labels'] = {
+                lang: label for lang, label in data['labels'].items()
+                if not languages or lang in languages}
+        if not props or 'claims' in props:
+            entity['statements'] = data['statements']
+        return entity
+
+    def _action_wbeditentity(self, wiki, params):
+        mid = params.get('id', '').upper()
+        if wiki != 'commons' or not self._page_by_id(mid):
+            raise ApiError(
+                'no-such-entity', 'Could not find an entity with the ID '
+                '"{}".'.format(mid))
+        try:
+            data = json.loads(params.get('data', '{}'))
+        except ValueError:
+            raise ApiError('invalid-json', 'Invalid json: data')
+
+        entity = self.mediainfo.get(mid)
+        if not entity or params.get('clear'):
+            entity = {'labels': {}, 'statements': {}}
+        for lang, label in data.get('labels', {}).items():
+            entity['labels'][lang] = label
+        for claim in data.get('claims', []):
+            datatype = self.properties.get(claim['mainsnak']['property'])
+            if 'datatype' in claim['mainsnak'] and (
+                    claim['mainsnak']['datatype'] != datatype):
+                raise ApiError(
+                    'modification-failed',
+                    'Bad datatype for {}'.format(
+                        claim['mainsnak']['property']))
+            claim = dict(claim)
+            claim['id'] = '{0}${1}'.format(
+                mid, self._random.getrandbits(64))
+            entity['statements'].setdefault(
+                claim['mainsnak']['property'], []).append(claim)
+        entity['lastrevid'] = self._next_revision_id()
+        self.mediainfo[mid] = entity
+        page = self._page_by_id(mid)
+        page.update(
+            revid=entity['lastrevid'],
+            comment='/* wbeditentity-update:0| */ {}'.format(
+                params.get('summary', '')),
+            timestamp=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        self.count('edits')
+        return {'entity': self._mediainfo_entity(mid), 'success': 1}
+
+    def _page_by_id(self, mid):
+        if not mid.startswith('M') or not mid[1:].isdigit():
+            return None
+        for page in self.pages['commons'].values():
+            if page['pageid'] == int(mid[1:]):
+                return page
+
+    def _action_purge(self, wiki, params):
+        purged = []
+        for title in _split(params.get('titles')):
+            title = normalise_title(title)
+            entry = {'ns': _namespace_id(wiki, title), 'title': title}
+            if title in self.pages[wiki]:
+                entry['purged'] = ''
+                if 'forcelinkupdate' in params:
+                    entry['linkupdate'] = ''
+            else:
+                entry['missing'] = ''
+            purged.append(entry)
+        self.count('purged', len(purged))
+        return {'batchcomplete': '', 'purge': purged}
+
+    def _action_edit(self, wiki, params):
+        title = normalise_title(params.get('title', ''))
+        page = self.pages[wiki].get(title)
+        if not page:
+            raise ApiError('missingtitle', "The page you specified doesn't "
+                                           'exist.')
+        result = {'result': 'Success', 'pageid': page['pageid'],
+                  'title': title, 'contentmodel': 'wikitext'}
+        text = params.get('text', page['text'])
+        if text == page['text']:
+            result['nochange'] = ''
+        else:
+            page['text'] = text
+            page['revid'] = self._next_revision_id()
+            result.update(oldrevid=page['revid'], newrevid=page['revid'])
+        return {'edit': result}
+
+
+def _split(value):
+    """Split a multi-value API parameter."""
+    if not value:
+        return []
+    if value.startswith('\x1f'):
+        return value[1:].split('\x1f')
+    return value.split('|')
+
+
+def _module_info(path):
+    """Return the paraminfo of an API module, as needed by pywikibot."""
+    name = path.rpartition('+')[2]
+    info = {'name': name, 'classname': 'Api{}'.format(name.capitalize()),
+            'path': path, 'group': 'action', 'prefix': '',
+            'source': 'MediaWiki', 'parameters': []}
+    if '+' in path:
+        for group, modules in _QUERY_MODULES.items():
+            if name in modules:
+                info.update(group=group, prefix=modules[name])
+    elif name in WRITE_ACTIONS:
+        info.update(mustbeposted='', writerights='')
+
+    def multi(name, values, **extra):
+        extra.update(name=name, type=values, multi='', limit=50,
+                     highlimit=500, lowlimit=50)
+        return extra
+
+    if path == 'main':
+        actions = sorted(
+            attr[len('_action_'):] for attr in dir(FakeWikibase)
+            if attr.startswith('_action_') and attr != '_action_main')
+        info['parameters'] = [
+            {'name': 'action', 'type': actions,
+             'submodules': {action: action for action in actions}},
+            {'name': 'format', 'type': ['json'],
+             'submodules': {'json': 'json'}},
+            {'name': 'maxlag', 'type': 'integer'},
+            {'name': 'assert', 'type': ['anon', 'bot', 'user']},
+        ]
+    elif path == 'paraminfo':
+        info['parameters'] = [
+            multi('modules', 'string'),
+            multi('querymodules', sorted(
+                module for modules in _QUERY_MODULES.values()
+                for module in modules)),
+        ]
+    elif path == 'query':
+        info['parameters'] = [
+            multi(group, sorted(modules), submodules={
+                module: 'query+{}'.format(module) for module in modules})
+            for group, modules in _QUERY_MODULES.items()]
+        info['parameters'] += [
+            {'name': 'generator', 'type': sorted(_QUERY_MODULES['prop'])},
+            multi('titles', 'string'), multi('pageids', 'integer'),
+            {'name': 'redirects', 'type': 'boolean'}]
+    elif path in ('tokens', 'query+tokens'):
+        info['parameters'] = [multi('type', _TOKEN_TYPES)]
+    elif path == 'query+info':
+        info['parameters'] = [
+            multi('prop', ['protection', 'url']),
+            multi('token', ['edit', 'delete', 'protect', 'move', 'block',
+                            'unblock', 'email', 'import', 'watch'])]
+    return info
+
+
+def _namespace_id(wiki, title):
+    namespace, colon, _ = title.partition(':')
+    for ns_id, name, _, _ in _NAMESPACES[wiki]:
+        if colon and name and name == namespace:
+            return ns_id
+    return 0
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Route GET and POST requests to the FakeWikibase of the server."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):  # noqa: N802
+        self._handle(urlsplit(self.path).query)
+
+    def do_POST(self):  # noqa: N802
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        self.server.fake.count('bytes_received', length)
+        query = urlsplit(self.path).query
+        self._handle('&'.join(part for part in (query, body) if part))
+
+    def _handle(self, query):
+        wiki = urlsplit(self.path).path.strip('/').split('/')[0]
+        if wiki not in WIKIS:
+            self.send_error(404)
+            return
+        params = {key: values[-1] for key, values in parse_qs(
+            query, keep_blank_values=True).items()}
+        try:
+            response, headers = self.server.fake.handle(wiki, params)
+        except LostResponse:
+            self.close_connection = True
+            return
+        body = json.dumps(response).encode('utf-8')
+        self.server.fake.count('bytes_sent', len(body))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeWikibaseServer(ThreadingHTTPServer):
+    """HTTP server serving a FakeWikibase."""
+
+    daemon_threads = True
+
+    def __init__(self, fake=None, host='127.0.0.1', port=0):
+        """
+        Initializer.
+
+        @param fake: the FakeWikibase to serve, a new one if not provided
+        @param host: the host to bind to
+        @param port: the port to bind to, 0 to pick any free port
+        """
+        ThreadingHTTPServer.__init__(self, (host, port), _RequestHandler)
+        self.fake = fake or FakeWikibase()
+        self.fake.base_url = 'http://{0}:{1}'.format(*self.server_address)
+
+    @property
+    def host(self):
+        """Return the host:port of the server."""
+        return '{0}:{1}'.format(*self.server_address)
+
+    def start(self):
+        """Start serving in a background thread."""
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+
+def add_arguments(parser):
+    """Add the command line options configuring a FakeWikibase."""
+    group = parser.add_argument_group('fake wikibase')
+    group.add_argument(
+        '--read-latency', type=float, default=0.0, metavar='SECONDS',
+        help='delay of every read request')
+    group.add_argument(
+        '--write-latency', type=float, default=0.0, metavar='SECONDS',
+        help='delay of every write request')
+    group.add_argument(
+        '--maxlag-rate', type=float, default=0.0, metavar='SHARE',
+        help='share of requests failing with maxlag')
+    group.add_argument(
+        '--ratelimit-rate', type=float, default=0.0, metavar='SHARE',
+        help='share of writes failing with ratelimited')
+    group.add_argument(
+        '--badtoken-rate', type=float, default=0.0, metavar='SHARE',
+        help='share of writes for which the csrf token expires')
+    group.add_argument(
+        '--editconflict-rate', type=float, default=0.0, metavar='SHARE',
+        help='share of wbeditentity calls failing with editconflict')
+    group.add_argument(
+        '--lost-response-rate', type=float, default=0.0, metavar='SHARE',
+        help=('share of wbeditentity calls which are saved but never get a '
+              'response'))
+    group.add_argument(
+        '--retry-after', type=int, default=1, metavar='SECONDS',
+        help='Retry-After header sent with maxlag errors')
+    group.add_argument(
+        '--no-bot-rights', action='store_true',
+        help='run as a user without the bot and apihighlimits rights')
+    group.add_argument(
+        '--seed', type=int, default=0,
+        help='seed of the random error injection')
+
+
+def from_args(args):
+    """Create a FakeWikibase from the options added by add_arguments."""
+    rights = DEFAULT_RIGHTS
+    if args.no_bot_rights:
+        rights = [right for right in rights
+                  if right not in ('bot', 'apihighlimits')]
+    return FakeWikibase(
+        read_latency=args.read_latency,
+        write_latency=args.write_latency,
+        maxlag_rate=args.maxlag_rate,
+        ratelimit_rate=args.ratelimit_rate,
+        badtoken_rate=args.badtoken_rate,
+        editconflict_rate=args.editconflict_rate,
+        lost_response_rate=args.lost_response_rate,
+        retry_after=args.retry_after,
+        rights=rights,
+        seed=args.seed)
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Minimal harness for timing benchmarks and comparing them to a baseline.
+
+A benchmark is a (name, callable) pair. Each callable is timed with timeit,
+taking the best of several repeats, and the resulting time per call can be
+stored as a baseline. Later runs are compared to the baseline and any
+benchmark which got slower by more than the threshold is flagged as a
+regression, making the run exit with a non-zero status.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import sys
+import time
+import timeit
+
+DEFAULT_THRESHOLD = 0.2  # i.e. 20% slower
+DEFAULT_REPEAT = 5
+# minimum time for a single repeat, in seconds
+MIN_REPEAT_TIME = 0.2
+
+
+def time_call(func, repeat=DEFAULT_REPEAT, min_time=MIN_REPEAT_TIME):
+    """
+    Return the best time per call of func, in seconds.
+
+    The number of calls per repeat is chosen so that each repeat takes at
+    least min_time.
+
+    @param func: callable taking no arguments
+    @param repeat: number of repeats to take the best of
+    @param min_time: minimum duration of a repeat, in seconds
+    @return: float
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        duration = timer.timeit(number)
+        if duration >= min_time:
+            break
+        number *= 10 if duration < min_time / 10 else 2
+    times = [duration] + timer.repeat(repeat=repeat - 1, number=number)
+    return min(times) / number
+
+
+def load_baseline(path):
+    """
+    Load the times per benchmark from a baseline file.
+
+    @param path: path to the baseline json
+    @return: dict of benchmark name to seconds per call, empty if the file
+        does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with io.open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('benchmarks', {})
+
+
+def save_baseline(path, results):
+    """
+    Store the times per benchmark as a baseline file.
+
+    @param path: path to the baseline json
+    @param results: dict of benchmark name to seconds per call
+    """
+    data = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'timestamp': int(time.time()),
+        'benchmarks': results,
+    }
+    with io.open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(data, indent=2, sort_keys=True) + '\n')
+
+
+def find_regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Return the benchmarks which got slower than the baseline allows.
+
+    @param results: dict of benchmark name to seconds per call
+    @param baseline: dict of benchmark name to baseline seconds per call
+    @param threshold: relative slowdown allowed, e.g. 0.2 for 20%
+    @return: list of (name, relative change) tuples
+    """
+    regressions = []
+    for name, seconds in results.items():
+        if baseline.get(name):
+            change = seconds / baseline[name] - 1
+            if change > threshold:
+                regressions.append((name, change))
+    return regressions
+
+
+def format_time(seconds):
+    """Return a time per call with a suitable unit."""
+    for unit, scale in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * scale >= 1:
+            return '{0:.3g} {1}'.format(seconds * scale, unit)
+    return '{0:.3g} ns'.format(seconds * 1e9)
+
+
+def make_parser(description, default_baseline):
+    """Return an argument parser with the options shared by all benchmarks."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        '--baseline', default=default_baseline,
+        help='json file of baseline times (default: %(default)s)')
+    parser.add_argument(
+        '--save', action='store_true',
+        help='store the results as the new baseline')
+    parser.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='relative slowdown flagged as a regression '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--repeat', type=int, default=DEFAULT_REPEAT,
+        help='number of repeats to take the best of (default: %(default)s)')
+    parser.add_argument(
+        '--filter', default='',
+        help='only run the benchmarks whose name matches this regex')
+    return parser
+
+
+def handle_args(argv, description, default_baseline):
+    """Parse the command line arguments of a benchmark script."""
+    return make_parser(description, default_baseline).parse_args(argv)
+
+
+def format_change(seconds, baseline_seconds, threshold):
+    """Return the change compared to the baseline, flagging regressions."""
+    if not baseline_seconds:
+        return ''
+    change = seconds / baseline_seconds - 1
+    text = '  {0:>+7.1%}'.format(change)
+    if change > threshold:
+        text += '  REGRESSION'
+    return text
+
+
+def finish(results, baseline, args):
+    """
+    Store the results, if requested, and report any regressions.
+
+    @param results: dict of benchmark name to seconds per call
+    @param baseline: dict of benchmark name to baseline seconds per call
+    @param args: the parsed command line arguments
+    @return: exit status, 1 if any regression was found
+    """
+    regressions = find_regressions(results, baseline, args.threshold)
+    if args.save:
+        baseline.update(results)
+        save_baseline(args.baseline, baseline)
+        print('Baseline stored in {}'.format(args.baseline))
+    if regressions:
+        print('{0} benchmark(s) regressed by more than {1:.0%}'.format(
+            len(regressions), args.threshold), file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(benchmarks, description, default_baseline, argv=None):
+    """
+    Run the benchmarks, print the results and compare them to the baseline.
+
+    @param benchmarks: list of (name, callable) pairs
+    @param description: description of the benchmark script
+    @param default_baseline: path to the default baseline file
+    @param argv: command line arguments, defaults to sys.argv
+    @return: exit status, 1 if any regression was found
+    """
+    args = handle_args(argv, description, default_baseline)
+    baseline = load_baseline(args.baseline)
+    name_width = max(len(name) for name, _ in benchmarks)
+    pattern = re.compile(args.filter)
+
+    results = {}
+    for name, func in benchmarks:
+        if not pattern.search(name):
+            continue
+        results[name] = time_call(func, repeat=args.repeat)
+        print('{0:<{1}}  {2:>10}{3}'.format(
+            name, name_width, format_time(results[name]),
+            format_change(results[name], baseline.get(name), args.threshold)))
+    return finish(results, baseline, args)
@@ -4,23 +4,43 @@
 from __future__ import unicode_literals
 
 import argparse
+import io
 import json
-from builtins import open
+import sys
+import time
+from collections import deque
 from pathlib import Path
 
 import pywikibot
 
+import pywikibotsdc.common as common
+import pywikibotsdc.data_loader as data_loader
+import pywikibotsdc.journal as journal
+import pywikibotsdc.metrics as metrics
+import pywikibotsdc.retry as retry
 import pywikibotsdc.sdc_upload as sdc_upload
+import pywikibotsdc.throughput as throughput
+import pywikibotsdc.validator as validator
+import pywikibotsdc.wikibase_json as wikibase_json
+import pywikibotsdc.worker_pool as worker_pool
+from pywikibotsdc.claim_cache import get_claim_cache
+from pywikibotsdc.datatype_cache import get_datatype_cache
 from pywikibotsdc.sdc_exception import SdcException
+from pywikibotsdc.sdc_result import SdcResult
+from pywikibotsdc.upload_session import UploadSession
+from pywikibotsdc.value_cache import get_value_cache
+
+# seconds between outputs of the state of the throughput controller
+STATUS_INTERVAL = 30
 
 
 def _load_file(filename):
     """
-    Open and read a JSON file containing Structured Data.
+    Open and read a, possibly compressed, JSON file containing Structured Data.
 
     @param filename: the file to open
     """
-    with open(filename, 'r') as f:
+    with data_loader.open_data_file(filename) as f:
         return json.load(f)
 
 
@@ -36,6 +56,38 @@ def _load_site(use_beta):
         return pywikibot.Site('commons', 'commons')
 
 
+def _positive_float(value):
+    """
+    Argparse type for positive numbers.
+
+    @param value: the command line value
+    @return: float
+    @raises: argparse.ArgumentTypeError
+    """
+    try:
+        number = float(value)
+    except ValueError:
+        number = 0
+    if not number > 0:
+        raise argparse.ArgumentTypeError(
+            'must be a positive number, got "{}"'.format(value))
+    return number
+
+
+def _positive_int(value):
+    """
+    Argparse type for positive integers.
+
+    @param value: the command line value
+    @return: int
+    @raises: argparse.ArgumentTypeError
+    """
+    if not common.is_pos_int(value):
+        raise argparse.ArgumentTypeError(
+            'must be a positive integer, got "{}"'.format(value))
+    return int(value)
+
+
 def handle_args(argv=None):
     """
     Parse and handle command line arguments.
@@ -58,7 +110,14 @@ def handle_args(argv=None):
     )
     parser.add_argument(
         'data', action='store', metavar='PATH', type=Path,
-        help='path to file containing Structured Data in json format')
+        help=('path to file containing Structured Data in json or json lines '
+              'format, optionally gzip, bz2 or xz compressed'))
+    parser.add_argument(
+        '--format', action='store', choices=data_loader.FORMATS,
+        help=('format of the data file, "json" for a single object of '
+              '{filename: data} pairs, "jsonl" for one {"filename": ..., '
+              '"data": ...} object per line. Defaults to "jsonl" for files '
+              'ending in .jsonl or .ndjson, otherwise "json"'))
     parser.add_argument(
         '--strategy', action='store', choices=sdc_upload.STRATEGIES,
         help='merge strategy to use')
@@ -67,7 +126,9 @@ def handle_args(argv=None):
         help='edit summary to use instead of default')
     parser.add_argument(
         '-n', '--null_edit', action='store_true',
-        help='perform a null_edit to the file page after uploading the data')
+        help=('perform a null_edit to the file page after uploading the data. '
+              'When uploading many files the pages are instead purged in '
+              'batches, updating their links tables'))
     parser.add_argument(
         '-f', '--filename', action='store',
         help=('Commons filename to which Structured Data corresponds '
@@ -76,6 +137,80 @@ def handle_args(argv=None):
     parser.add_argument(
         '-b', '--beta', action='store_true',
         help='upload to Beta Commons rather than Wikimedia Commons')
+    parser.add_argument(
+        '--journal', action='store', metavar='JOURNAL', type=Path,
+        help=('record the outcome for each file in this append-only journal, '
+              'allowing an interrupted run to be resumed'))
+    parser.add_argument(
+        '--resume', action='store', metavar='JOURNAL', type=Path,
+        help=('skip any files already completed according to the journal and '
+              'keep recording to it (unless --journal is also given). Files '
+              'which failed with an error are retried'))
+    parser.add_argument(
+        '--workers', action='store', type=_positive_int, default=1,
+        metavar='N',
+        help=('number of files to process concurrently. Pywikibot\'s edit '
+              'throttle and maxlag handling still apply to all workers '
+              'combined. Defaults to 1'))
+    parser.add_argument(
+        '--order', action='store', choices=worker_pool.ORDERS,
+        default='input',
+        help=('order in which per-file results are output when using several '
+              'workers. Defaults to "input"'))
+    parser.add_argument(
+        '--lookahead', action='store', type=_positive_int, default=0,
+        metavar='N',
+        help=('resolve, fetch the existing data of, and prepare the edits of '
+              'up to N upcoming files in the background while the current '
+              'file is submitted. Edits are still made one at a time (per '
+              'worker). By default there is no look-ahead'))
+    parser.add_argument(
+        '--adaptive', action='store_true',
+        help=('pace the edits, and limit the number of concurrent edits, '
+              'adapting to maxlag, ratelimited and Retry-After responses to '
+              'stay close to the highest rate the wiki allows. Replaces '
+              'Pywikibot\'s fixed edit throttle'))
+    parser.add_argument(
+        '--max-rate', action='store', type=_positive_float,
+        default=throughput.DEFAULT_MAX_RATE, metavar='EDITS',
+        help=('highest number of edits per second allowed by --adaptive. '
+              'Defaults to %(default)s'))
+    parser.add_argument(
+        '--max-retries', action='store', type=_positive_int,
+        default=retry.MAX_RETRIES, metavar='N',
+        help=('times an edit failing with a temporary error is retried, with '
+              'an exponentially growing delay, before it is put back in the '
+              'queue to be retried once more at the end of the run. Defaults '
+              'to %(default)s'))
+    parser.add_argument(
+        '--processes', action='store', type=_positive_int, default=1,
+        metavar='N',
+        help=('compile the Structured Data in N worker processes, using all '
+              'of the CPU cores for very statement-dense data. Used by '
+              '--compile and when uploading, but not by --submit. Defaults to '
+              '1, compiling in the main process'))
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        '--compile', action='store', metavar='OUT', type=Path,
+        help=('compile the Structured Data of all files into ready to submit '
+              'json lines written to OUT, instead of uploading it. Needs no '
+              'edit rights and, once all property datatypes are cached, no '
+              'network access'))
+    mode.add_argument(
+        '--validate', action='store_true',
+        help=('only check that the Structured Data of all files follows the '
+              'documented format, reporting every error, without making any '
+              'edits. The values of properties whose datatype is cached are '
+              'checked too. Exits with status 1 if any error is found'))
+    mode.add_argument(
+        '--submit', action='store_true',
+        help=('upload the Structured Data of a file created with --compile, '
+              'only resolving the files, merging with existing data and '
+              'submitting the edits'))
+    parser.add_argument(
+        '--metrics', action='store', metavar='FILE', type=Path,
+        help=('export the timings, request counts and bytes sent and '
+              'received per phase of the upload as json to this file'))
 
     # first pass args to argparse, then to pywikibot
     # while more work than parser.parse_args(pywikibot.handle_args(argv))
@@ -90,44 +225,224 @@ def handle_args(argv=None):
     return args
 
 
+def _compile(args, site):
+    """
+    Compile the Structured Data of all files into a json lines file.
+
+    @param args: the parsed command line arguments
+    @param site: the pywikibot.Site to which the data will be uploaded
+    @return: dict with the number of compiled files and statements
+    """
+    if args.filename:
+        file_data = [(args.filename, _load_file(args.data))]
+    else:
+        file_data = data_loader.iter_sdc_data(args.data, args.format)
+
+    total = {'files': 0, 'num': 0}
+    compiled_data = wikibase_json.compile_batch_sdc_data(
+        file_data, target_site=site, summary=args.summary,
+        processes=args.processes)
+    with io.open(str(args.compile), 'w', encoding='utf-8') as f:
+        for filename, compiled, error in compiled_data:
+            if error:
+                pywikibot.output('{0} - {1}'.format(filename, error.log))
+                continue
+            payload = sdc_upload.format_compiled_payload(compiled)
+            num = (len(payload.get('labels', []))
+                   + len(payload.get('claims', [])))
+            f.write(json.dumps(
+                {'filename': filename, 'data': compiled, 'statements': num},
+                ensure_ascii=False, separators=(',', ':')) + '\n')
+            total['files'] += 1
+            total['num'] += num
+    pywikibot.output(
+        'Compiled {num} statements for {files} files'.format(**total))
+    return total
+
+
+def _validate(args, site):
+    """
+    Validate the Structured Data of all files, outputting every error.
+
+    @param args: the parsed command line arguments
+    @param site: the pywikibot.Site to which the data will be uploaded
+    @return: dict with the number of validated and invalid files
+    """
+    if args.filename:
+        file_data = [(args.filename, _load_file(args.data))]
+    else:
+        file_data = data_loader.iter_sdc_data(args.data, args.format)
+
+    total = {'files': 0, 'invalid': 0, 'errors': 0}
+
+    def counted(file_data):
+        for entry in file_data:
+            total['files'] += 1
+            yield entry
+
+    datatypes = get_datatype_cache().known(site.data_repository())
+    for filename, errors in validator.validate_batch_sdc_data(
+            counted(file_data), datatypes):
+        total['invalid'] += 1
+        total['errors'] += len(errors)
+        for path, message in errors:
+            pywikibot.output('{0} - {1}: {2}'.format(
+                filename, path or '(root)', message))
+    pywikibot.output(
+        'Found {errors} errors in {invalid} of {files} files'.format(**total))
+    return total
+
+
+def _compile_in_processes(file_data, site, args, failures):
+    """
+    Compile the Structured Data to be uploaded in a pool of processes.
+
+    @param file_data: iterable of (file_name, sdc_data) tuples
+    @param site: the pywikibot.Site to which the data will be uploaded
+    @param args: the parsed command line arguments
+    @param failures: deque to which an SdcResult is appended for each file
+        which could not be compiled
+    @return: generator of (file_name, compiled sdc data) tuples, in the same
+        order as the input
+    """
+    compiled_data = wikibase_json.compile_batch_sdc_data(
+        file_data, target_site=site, summary=args.summary,
+        processes=args.processes)
+    for filename, compiled, error in compiled_data:
+        if error:
+            failures.append(SdcResult(filename, error=error))
+            continue
+        yield filename, compiled
+
+
+def _with_failures(results, failures):
+    """Yield the results, interleaved with any failures as they occur."""
+    for result in results:
+        while failures:
+            yield failures.popleft()
+        yield result
+    while failures:
+        yield failures.popleft()
+
+
 def main():
     """Run main process."""
     args = handle_args()
-    sdc_data = _load_file(args.data)
+    run_metrics = metrics.enable_metrics()
+    controller = None
+    if args.adaptive:
+        # the controller paces the edits instead
+        pywikibot.config.put_throttle = 0
+        controller = throughput.ThroughputController(
+            max_concurrency=args.workers, max_rate=args.max_rate)
+        controller.start()
     site = _load_site(args.beta)
+    retry_policy = retry.RetryPolicy(max_retries=args.max_retries)
 
     # run
-    if args.filename:
+    invalid = False
+    if args.validate:
+        total = _validate(args, site)
+        run_metrics.count('files', total['files'])
+        invalid = bool(total['invalid'])
+    elif args.compile:
+        total = _compile(args, site)
+        run_metrics.count('files', total['files'])
+        run_metrics.count('statements', total['num'])
+    elif args.filename and not args.submit:
+        sdc_data = _load_file(args.data)
+        with metrics.phase('datatypes'):
+            get_datatype_cache().warm(
+                site.data_repository(), sdc_upload.get_property_ids(sdc_data))
         try:
             num = sdc_upload.upload_single_sdc_data(
                 args.filename, sdc_data, target_site=site,
                 strategy=args.strategy, summary=args.summary,
-                null_edit=args.null_edit)
+                null_edit=args.null_edit,
+                session=UploadSession(site, retry_policy=retry_policy))
         except SdcException as se:
+            run_metrics.count('errors')
             pywikibot.output('{0} - {1}'.format(args.filename, se.log))
         else:
+            run_metrics.count('files')
+            run_metrics.count('statements', num)
             pywikibot.output(
                 '{0} - Successfully uploaded with {1} statements'.format(
                     args.filename, num))
     else:
         total = {'files': 0, 'num': 0}
-        for filename, data in sdc_data.items():
-            try:
-                num = sdc_upload.upload_single_sdc_data(
-                    filename, data, target_site=site, strategy=args.strategy,
-                    summary=args.summary, null_edit=args.null_edit)
-            except SdcException as se:
-                pywikibot.output('{0} - {1}'.format(filename, se.log))
+        data_format = args.format or ('jsonl' if args.submit else None)
+        file_data = data_loader.iter_sdc_data(args.data, data_format)
+        if args.resume:
+            completed = journal.load_completed(args.resume)
+            file_data = ((filename, data) for filename, data in file_data
+                         if filename not in completed)
+        journal_path = args.journal or args.resume
+        run_journal = journal.Journal(journal_path) if journal_path else None
+
+        compiled = args.submit
+        failures = deque()
+        if args.processes > 1 and not compiled:
+            file_data = _compile_in_processes(
+                file_data, site, args, failures)
+            compiled = True
+
+        results = sdc_upload.upload_batch_sdc_data(
+            file_data, target_site=site, strategy=args.strategy,
+            summary=args.summary, null_edit=args.null_edit,
+            workers=args.workers, order=args.order, compiled=compiled,
+            controller=controller, retry_policy=retry_policy,
+            lookahead=args.lookahead)
+        results = _with_failures(results, failures)
+        last_status = time.time()
+        for result in results:
+            if run_journal:
+                run_journal.record(result)
+            if result.error:
+                run_metrics.count('errors')
+                pywikibot.output(
+                    '{0} - {1}'.format(result.title, result.error.log))
             else:
+                run_metrics.count('files')
+                run_metrics.count('statements', result.num_statements)
                 total['files'] += 1
-                total['num'] += num
+                total['num'] += result.num_statements
                 pywikibot.output(
                     '{0} - Successfully uploaded with {1} statements'.format(
-                        filename, num))
+                        result.title, result.num_statements))
+            if controller and time.time() - last_status >= STATUS_INTERVAL:
+                last_status = time.time()
+                pywikibot.output('Throughput: {}'.format(controller.status()))
+        if run_journal:
+            run_journal.close()
         pywikibot.output(
             'Successfully uploaded {num} statements to {files} files'.format(
                 **total))
 
+    if controller:
+        controller.stop()
+        pywikibot.output('Throughput: {}'.format(controller.status()))
+    claim_stats = get_claim_cache().stats()
+    if claim_stats['hits'] or claim_stats['misses']:
+        run_metrics.count('claim_cache_hits', claim_stats['hits'])
+        run_metrics.count('claim_cache_misses', claim_stats['misses'])
+        pywikibot.output(
+            'Claim cache: {hits} hits, {misses} misses, {hit_rate:.0%} hit '
+            'rate'.format(**claim_stats))
+    value_stats = get_value_cache().stats()
+    if value_stats['hits'] or value_stats['misses']:
+        run_metrics.count('value_cache_hits', value_stats['hits'])
+        run_metrics.count('value_cache_misses', value_stats['misses'])
+        pywikibot.output(
+            'Value cache: {hits} hits, {misses} misses, {hit_rate:.0%} hit '
+            'rate, {evictions} evictions'.format(**value_stats))
+    for line in run_metrics.summary():
+        pywikibot.output(line)
+    if args.metrics:
+        run_metrics.save(args.metrics)
+    if invalid:
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()
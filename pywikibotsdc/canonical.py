@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Canonical, comparable, forms of Wikibase statements.
+
+Statements are compared by their main value, rank and qualifiers, ignoring
+references, statement ids, the order of the qualifiers and any difference in
+how the same value is serialised, e.g. "+5" and "+5.0" for an amount or the
+number of digits used for the year of a date. This allows the statements
+fetched from the wiki to be compared to those about to be uploaded.
+"""
+from __future__ import unicode_literals
+
+import re
+from builtins import dict
+from decimal import Decimal, InvalidOperation
+
+# Wikibase precisions of a time value
+YEAR_PRECISION = 9
+MONTH_PRECISION = 10
+
+_TIME = re.compile(r'^([+-]?)(\d+)-(\d\d)-(\d\d)T')
+
+
+def statement_key(statement):
+    """
+    Return the canonical form of a statement.
+
+    @param statement: the json of a statement, as returned by wbgetentities
+        or as compiled for wbeditentity
+    @return: hashable tuple
+    """
+    qualifiers = frozenset(
+        snak_key(snak)
+        for snaks in (statement.get('qualifiers') or dict()).values()
+        for snak in snaks)
+    return (snak_key(statement['mainsnak']),
+            statement.get('rank', 'normal'),
+            qualifiers)
+
+
+def snak_key(snak):
+    """
+    Return the canonical form of a snak.
+
+    @param snak: the json of a snak
+    @return: hashable tuple
+    """
+    snaktype = snak.get('snaktype', 'value')
+    value = None
+    if snaktype == 'value':
+        value = value_key(snak.get('datavalue') or dict())
+    return (snak.get('property'), snaktype, value)
+
+
+def value_key(datavalue):
+    """
+    Return the canonical form of the datavalue of a snak.
+
+    @param datavalue: the json of a datavalue, a dict with a type and a value
+    @return: hashable value
+    """
+    value_type = datavalue.get('type')
+    value = datavalue.get('value')
+    if value_type == 'wikibase-entityid':
+        if value.get('id'):
+            return value_type, value['id'].upper()
+        prefix = {'item': 'Q', 'property': 'P'}.get(
+            value.get('entity-type', 'item'), '?')
+        return value_type, '{0}{1}'.format(prefix, value.get('numeric-id'))
+    elif value_type == 'monolingualtext':
+        return value_type, value.get('language'), value.get('text')
+    elif value_type == 'quantity':
+        return (value_type, _decimal(value.get('amount')),
+                value.get('unit') or '1',
+                _decimal(value.get('upperBound')),
+                _decimal(value.get('lowerBound')))
+    elif value_type == 'time':
+        return (value_type, _time(value.get('time'), value.get('precision')),
+                value.get('precision'), value.get('calendarmodel'),
+                value.get('timezone') or 0, value.get('before') or 0,
+                value.get('after') or 0)
+    elif value_type == 'globecoordinate':
+        return (value_type, _float(value.get('latitude')),
+                _float(value.get('longitude')), _float(value.get('precision')),
+                value.get('globe'))
+    elif isinstance(value, dict):
+        return value_type, tuple(sorted(value.items()))
+    return value_type, value
+
+
+def _decimal(amount):
+    """Return an amount as a Decimal, or unchanged if it is not a number."""
+    if amount is None:
+        return None
+    try:
+        return Decimal(str(amount))
+    except InvalidOperation:
+        return amount
+
+
+def _float(number):
+    """Return a number as a float, or unchanged if it is not a number."""
+    try:
+        return float(number)
+    except (TypeError, ValueError):
+        return number
+
+
+def _time(time, precision):
+    """
+    Return the date parts of a time value which are within its precision.
+
+    @param time: the time string, e.g. "+2014-07-11T00:00:00Z"
+    @param precision: the Wikibase precision of the time value
+    @return: tuple of ints, or the time string if it could not be parsed
+    """
+    match = _TIME.match(time or '')
+    if not match:
+        return time
+    sign, year, month, day = match.groups()
+    parts = (int(sign + year), int(month), int(day))
+    if precision is None:
+        return parts
+    if precision <= YEAR_PRECISION:
+        return parts[:1]
+    if precision == MONTH_PRECISION:
+        return parts[:2]
+    return parts
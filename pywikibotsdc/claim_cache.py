@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Bounded in-memory cache of the json of claims, shared by all files.
+
+Files in a batch often share many identical claims, e.g. the same creator,
+license or copyright status. Building a claim through pywikibot is costly,
+so the json of each claim is memoised per data repository, property and
+canonical form of the internally formatted value. The least recently used
+claims are evicted once the cache is full.
+
+The json is stored serialised, and parsed on every lookup, so that callers
+are free to modify what they get back.
+"""
+from __future__ import unicode_literals
+
+import json
+import threading
+from collections import OrderedDict
+
+import pywikibotsdc.common as common
+
+DEFAULT_MAXSIZE = 10000
+
+_CLAIM_CACHE = None
+
+
+def get_claim_cache():
+    """Return the shared ClaimCache."""
+    global _CLAIM_CACHE
+    if not _CLAIM_CACHE:
+        _CLAIM_CACHE = ClaimCache()
+    return _CLAIM_CACHE
+
+
+def claim_key(repo, prop, value):
+    """
+    Return the cache key of a claim.
+
+    @param repo: pywikibot.site.DataSite of the claim
+    @param prop: str Property of the claim
+    @param value: str|dict The internally formatted claim value
+    @return: hashable tuple
+    """
+    if not common.is_str(value):
+        value = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return '{0}:{1}'.format(repo.family.name, repo.code), prop, value
+
+
+class ClaimCache(object):
+    """Thread safe LRU cache of serialised claim json."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        """
+        Initializer.
+
+        @param maxsize: maximum number of claims held
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of claims held."""
+        return len(self._data)
+
+    def get(self, key):
+        """
+        Return the json of a claim, counting the hit or miss.
+
+        @param key: the key of the claim, see claim_key()
+        @return: dict, or None if the claim is not cached
+        """
+        with self._lock:
+            serialised = self._data.pop(key, None)
+            if serialised is None:
+                self.misses += 1
+                return None
+            # reinsert as the most recently used
+            self._data[key] = serialised
+            self.hits += 1
+        return json.loads(serialised)
+
+    def put(self, key, claim):
+        """
+        Add the json of a claim, evicting the least recently used if full.
+
+        @param key: the key of the claim, see claim_key()
+        @param claim: the json of the claim
+        """
+        serialised = json.dumps(claim, separators=(',', ':'))
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = serialised
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all claims and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the size and hit/miss counters as a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else None,
+            }
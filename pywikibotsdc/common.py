@@ -40,3 +40,21 @@ def is_pos_int(value):
     if is_int(value) and int(value) > 0:
         return True
     return False
+
+
+def chunked(iterable, size):
+    """Yield successive lists of at most size entries from an iterable.
+
+    @param iterable: The iterable to split up
+    @param size: The maximum number of entries per chunk
+    @type size: int
+    @return generator of lists
+    """
+    chunk = []
+    for entry in iterable:
+        chunk.append(entry)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
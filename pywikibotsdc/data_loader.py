@@ -0,0 +1,219 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Streaming readers for files containing Structured Data for many files.
+
+Two input formats are supported, both of which can also be gzip, bz2 or xz
+compressed:
+*   json: a single object of {filename: data} pairs.
+*   jsonl: one {"filename": filename, "data": data} object per line.
+
+Entries are yielded one at a time so that memory use stays flat independently
+of the size of the input.
+"""
+from __future__ import unicode_literals
+
+import bz2
+import gzip
+import io
+import json
+
+try:
+    import lzma
+except ImportError:  # Python 2
+    lzma = None
+
+FORMATS = ('json', 'jsonl')
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson')
+# magic numbers used to detect compressed files
+_MAGIC = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+)
+_CHUNK_SIZE = 64 * 1024
+
+
+def open_data_file(path):
+    """
+    Open a, possibly compressed, text file for reading.
+
+    The compression, if any, is detected from the start of the file.
+
+    @param path: path to the file to open
+    @return: file-like object yielding decoded text
+    @raises: ValueError if the file is xz compressed but lzma is unavailable
+    """
+    with io.open(str(path), 'rb') as f:
+        head = f.read(6)
+
+    compression = None
+    for magic, name in _MAGIC:
+        if head.startswith(magic):
+            compression = name
+            break
+
+    if compression == 'gzip':
+        raw = gzip.GzipFile(str(path), 'rb')
+    elif compression == 'bz2':
+        raw = bz2.BZ2File(str(path), 'rb')
+    elif compression == 'xz':
+        if not lzma:
+            raise ValueError(
+                'Reading xz compressed files requires the lzma module.')
+        raw = lzma.LZMAFile(str(path), 'rb')
+    else:
+        raw = io.open(str(path), 'rb')
+    return io.TextIOWrapper(raw, encoding='utf-8')
+
+
+def detect_format(path):
+    """
+    Guess the input format from the file name.
+
+    Any compression suffix (e.g. ".gz") is ignored.
+
+    @param path: path to the file
+    @return: "jsonl" or "json"
+    """
+    name = str(path).lower()
+    for suffix in ('.gz', '.bz2', '.xz'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if name.endswith(JSONL_EXTENSIONS):
+        return 'jsonl'
+    return 'json'
+
+
+def iter_sdc_data(path, data_format=None):
+    """
+    Yield (filename, data) pairs from a file of Structured Data.
+
+    @param path: path to the file
+    @param data_format: one of FORMATS. Detected from the file name if not
+        provided.
+    @return: generator of (filename, data) tuples
+    @raises: ValueError
+    """
+    data_format = data_format or detect_format(path)
+    if data_format not in FORMATS:
+        raise ValueError(
+            'The data format must be one of "{0}" but "{1}" was '
+            'provided'.format('", "'.join(FORMATS), data_format))
+
+    with open_data_file(path) as f:
+        if data_format == 'jsonl':
+            for entry in iter_json_lines(f):
+                yield entry
+        else:
+            for entry in iter_json_object(f):
+                yield entry
+
+
+def iter_json_lines(f):
+    """
+    Yield (filename, data) pairs from a JSON Lines file.
+
+    Empty lines are ignored.
+
+    @param f: file-like object yielding text
+    @return: generator of (filename, data) tuples
+    @raises: ValueError
+    """
+    for num, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+            yield record['filename'], record['data']
+        except (ValueError, KeyError, TypeError) as error:
+            raise ValueError(
+                'Invalid record on line {0}: {1}'.format(num, error))
+
+
+def iter_json_object(f, chunk_size=_CHUNK_SIZE):
+    """
+    Incrementally parse a top-level JSON object, yielding its members.
+
+    Only one member is held in memory at the time.
+
+    @param f: file-like object yielding text
+    @param chunk_size: number of characters to read at the time
+    @return: generator of (key, value) tuples
+    @raises: ValueError
+    """
+    reader = _JsonObjectReader(f, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+        return
+    while True:
+        key = reader.decode()
+        reader.expect(':')
+        value = reader.decode()
+        yield key, value
+        delimiter = reader.expect(',}')
+        if delimiter == '}':
+            break
+
+
+class _JsonObjectReader(object):
+    """Buffered reader decoding one JSON value at the time."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read_more(self):
+        """Read another chunk into the buffer, dropping consumed text."""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character, without consuming it."""
+        while True:
+            while (self.pos < len(self.buffer)
+                    and self.buffer[self.pos].isspace()):
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more():
+                raise ValueError('Unexpected end of JSON input.')
+
+    def expect(self, characters):
+        """Consume and return the next character, if one of characters."""
+        char = self.peek()
+        if char not in characters:
+            raise ValueError(
+                'Expected one of "{0}" but found "{1}".'.format(
+                    characters, char))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """Decode the next JSON value, reading more text as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self._read_more():
+                    raise
+                continue
+            # a number might continue in the next chunk
+            if end == len(self.buffer) and self._read_more():
+                continue
+            self.pos = end
+            return value
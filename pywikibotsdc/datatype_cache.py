@@ -0,0 +1,167 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Persistent cache of the datatypes of Wikibase properties.
+
+Knowing the datatype of a property is needed to build any claim using it.
+Without the cache each new property costs a separate API call per process.
+"""
+from __future__ import unicode_literals
+
+import json
+import os
+import threading
+import time
+from builtins import dict, open
+
+from pywikibot import config
+
+import pywikibotsdc.common as common
+
+CACHE_FILENAME = 'pywikibotsdc_datatypes.json'
+DEFAULT_TTL = 30 * 24 * 60 * 60  # 30 days in seconds
+# Maximum number of ids in a single wbgetentities call
+_BATCH_SIZE = 50
+
+_DATATYPE_CACHE = None
+
+
+def get_datatype_cache():
+    """Return the shared PropertyDatatypeCache, stored in the pywikibot dir."""
+    global _DATATYPE_CACHE
+    if not _DATATYPE_CACHE:
+        _DATATYPE_CACHE = PropertyDatatypeCache(
+            os.path.join(config.base_dir, CACHE_FILENAME))
+    return _DATATYPE_CACHE
+
+
+def _repo_key(repo):
+    """Return the key under which a data repository is cached."""
+    return '{0}:{1}'.format(repo.family.name, repo.code)
+
+
+class PropertyDatatypeCache(object):
+    """
+    On-disk cache of property datatypes, stored per data repository.
+
+    Each entry is stored together with the time it was looked up and is
+    refetched once it is older than the time-to-live.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL):
+        """
+        Initializer.
+
+        @param path: path to the json file in which the cache is stored. If
+            None the cache is only kept in memory.
+        @param ttl: time-to-live of each entry, in seconds.
+        """
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._data = self._load()
+
+    def _load(self):
+        """Load the cache from disk, ignoring missing or corrupt files."""
+        if not self.path or not os.path.exists(self.path):
+            return dict()
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return dict()
+
+    def save(self):
+        """Write the cache to disk."""
+        if not self.path:
+            return
+        with self._lock:
+            tmp_path = '{}.tmp'.format(self.path)
+            with open(tmp_path, 'w') as f:
+                f.write(json.dumps(self._data, sort_keys=True))
+            os.replace(tmp_path, self.path)
+
+    def _cached(self, repo_key, pid):
+        """Return the cached datatype if it is still fresh, else None."""
+        entry = self._data.get(repo_key, dict()).get(pid)
+        if entry and time.time() - entry[1] < self.ttl:
+            return entry[0]
+
+    def get(self, repo, pid):
+        """
+        Return the datatype of a property, looking it up if not cached.
+
+        @param repo: pywikibot.site.DataSite where the property lives
+        @param pid: the property id
+        @return: the datatype, or None if the property does not exist
+        """
+        pid = pid.upper()
+        datatype = self._cached(_repo_key(repo), pid)
+        if not datatype:
+            datatype = self.warm(repo, [pid]).get(pid)
+        return datatype
+
+    def warm(self, repo, pids):
+        """
+        Look up the datatypes of any uncached properties.
+
+        This makes a single wbgetentities API call per 50 uncached properties.
+
+        @param repo: pywikibot.site.DataSite where the properties live
+        @param pids: iterable of property ids
+        @return: dict of the datatypes of the newly looked up properties
+        """
+        repo_key = _repo_key(repo)
+        with self._lock:
+            missing = sorted(
+                {pid.upper() for pid in pids
+                 if not self._cached(repo_key, pid.upper())})
+        if not missing:
+            return dict()
+
+        fetched = dict()
+        for chunk in common.chunked(missing, _BATCH_SIZE):
+            request = repo._simple_request(
+                action='wbgetentities', ids=chunk, props='datatype')
+            entities = request.submit().get('entities', dict())
+            for entity_id, entity in entities.items():
+                if entity.get('datatype'):
+                    fetched[entity_id.upper()] = entity['datatype']
+
+        now = time.time()
+        with self._lock:
+            repo_data = self._data.setdefault(repo_key, dict())
+            for pid, datatype in fetched.items():
+                repo_data[pid] = [datatype, now]
+            self.save()
+        return fetched
+
+    def known(self, repo):
+        """
+        Return the datatypes of all cached properties, without any lookups.
+
+        @param repo: pywikibot.site.DataSite where the properties live
+        @return: dict of property id to datatype, only holding fresh entries
+        """
+        repo_key = _repo_key(repo)
+        with self._lock:
+            return {pid: self._cached(repo_key, pid)
+                    for pid in self._data.get(repo_key, dict())
+                    if self._cached(repo_key, pid)}
+
+    def table(self, repo, pids):
+        """
+        Return the datatypes of the given properties as a plain dict.
+
+        Any uncached properties are looked up first. The returned dict is
+        independent of the repo and of the cache and can be pickled.
+
+        @param repo: pywikibot.site.DataSite where the properties live
+        @param pids: iterable of property ids
+        @return: dict of property id to datatype, None for missing properties
+        """
+        pids = {pid.upper() for pid in pids}
+        self.warm(repo, pids)
+        repo_key = _repo_key(repo)
+        with self._lock:
+            return {pid: self._cached(repo_key, pid) for pid in sorted(pids)}
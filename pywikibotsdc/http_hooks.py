@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Observe every http request made through pywikibot.
+
+Pywikibot's http.fetch is wrapped while at least one observer is registered.
+Each observer is called with the uri, the keyword arguments of the request
+and the response, after the response has been received.
+"""
+from __future__ import unicode_literals
+
+import threading
+
+from pywikibot.comms import http
+
+_OBSERVERS = []
+_ORIGINAL_FETCH = None
+_LOCK = threading.Lock()
+
+
+def add_observer(observer):
+    """
+    Start calling observer(uri, kwargs, response) for every request.
+
+    @param observer: callable taking the uri, the keyword arguments of the
+        request and the response
+    """
+    global _ORIGINAL_FETCH
+    with _LOCK:
+        if _ORIGINAL_FETCH is None:
+            _ORIGINAL_FETCH = http.fetch
+            http.fetch = _observed_fetch
+        _OBSERVERS.append(observer)
+
+
+def remove_observer(observer):
+    """Stop calling an observer, restoring http.fetch once none remain."""
+    global _ORIGINAL_FETCH
+    with _LOCK:
+        if observer in _OBSERVERS:
+            _OBSERVERS.remove(observer)
+        if not _OBSERVERS and _ORIGINAL_FETCH is not None:
+            http.fetch = _ORIGINAL_FETCH
+            _ORIGINAL_FETCH = None
+
+
+def _observed_fetch(uri, *args, **kwargs):
+    """Make a request through the original http.fetch and observe it."""
+    # the original is already restored if the last observer was removed
+    response = (_ORIGINAL_FETCH or http.fetch)(uri, *args, **kwargs)
+    for observer in list(_OBSERVERS):
+        observer(uri, kwargs, response)
+    return response
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Append-only journal of processed files, allowing interrupted runs to resume.
+
+Each line of the journal is a json object describing the outcome for one
+file. Every entry is flushed and fsync'd as soon as it is written so that the
+journal survives the process being killed.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import time
+from builtins import dict
+
+# statuses of entries which need not be processed again
+COMPLETED_STATUSES = ('success', 'warning')
+
+
+def load_completed(path):
+    """
+    Return the file names which were already completed according to a journal.
+
+    Files for which the upload failed with an error are not considered
+    completed. Any malformed line, e.g. one cut short by a crash, is ignored.
+
+    @param path: path to the journal
+    @return: set of file names
+    """
+    completed = set()
+    if not os.path.exists(str(path)):
+        return completed
+    with io.open(str(path), 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('status') in COMPLETED_STATUSES:
+                completed.add(entry.get('filename'))
+            else:
+                completed.discard(entry.get('filename'))
+    return completed
+
+
+class Journal(object):
+    """Append-only journal of processed files."""
+
+    def __init__(self, path):
+        """
+        Initializer.
+
+        @param path: path to the journal, which is created if needed
+        """
+        self.path = path
+        needs_newline = False
+        if os.path.exists(str(path)) and os.path.getsize(str(path)):
+            with io.open(str(path), 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+        self._file = io.open(str(path), 'a', encoding='utf-8')
+        if needs_newline:
+            # don't let a line cut short by a crash swallow the next entry
+            self._file.write('\n')
+
+    def __enter__(self):
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the journal on leaving the runtime context."""
+        self.close()
+
+    def record(self, result):
+        """
+        Durably append the outcome for a single file.
+
+        @param result: SdcResult of the file
+        """
+        entry = dict(
+            filename=result.title,
+            mid=result.media_identifier,
+            revid=result.revision_id,
+            statements=result.num_statements,
+            status=result.status,
+            timestamp=int(time.time()))
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """Close the journal."""
+        self._file.close()
@@ -0,0 +1,336 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Per-phase timing, request and traffic metrics of an upload run.
+
+Each phase of uploading a file (resolving the Mid, fetching pre-existing
+data and merging with it, formatting the payload, submitting it and the null
+edit) is timed into
+a latency histogram. While metrics are enabled every http request made
+through pywikibot is counted, together with the bytes sent and received, and
+attributed to the phase during which it was made.
+
+Collecting metrics is disabled by default, in which case phase() costs next
+to nothing.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import platform
+import threading
+import time
+from builtins import dict
+
+import pywikibot
+
+import pywikibotsdc.http_hooks as http_hooks
+
+try:
+    from urllib.parse import urlencode
+except ImportError:  # Python 2
+    from urllib import urlencode
+
+
+# phases in the order in which they occur during an upload
+PHASES = ('resolve', 'datatypes', 'fetch', 'merge', 'format', 'submit',
+          'null_edit')
+# phase to which requests made outside of any phase are attributed
+OTHER = 'other'
+# upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+_METRICS = None
+
+
+def get_metrics():
+    """Return the active Metrics, or None if metrics are disabled."""
+    return _METRICS
+
+
+def enable_metrics():
+    """
+    Start collecting metrics, including those of all http requests.
+
+    @return: the new active Metrics
+    """
+    global _METRICS
+    if _METRICS is None:
+        http_hooks.add_observer(_count_request)
+    _METRICS = Metrics()
+    return _METRICS
+
+
+def disable_metrics():
+    """Stop collecting metrics, returning the Metrics collected so far."""
+    global _METRICS
+    metrics, _METRICS = _METRICS, None
+    http_hooks.remove_observer(_count_request)
+    return metrics
+
+
+def phase(name):
+    """
+    Return a context manager timing a phase in the active Metrics.
+
+    @param name: name of the phase, normally one of PHASES
+    """
+    if _METRICS is None:
+        return _NO_PHASE
+    return _METRICS.phase(name)
+
+
+def _count_request(uri, kwargs, response):
+    """Count a request in the active Metrics."""
+    metrics = _METRICS
+    if metrics is not None:
+        body = kwargs.get('data', kwargs.get('body'))
+        metrics.record_request(
+            len(uri) + _size(body), _size(getattr(response, 'content', None)))
+
+
+def _size(data):
+    """Return the approximate size in bytes of a request or response body."""
+    if not data:
+        return 0
+    if isinstance(data, dict):
+        data = urlencode(data)
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return len(data)
+
+
+class _NoPhase(object):
+    """Context manager doing nothing, used while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class Histogram(object):
+    """Latency histogram with fixed buckets."""
+
+    def __init__(self):
+        """Initializer."""
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds):
+        """Add a single duration, in seconds."""
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        """Return the mean duration, or None if nothing was observed."""
+        if self.count:
+            return self.total / self.count
+
+    def percentile(self, share):
+        """
+        Return an upper estimate of a percentile, limited by the max.
+
+        @param share: the percentile as a share, e.g. 0.9 for the 90th
+        @return: float, or None if nothing was observed
+        """
+        if not self.count:
+            return None
+        needed = share * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= needed:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        """Return the histogram as a json serialisable dict."""
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': [[bound if bound != float('inf') else None, count]
+                        for bound, count in zip(BUCKETS, self.counts)
+                        if count],
+        }
+
+
+class _Phase(object):
+    """Context manager timing a single occurrence of a phase."""
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        local = self.metrics._local
+        self.outer = getattr(local, 'phase', None)
+        local.phase = self.name
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.observe(self.name, time.time() - self.start)
+        self.metrics._local.phase = self.outer
+        return False
+
+
+class Metrics(object):
+    """
+    Thread safe collection of the metrics of an upload run.
+
+    Phases may be nested, requests being attributed to the innermost one.
+    """
+
+    def __init__(self):
+        """Initializer."""
+        self.started = time.time()
+        self.histograms = dict()
+        self.requests = dict()
+        self.bytes_sent = dict()
+        self.bytes_received = dict()
+        self.counters = dict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def phase(self, name):
+        """Return a context manager timing a phase."""
+        return _Phase(self, name)
+
+    def observe(self, name, seconds):
+        """Add the duration of a phase, in seconds."""
+        with self._lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(seconds)
+
+    def record_request(self, sent, received):
+        """
+        Count a request made during the current phase of this thread.
+
+        @param sent: bytes sent
+        @param received: bytes received
+        """
+        name = getattr(self._local, 'phase', None) or OTHER
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            self.bytes_sent[name] = self.bytes_sent.get(name, 0) + sent
+            self.bytes_received[name] = (
+                self.bytes_received.get(name, 0) + received)
+
+    def count(self, name, amount=1):
+        """Increment a named counter, e.g. of files or statements."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def phase_names(self):
+        """Return the names of all phases seen, in the order of PHASES."""
+        names = set(self.histograms) | set(self.requests)
+        return ([name for name in PHASES if name in names]
+                + sorted(names.difference(PHASES)))
+
+    def to_dict(self):
+        """Return all metrics as a json serialisable dict."""
+        with self._lock:
+            phases = dict()
+            for name in self.phase_names():
+                data = (self.histograms[name].to_dict()
+                        if name in self.histograms else dict())
+                data['requests'] = self.requests.get(name, 0)
+                data['bytes_sent'] = self.bytes_sent.get(name, 0)
+                data['bytes_received'] = self.bytes_received.get(name, 0)
+                phases[name] = data
+            return {
+                'elapsed': time.time() - self.started,
+                'python': platform.python_version(),
+                'pywikibot': getattr(pywikibot, '__version__', None),
+                'counters': dict(self.counters),
+                'requests': sum(self.requests.values()),
+                'bytes_sent': sum(self.bytes_sent.values()),
+                'bytes_received': sum(self.bytes_received.values()),
+                'phases': phases,
+            }
+
+    def save(self, path):
+        """Export all metrics as json."""
+        with io.open(str(path), 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.to_dict(), indent=2, sort_keys=True))
+            f.write('\n')
+
+    def summary(self):
+        """Return a table summarising the metrics, as a list of lines."""
+        data = self.to_dict()
+        header = ('phase', 'count', 'total', 'mean', 'p50', 'p90', 'max',
+                  'requests', 'sent', 'received')
+        rows = []
+        for name in self.phase_names():
+            phase_data = data['phases'][name]
+            rows.append((
+                name, str(phase_data.get('count', '')),
+                _format_seconds(phase_data.get('total')),
+                _format_seconds(phase_data.get('mean')),
+                _format_seconds(phase_data.get('p50')),
+                _format_seconds(phase_data.get('p90')),
+                _format_seconds(phase_data.get('max')),
+                str(phase_data['requests']),
+                _format_bytes(phase_data['bytes_sent']),
+                _format_bytes(phase_data['bytes_received'])))
+        widths = [max(len(row[i]) for row in [header] + rows)
+                  for i in range(len(header))]
+        lines = ['  '.join(
+            cell.ljust(width) if i == 0 else cell.rjust(width)
+            for i, (cell, width) in enumerate(zip(row, widths)))
+            for row in [header] + rows]
+
+        files = data['counters'].get('files', 0)
+        lines.append(
+            'Elapsed {0}, {1} requests, {2} sent, {3} received{4}'.format(
+                _format_seconds(data['elapsed']), data['requests'],
+                _format_bytes(data['bytes_sent']),
+                _format_bytes(data['bytes_received']),
+                ', {0:.2f} files/s'.format(files / data['elapsed'])
+                if files and data['elapsed'] else ''))
+        return lines
+
+
+def _format_seconds(seconds):
+    """Return a duration with a suitable unit, or an empty string."""
+    if seconds is None:
+        return ''
+    if seconds >= 1:
+        return '{0:.2f}s'.format(seconds)
+    return '{0:.1f}ms'.format(seconds * 1000)
+
+
+def _format_bytes(size):
+    """Return a size in bytes with a suitable unit."""
+    if size < 1000:
+        return '{0}B'.format(size)
+    for unit in ('kB', 'MB'):
+        size /= 1000.0
+        if size < 1000:
+            return '{0:.1f}{1}'.format(size, unit)
+    return '{0:.1f}GB'.format(size / 1000.0)
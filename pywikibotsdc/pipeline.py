@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Pipeline stages running ahead of the consumer in a background thread.
+
+Each stage pulls items from the previous one and processes them in its own
+thread, handing the results on through a bounded queue. Chaining stages lets
+slow, mostly waiting, steps such as looking up the upcoming files overlap
+with the edit of the current one, while the queues keep any stage from
+running more than a fixed number of items ahead.
+"""
+from __future__ import unicode_literals
+
+import threading
+
+try:
+    from queue import Empty, Full, Queue
+except ImportError:  # Python 2
+    from Queue import Empty, Full, Queue
+
+# seconds between checks for the consumer having stopped
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class _Failure(object):
+    """An exception raised in a stage, to be re-raised by the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def stage(func, items, maxsize=1):
+    """
+    Call func on each item in a background thread, up to maxsize ahead.
+
+    The items are iterated in the background thread too, so any work done by
+    an upstream generator also runs ahead of the consumer. An exception
+    raised by func, or by the items, stops the stage and is re-raised by the
+    consumer once it reaches it. The background thread stops once the
+    returned generator is closed or garbage collected.
+
+    @param func: callable taking a single item, or None to pass the items on
+        unchanged
+    @param items: iterable of items to process
+    @param maxsize: number of processed items which may wait for the consumer
+    @return: generator of func(item) for each item, in the same order
+    @raises: ValueError
+    """
+    if maxsize < 1:
+        raise ValueError('A stage must be allowed at least one item ahead.')
+    return _run_stage(func, items, maxsize)
+
+
+def _run_stage(func, items, maxsize):
+    """Run a stage, see stage(), once the first value is asked for."""
+    results = Queue(maxsize=maxsize)
+    stopped = threading.Event()
+
+    def put(value):
+        """Put a value on the queue, returning False if the consumer left."""
+        while not stopped.is_set():
+            try:
+                results.put(value, timeout=POLL_INTERVAL)
+            except Full:
+                continue
+            return True
+        return False
+
+    def run():
+        try:
+            for item in items:
+                if not put(func(item) if func else item):
+                    return
+        except Exception as error:
+            put(_Failure(error))
+        else:
+            put(_DONE)
+
+    thread = threading.Thread(target=run, name='pipeline-stage')
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            try:
+                value = results.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+            if value is _DONE:
+                return
+            if isinstance(value, _Failure):
+                raise value.error
+            yield value
+    finally:
+        stopped.set()
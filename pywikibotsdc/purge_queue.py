@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Deferred null edits, made as batched purges of the file pages.
+
+A null edit is needed for wikitext based tracking templates to pick up newly
+added Structured Data. Rather than making a null edit to every file page right
+after its upload, the pages are queued and purged with forcelinkupdate, which
+updates the links tables just as a null edit does, for a whole batch of pages
+per API call. Full batches are purged in a background thread so that they do
+not hold up the uploads.
+"""
+from __future__ import unicode_literals
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pywikibot
+
+import pywikibotsdc.common as common
+import pywikibotsdc.metrics as metrics
+import pywikibotsdc.retry as retry
+from pywikibotsdc.retry import RetryPolicy
+
+# default number of titles purged per API call
+BATCH_SIZE = 50
+
+
+class PurgeQueue(object):
+    """Thread safe queue of file pages to purge, flushed in batches."""
+
+    def __init__(self, target_site, batch_size=BATCH_SIZE, retry_policy=None):
+        """
+        Initializer.
+
+        @param target_site: pywikibot.Site where the pages are found
+        @param batch_size: number of pages purged per API call, at most the
+            API limit of titles per request.
+        @param retry_policy: RetryPolicy of purges which fail, defaults to a
+            RetryPolicy with the default settings.
+        """
+        self.site = target_site
+        self.batch_size = batch_size
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.purged = 0
+        self.failed = []
+        self._pending = []
+        self._futures = []
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of pages waiting to be purged."""
+        return len(self._pending)
+
+    def add(self, file_page):
+        """
+        Queue a page, purging the queued pages in the background once full.
+
+        @param file_page: pywikibot.Page (or the title as a string) to purge
+        """
+        title = file_page if common.is_str(file_page) else file_page.title()
+        with self._lock:
+            self._pending.append(title)
+            if len(self._pending) < self.batch_size:
+                return
+            titles, self._pending = self._pending, []
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            self._futures = [future for future in self._futures
+                             if not future.done()]
+            self._futures.append(self._executor.submit(self._purge, titles))
+
+    def flush(self):
+        """
+        Purge all queued pages, waiting for any purges in the background.
+
+        @raises: any unexpected exception raised while purging
+        """
+        with self._lock:
+            titles, self._pending = self._pending, []
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+        if titles:
+            self._purge(titles)
+
+    def close(self):
+        """Flush the queue and stop the background thread."""
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _purge(self, titles):
+        """
+        Purge a single batch of pages, updating their links tables.
+
+        Pages which could not be purged are logged and added to failed.
+
+        @param titles: list of page titles
+        """
+        def purge():
+            request = self.site._simple_request(
+                action='purge', titles=titles, forcelinkupdate=True)
+            return request.submit()
+
+        try:
+            with metrics.phase('null_edit'):
+                response = self.retry_policy.call(purge)
+        except Exception as error:
+            if retry.classify(error) is None:
+                raise
+            failed = titles
+            pywikibot.warning(
+                'Purging {0} page(s) failed: {1}'.format(len(titles), error))
+        else:
+            failed = [page.get('title') for page in response.get('purge', [])
+                      if 'linkupdate' not in page]
+            if failed:
+                pywikibot.warning(
+                    'The links of the following pages could not be updated: '
+                    '{0}'.format(', '.join(failed)))
+        with self._lock:
+            self.purged += len(titles) - len(failed)
+            self.failed.extend(failed)
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Retrying failed edits with exponential backoff and jitter.
+
+Errors are classified by their API error code as either transient, where
+the edit was certainly not saved and may be retried, or permanent, where
+retrying would only fail again. Errors where no response was received, such
+as a timeout after the request was sent, leave the outcome of the edit
+unknown. Before such an edit is retried it is verified that it was not
+already saved, since saving it twice would duplicate its statements.
+"""
+from __future__ import unicode_literals
+
+import random
+import time
+
+import pywikibot
+from pywikibot.exceptions import (
+    FatalServerError,
+    MaxlagTimeoutError,
+    Server414Error,
+    ServerError,
+    TimeoutError
+)
+
+# classes of errors
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+UNKNOWN = 'unknown'
+
+# API error codes after which the edit was not saved but may be retried
+TRANSIENT_CODES = ('maxlag', 'ratelimited', 'readonly', 'editconflict',
+                   'badtoken', 'lockmanager-fail-conflict')
+# prefix of the codes of exceptions raised by MediaWiki while handling the
+# request, after which the edit may or may not have been saved
+INTERNAL_ERROR_PREFIX = 'internal_api_error_'
+
+MAX_RETRIES = 4
+BASE_DELAY = 5.0  # seconds
+MAX_DELAY = 120.0  # seconds
+
+
+def classify(error):
+    """
+    Classify an error raised while making an API request.
+
+    @param error: the raised exception
+    @return: TRANSIENT, PERMANENT or UNKNOWN, or None if the error was not
+        caused by the API request.
+    """
+    if isinstance(error, pywikibot.data.api.APIError):
+        if error.code in TRANSIENT_CODES:
+            return TRANSIENT
+        if (error.code or '').startswith(INTERNAL_ERROR_PREFIX):
+            return UNKNOWN
+        return PERMANENT
+    if isinstance(error, MaxlagTimeoutError):
+        return TRANSIENT
+    if isinstance(error, (FatalServerError, Server414Error)):
+        return PERMANENT
+    if isinstance(error, (TimeoutError, ServerError)):
+        return UNKNOWN
+
+
+def is_retryable(error):
+    """Return if an error, or the data of an SdcException, may be retried."""
+    return (isinstance(error, Exception)
+            and classify(error) in (TRANSIENT, UNKNOWN))
+
+
+class RetryPolicy(object):
+    """How often, and after how long, a failed request is retried."""
+
+    def __init__(self, max_retries=MAX_RETRIES, base_delay=BASE_DELAY,
+                 max_delay=MAX_DELAY):
+        """
+        Initializer.
+
+        @param max_retries: times a request is retried before giving up
+        @param base_delay: upper bound of the delay before the first retry,
+            in seconds. It is doubled for every following retry.
+        @param max_delay: upper bound of any delay, in seconds
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """
+        Return the delay before a retry, using "full jitter".
+
+        The delay is picked at random between zero and an exponentially
+        growing bound, so that workers which failed at the same time do not
+        retry at the same time.
+
+        @param attempt: number of retries already made
+        @return: float, in seconds
+        """
+        bound = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, bound)
+
+    def call(self, func, verify=None):
+        """
+        Call func, retrying it after any transient failure.
+
+        @param func: callable taking no arguments, e.g. submitting an edit
+        @param verify: callable taking no arguments, called after a failure
+            with an unknown outcome. It returns the result to use instead if
+            the request turns out to have succeeded, otherwise None. If not
+            provided such failures are retried directly.
+        @return: the return value of func, or of verify
+        @raises: the error of the last attempt, if all attempts failed or if
+            the error was permanent.
+        """
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except Exception as error:
+                kind = classify(error)
+                if kind not in (TRANSIENT, UNKNOWN):
+                    raise
+                if kind == UNKNOWN and verify is not None:
+                    result = verify()
+                    if result is not None:
+                        pywikibot.log(
+                            'The request failed ({0}) but had already '
+                            'succeeded.'.format(error))
+                        return result
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.delay(attempt)
+                attempt += 1
+                pywikibot.log(
+                    'Request failed ({0}), retry {1} of {2} in '
+                    '{3:.1f} seconds.'.format(
+                        error, attempt, self.max_retries, delay))
+            time.sleep(delay)
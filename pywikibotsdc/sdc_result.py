@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Result of uploading the Structured Data of a single file in a batch."""
+from __future__ import unicode_literals
+
+import pywikibotsdc.common as common
+
+
+class SdcResult(object):
+    """
+    Outcome of uploading the Structured Data of a single file.
+
+    Either num_statements is set, for a successful upload, or error is set to
+    the SdcException explaining why the upload failed or was skipped.
+    """
+
+    def __init__(self, file_page, media_identifier=None, num_statements=None,
+                 error=None, revision_id=None):
+        """
+        Initializer.
+
+        @param file_page: the file name, or pywikibot.FilePage, as provided
+        @param media_identifier: the Mid of the file, if it was resolved
+        @param num_statements: number of added statements
+        @param error: SdcException raised for the file, if any
+        @param revision_id: id of the revision created by the upload
+        """
+        self.file_page = file_page
+        self.media_identifier = media_identifier
+        self.num_statements = num_statements
+        self.error = error
+        self.revision_id = revision_id
+
+    @property
+    def title(self):
+        """Return the file name as provided, or the title of the FilePage."""
+        if common.is_str(self.file_page):
+            return self.file_page
+        return self.file_page.title()
+
+    @property
+    def status(self):
+        """Return "success" or, if it failed, the level of the error."""
+        if self.error is None:
+            return 'success'
+        return self.error.level
+
+    @property
+    def success(self):
+        """Return if the data was successfully uploaded."""
+        return self.error is None
+
+    def __repr__(self):
+        """Return a more complete string representation."""
+        return 'SdcResult({0!r}, {1!r}, {2!r}, {3!r})'.format(
+            self.title, self.media_identifier, self.num_statements,
+            self.error)
@@ -7,20 +7,45 @@ Internally used data format and merge strategies described in README.md.
 """
 from __future__ import unicode_literals
 
+import calendar
 import json
+import time
 from builtins import dict
+from collections import OrderedDict
 
 import pywikibot
 
+import pywikibotsdc.canonical as canonical
 import pywikibotsdc.common as common
+import pywikibotsdc.metrics as metrics
+import pywikibotsdc.pipeline as pipeline
+import pywikibotsdc.retry as retry
+import pywikibotsdc.worker_pool as worker_pool
+from pywikibotsdc.claim_cache import claim_key, get_claim_cache
+from pywikibotsdc.datatype_cache import get_datatype_cache
+from pywikibotsdc.purge_queue import PurgeQueue
 from pywikibotsdc.sdc_exception import SdcException
+from pywikibotsdc.sdc_result import SdcResult
+from pywikibotsdc.upload_session import UploadSession
+from pywikibotsdc.value_cache import (
+    INTERNED_DATATYPES,
+    get_value_cache,
+    value_key
+)
 
 # Wikibase has hardcoded Commons as the only allowed site for media files
 # T90492. Pywikibot gets cranky if it's initialised straight away though.
 _COMMONS_MEDIA_FILE_SITE = None  # pywikibot.Site('commons', 'commons')
 DEFAULT_EDIT_SUMMARY = \
     'Added {count} structured data statement(s) #pwbsdc'
-STRATEGIES = ('new', 'blind', 'add', 'nuke')
+STRATEGIES = ('new', 'blind', 'add', 'merge', 'nuke')
+# Number of titles/ids allowed per API call with and without apihighlimits
+API_LIMIT = 50
+API_HIGH_LIMIT = 500
+# Number of latest revisions searched for an edit whose outcome is unknown
+RECENT_REVISIONS = 5
+# Allowed difference between the local clock and that of the wiki, in seconds
+CLOCK_SKEW = 300
 
 
 def _get_commons():
@@ -35,16 +60,60 @@ def _submit_data(target_site, payload):
     """
     Submit the Structured Data for upload.
 
+    Pywikibot does not retry the request itself, since resending an edit
+    after an error where the outcome is unknown could duplicate it. Failures
+    are instead retried by the RetryPolicy of the UploadSession.
+
     @param target_site: pywikibot.Site where data is uploaded.
     @param payload: request formatted for the MediaWiki Action API
-    @raises: pywikibot.data.api.APIError
+    @return: the API response
+    @raises: pywikibot.data.api.APIError, pywikibot.exceptions.Error
     """
     request = target_site._simple_request(**payload)
-    request.submit()
+    request.max_retries = 0
+    return request.submit()
+
+
+def _find_saved_edit(target_site, media_identifier, summary, since):
+    """
+    Look for an edit, whose outcome is unknown, among the latest revisions.
+
+    The edit is considered saved if one of the latest revisions of the file
+    was made by the current user, with the same edit summary, after the edit
+    was first attempted.
+
+    @param target_site: pywikibot.Site where the file is found
+    @param media_identifier: Mid of the edited file
+    @param summary: edit summary of the edit
+    @param since: time of the first attempt, in seconds since the epoch
+    @return: the revision id of the edit, or None if it was not found
+    """
+    request = target_site._simple_request(
+        action='query', prop='revisions', pageids=media_identifier[1:],
+        rvprop=['ids', 'timestamp', 'user', 'comment'],
+        rvlimit=RECENT_REVISIONS)
+    pages = request.submit().get('query', dict()).get('pages', dict())
+    if isinstance(pages, dict):
+        pages = pages.values()
+    user = target_site.user()
+    for page in pages:
+        for revision in page.get('revisions', []):
+            if (summary in revision.get('comment', '')
+                    and (not user or revision.get('user') == user)
+                    and _parse_timestamp(revision['timestamp'])
+                    >= since - CLOCK_SKEW):
+                return revision['revid']
+
+
+def _parse_timestamp(timestamp):
+    """Return an ISO 8601 timestamp of the API in seconds since the epoch."""
+    return calendar.timegm(time.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ'))
 
 
 def upload_single_sdc_data(file_page, sdc_data, target_site=None,
-                           strategy=None, summary=None, null_edit=False):
+                           strategy=None, summary=None, null_edit=False,
+                           media_identifier=None, prefetched=None,
+                           compiled=False, session=None):
     """
     Upload the Structured Data corresponding to the recently uploaded file.
 
@@ -62,9 +131,55 @@ def upload_single_sdc_data(file_page, sdc_data, target_site=None,
     @param null_edit: If a null_edit should be performed to the page after the
         data upload, this is needed to trigger updates to wikitext based
         tracking templates. Defaults to False.
+    @param media_identifier: The Mid of the file_page, if already resolved
+        e.g. through get_media_identifiers(). If not provided it is looked up.
+    @param prefetched: dict of pre-existing Structured Data per Mid, as
+        returned by prefetch_structured_data(). If the Mid is not present the
+        data is looked up separately.
+    @param compiled: If sdc_data has already been compiled by
+        wikibase_json.compile_sdc_data(). Defaults to False.
+    @param session: UploadSession of the site, allowing the edit token and
+        user rights to be reused between calls. Its RetryPolicy decides how
+        failed edits are retried. If not provided a new session is used.
     @return: Number of added statements
     @raises: ValueError, SdcException
     """
+    return _upload_sdc_data(
+        file_page, sdc_data, target_site, strategy, summary, null_edit,
+        media_identifier, prefetched, compiled, session).num_statements
+
+
+def _upload_sdc_data(file_page, sdc_data, target_site, strategy, summary,
+                     null_edit, media_identifier, prefetched, compiled=False,
+                     session=None):
+    """
+    Upload the Structured Data corresponding to the file.
+
+    See upload_single_sdc_data() for the parameters.
+
+    @return: SdcResult of the upload
+    @raises: ValueError, SdcException
+    """
+    upload = _prepare_upload(
+        file_page, sdc_data, target_site, strategy, summary, media_identifier,
+        prefetched, compiled)
+    return _submit_upload(
+        upload, null_edit, session or UploadSession(upload[1].site))
+
+
+def _prepare_upload(file_page, sdc_data, target_site, strategy, summary,
+                    media_identifier, prefetched, compiled=False):
+    """
+    Merge the Structured Data with any existing data and build the edit.
+
+    See upload_single_sdc_data() for the parameters.
+
+    @return: (SdcResult, pywikibot.FilePage, payload, num_statements) tuple
+        where payload is the wbeditentity request, less the edit token and bot
+        flag.
+    @raises: ValueError, SdcException
+    """
+    result = SdcResult(file_page)
     # support either file_name+Site or file_page as input
     if isinstance(file_page, pywikibot.FilePage):
         if target_site and target_site != file_page.site:
@@ -76,11 +191,16 @@ def upload_single_sdc_data(file_page, sdc_data, target_site=None,
         target_site = target_site or _get_commons()
         file_page = pywikibot.FilePage(target_site, file_page)
 
-    media_identifier = get_media_identifier(file_page)
+    if not media_identifier:
+        with metrics.phase('resolve'):
+            media_identifier = get_media_identifier(file_page)
+    result.media_identifier = media_identifier
 
     # check if there is Structured Data already and resolve what to do
     # raise SdcException if merge is not possible
-    skipped = merge_strategy(media_identifier, target_site, sdc_data, strategy)
+    with metrics.phase('merge'):
+        skipped = merge_strategy(
+            media_identifier, target_site, sdc_data, strategy, prefetched)
     if skipped:
         pywikibot.log(
             '{0} - Conflict with existing values. Dropping the following '
@@ -90,13 +210,16 @@ def upload_single_sdc_data(file_page, sdc_data, target_site=None,
 
     # Translate from internal sdc data format to that expected by MediaWiki.
     try:
-        sdc_payload = format_sdc_payload(target_site, sdc_data)
+        with metrics.phase('format'):
+            if compiled:
+                sdc_payload = format_compiled_payload(sdc_data)
+            else:
+                sdc_payload = format_sdc_payload(target_site, sdc_data)
     except Exception as error:
         raise SdcException(
             'error', error, 'Formatting SDC data failed: {0}'.format(error)
         )
 
-    # upload sdc data
     summary = summary or sdc_data.get('edit_summary', DEFAULT_EDIT_SUMMARY)
     num_statements = (len(sdc_payload.get('labels', []))
                       + len(sdc_payload.get('claims', [])))
@@ -105,23 +228,60 @@ def upload_single_sdc_data(file_page, sdc_data, target_site=None,
         'format': u'json',
         'id': media_identifier,
         'data': json.dumps(sdc_payload, separators=(',', ':')),
-        'token': target_site.tokens['csrf'],
         'summary': summary.format(count=num_statements),
-        'bot': target_site.has_right('bot')
     }
     if strategy and strategy.lower() == 'nuke':
         payload['clear'] = 1
+    return result, file_page, payload, num_statements
+
+
+def _submit_upload(upload, null_edit, session):
+    """
+    Submit an edit built by _prepare_upload(), followed by any null edit.
 
+    @param upload: the tuple returned by _prepare_upload()
+    @param null_edit: If a null_edit should be performed to the page after the
+        data upload.
+    @param session: UploadSession of the site
+    @return: SdcResult of the upload
+    @raises: SdcException
+    """
+    result, file_page, payload, num_statements = upload
+    target_site = file_page.site
     try:
-        _submit_data(target_site, payload)
-    except pywikibot.data.api.APIError as error:
+        with metrics.phase('submit'):
+            payload = dict(payload, bot=session.bot)
+            started = time.time()
+
+            def submit():
+                with session.edit_slot():
+                    return session.with_token(
+                        lambda token: _submit_data(
+                            target_site, dict(payload, token=token)))
+
+            def verify():
+                revision_id = _find_saved_edit(
+                    target_site, payload['id'], payload['summary'], started)
+                if revision_id:
+                    return {'entity': {'lastrevid': revision_id}}
+
+            response = session.retry_policy.call(submit, verify)
+    except Exception as error:
+        if retry.classify(error) is None:
+            raise
         raise SdcException(
             'error', error, 'Uploading SDC data failed: {0}'.format(error)
         )
     else:
-        if null_edit:
+        result.num_statements = num_statements
+        result.revision_id = (response or {}).get(
+            'entity', {}).get('lastrevid')
+        if null_edit and session.purge_queue is not None:
+            session.purge_queue.add(file_page)
+        elif null_edit:
             try:
-                file_page.touch(botflag=target_site.has_right('bot'))
+                with metrics.phase('null_edit'), session.edit_slot():
+                    file_page.touch(botflag=session.bot)
             except pywikibot.i18n.TranslationError:
                 pywikibot.error(
                     'The null edit could not be performed on {0} due to a bug '
@@ -129,7 +289,238 @@ def upload_single_sdc_data(file_page, sdc_data, target_site=None,
                     'null edits will not be possible, maybe time to '
                     'upgrade?'.format(file_page.title()))
                 raise
-    return num_statements
+    return result
+
+
+def upload_batch_sdc_data(file_data, target_site=None, strategy=None,
+                          summary=None, null_edit=False, workers=1,
+                          order='input', compiled=False, controller=None,
+                          retry_policy=None, lookahead=0):
+    """
+    Upload the Structured Data corresponding to many files.
+
+    The Mids and any pre-existing Structured Data are looked up for a whole
+    batch of files at the time, and the property datatypes of the whole batch
+    are looked up in one go, before each file is uploaded as in
+    upload_single_sdc_data(). All files share a single UploadSession, so the
+    edit token and user rights are only looked up once.
+
+    With a lookahead the work is pipelined. The Mids, pre-existing data and
+    property datatypes of the upcoming files are looked up, and their edits
+    merged and formatted, in background stages while the current edit is
+    submitted. Each stage runs at most lookahead files ahead of the next one.
+    Edits are still submitted one at a time, unless there are several
+    workers.
+
+    Rather than making a null edit after each upload, the file pages are
+    purged, updating their links tables, in batches through a PurgeQueue. Any
+    remaining pages are purged once all files are done.
+
+    Files whose edit still fails with a temporary error once all retries are
+    used up are uploaded once more at the end of the run, after refetching
+    any pre-existing data. Their results are yielded last.
+
+    The input is consumed lazily so it may be a generator over a very large
+    dataset.
+
+    @param file_data: iterable of (file_page, sdc_data) tuples where file_page
+        is a pywikibot.FilePage object (or the file name as a string) and
+        sdc_data the internally formatted Structured Data in json format.
+    @param target_site: pywikibot.Site where the files are found. Defaults to
+        Wikimedia Commons.
+    @param strategy: Strategy used for merging uploaded data with pre-existing
+        data. See upload_single_sdc_data().
+    @param summary: edit summary, see upload_single_sdc_data().
+    @param null_edit: If a null_edit should be performed to each page after
+        the data upload. Defaults to False.
+    @param workers: number of files to upload concurrently. Defaults to 1.
+    @param order: "input" to yield the results in the same order as the input
+        or "completion" to yield them as soon as they are done.
+    @param compiled: If the sdc_data has already been compiled by
+        wikibase_json.compile_sdc_data(), in which case no property datatypes
+        need to be looked up. Defaults to False.
+    @param controller: throughput.ThroughputController pacing the edits of
+        all workers. If not provided only Pywikibot's throttle applies.
+    @param retry_policy: retry.RetryPolicy of edits which fail. Defaults to a
+        RetryPolicy with the default settings.
+    @param lookahead: number of files to prepare ahead of the one being
+        submitted. Defaults to 0, for no pipelining.
+    @return: generator of SdcResult objects, one per file. Any SdcException
+        raised for a file is returned as the error of its result.
+    @raises: ValueError
+    """
+    target_site = target_site or _get_commons()
+    purge_queue = None
+    if null_edit:
+        purge_queue = PurgeQueue(
+            target_site, api_batch_limit(target_site), retry_policy)
+    session = UploadSession(
+        target_site, controller=controller, retry_policy=retry_policy,
+        purge_queue=purge_queue)
+    if workers > 1:
+        # load the lazily cached entity namespaces of the data repository
+        # before they are needed by several threads at once
+        repo = target_site.data_repository()
+        repo.item_namespace
+        repo.property_namespace
+
+    def missing(file_page, media_identifier):
+        return SdcResult(file_page, media_identifier, error=SdcException(
+            'error', 'missing file',
+            'The file could not be found on {0}'.format(target_site)))
+
+    def upload(entry):
+        file_page, sdc_data, media_identifier, prefetched = entry
+        if not media_identifier:
+            return missing(file_page, media_identifier)
+        try:
+            return _upload_sdc_data(
+                file_page, sdc_data, target_site, strategy, summary,
+                null_edit, media_identifier, prefetched, compiled, session)
+        except SdcException as se:
+            return SdcResult(file_page, media_identifier, error=se)
+
+    def prepare(entry):
+        file_page, sdc_data, media_identifier, prefetched = entry
+        if not media_identifier:
+            return entry, missing(file_page, media_identifier)
+        try:
+            return entry, _prepare_upload(
+                file_page, sdc_data, target_site, strategy, summary,
+                media_identifier, prefetched, compiled)
+        except SdcException as se:
+            return entry, SdcResult(file_page, media_identifier, error=se)
+
+    def submit(prepared):
+        entry, upload = prepared
+        if isinstance(upload, SdcResult):
+            return upload
+        try:
+            return _submit_upload(upload, null_edit, session)
+        except SdcException as se:
+            return SdcResult(entry[0], entry[2], error=se)
+
+    entries = _prefetch_batches(
+        file_data, target_site, strategy, compiled, lookahead)
+    if lookahead:
+        # merge and format the upcoming files while the current one is
+        # submitted
+        results = worker_pool.process_concurrently(
+            submit, pipeline.stage(prepare, entries, lookahead), workers,
+            order)
+        results = ((entry, future) for (entry, _), future in results)
+    else:
+        results = worker_pool.process_concurrently(
+            upload, entries, workers, order)
+
+    requeued = []
+    try:
+        for entry, future in results:
+            result = future.result()
+            if result.error and retry.is_retryable(result.error.data):
+                # the pre-existing data is refetched since the failed edit
+                # may still have been saved
+                file_page, sdc_data, media_identifier, _ = entry
+                requeued.append((file_page, sdc_data, media_identifier, None))
+                continue
+            yield result
+
+        if requeued:
+            pywikibot.log(
+                'Retrying {} file(s) which failed with a temporary '
+                'error.'.format(len(requeued)))
+            results = worker_pool.process_concurrently(
+                upload, requeued, workers, order)
+            for _, future in results:
+                yield future.result()
+    finally:
+        if session.purge_queue is not None:
+            # purge the pages of any files already uploaded, also if the run
+            # was stopped early
+            session.purge_queue.close()
+            pywikibot.log('Purged {0} file page(s).'.format(
+                session.purge_queue.purged))
+
+
+def _prefetch_batches(file_data, target_site, strategy, compiled=False,
+                      lookahead=0):
+    """
+    Add the pre-fetched data needed to upload each file.
+
+    @param file_data: iterable of (file_page, sdc_data) tuples
+    @param target_site: pywikibot.Site where the files are found
+    @param strategy: the merge strategy used
+    @param compiled: if the sdc_data is already compiled, making the property
+        datatypes unnecessary
+    @param lookahead: if set, the files are looked up in batches of at most
+        this size, with the Mids resolved and the pre-existing data fetched in
+        separate background stages, each up to one batch ahead.
+    @return: generator of (file_page, sdc_data, Mid, prefetched) tuples where
+        Mid is None for files which could not be found and prefetched is a
+        dict of pre-existing Structured Data per Mid.
+    """
+    repo = target_site.data_repository()
+    batch_size = api_batch_limit(target_site)
+    if lookahead:
+        batch_size = min(batch_size, lookahead)
+
+    def resolve(batch):
+        file_pages = [file_page for file_page, _ in batch]
+        with metrics.phase('resolve'):
+            media_identifiers = get_media_identifiers(file_pages, target_site)
+        return batch, media_identifiers
+
+    def fetch(resolved):
+        batch, media_identifiers = resolved
+        if not compiled:
+            with metrics.phase('datatypes'):
+                get_datatype_cache().warm(
+                    repo, {pid for _, sdc_data in batch
+                           for pid in get_property_ids(sdc_data)})
+        with metrics.phase('fetch'):
+            prefetched = prefetch_structured_data(
+                [mid for _, mid in media_identifiers.values() if mid],
+                target_site, _caption_languages(batch, strategy))
+        return [(file_page, sdc_data,
+                 media_identifiers[_file_page_key(file_page)][1], prefetched)
+                for file_page, sdc_data in batch]
+
+    batches = common.chunked(file_data, batch_size)
+    if lookahead:
+        batches = pipeline.stage(
+            fetch, pipeline.stage(resolve, batches))
+    else:
+        batches = (fetch(resolve(batch)) for batch in batches)
+    for batch in batches:
+        for entry in batch:
+            yield entry
+
+
+def _caption_languages(file_data, strategy):
+    """
+    Return the caption languages needed to resolve conflicts for a batch.
+
+    @param file_data: list of (file_page, sdc_data) tuples
+    @param strategy: the merge strategy used
+    @return: set of language codes or None if all languages are needed.
+    """
+    if not strategy:
+        # any pre-existing caption must be detected
+        return None
+    return {lang for _, sdc_data in file_data
+            for lang in sdc_data.get('caption', {})}
+
+
+def api_batch_limit(target_site):
+    """
+    Return the maximum number of titles or ids allowed in a single API call.
+
+    @param target_site: pywikibot.Site object to which requests are made
+    @return: int
+    """
+    if target_site.has_right('apihighlimits'):
+        return API_HIGH_LIMIT
+    return API_LIMIT
 
 
 def get_media_identifier(file_page):
@@ -143,17 +534,86 @@ def get_media_identifier(file_page):
     @return The Mid media identifier.
     @raises: pywikibot.NoPage
     """
-    if file_page.isRedirectPage():
-        old_title = file_page.title()
-        file_page = file_page.getRedirectTarget()
-        pywikibot.log(
-            '{0} - Was a redirect, editing the target "{1}" instead.'.format(
-                old_title, file_page.title()))
-
-    if not file_page.exists():
+    title = file_page.title()
+    _, media_identifier = get_media_identifiers(
+        [file_page], file_page.site)[title]
+    if not media_identifier:
         raise pywikibot.NoPage(file_page)
+    return media_identifier
+
+
+def get_media_identifiers(file_pages, target_site=None):
+    """
+    Resolve multiple file page targets and return the corresponding Mids.
+
+    Redirects are resolved in the same way as for get_media_identifier but
+    the lookup is made for up to api_batch_limit() files per API call.
+
+    @param file_pages: iterable of pywikibot.FilePage objects (or file names
+        as strings).
+    @param target_site: pywikibot.Site where the files are found (if only file
+        names were supplied). Defaults to Wikimedia Commons.
+    @return: dict where the keys are the provided file names (or the titles of
+        the provided FilePage objects) and the values are tuples of the
+        resolved title and the Mid, or None if the file does not exist.
+    """
+    target_site = target_site or _get_commons()
+    titles = OrderedDict()
+    for file_page in file_pages:
+        key = _file_page_key(file_page)
+        if not isinstance(file_page, pywikibot.FilePage):
+            file_page = pywikibot.FilePage(target_site, file_page)
+        titles[key] = file_page.title()
+
+    resolved = dict()
+    unique_titles = OrderedDict.fromkeys(titles.values())
+    for chunk in common.chunked(unique_titles, api_batch_limit(target_site)):
+        resolved.update(_resolve_titles(chunk, target_site))
+
+    results = OrderedDict()
+    for key, title in titles.items():
+        results[key] = resolved.get(title, (title, None))
+    return results
+
+
+def _file_page_key(file_page):
+    """Return the file name, or the title if file_page is a FilePage."""
+    if isinstance(file_page, pywikibot.FilePage):
+        return file_page.title()
+    return file_page
+
+
+def _resolve_titles(titles, target_site):
+    """
+    Resolve the page titles using a single query API call.
 
-    return 'M{}'.format(file_page.pageid)
+    @param titles: list of titles, at most api_batch_limit() long
+    @param target_site: pywikibot.Site object where the pages are found
+    @return: dict of {title: (resolved title, Mid or None)}
+    """
+    request = target_site._simple_request(
+        action='query', titles=titles, redirects=True, prop='info')
+    raw = request.submit().get('query', dict())
+
+    normalized = {n['from']: n['to'] for n in raw.get('normalized', [])}
+    redirects = {r['from']: r['to'] for r in raw.get('redirects', [])}
+    pages = raw.get('pages', dict())
+    if isinstance(pages, dict):
+        pages = pages.values()
+    media_identifiers = {
+        page['title']: 'M{}'.format(page['pageid']) for page in pages
+        if 'pageid' in page and 'missing' not in page}
+
+    results = dict()
+    for title in titles:
+        target = normalized.get(title, title)
+        if target in redirects:
+            target = redirects[target]
+            pywikibot.log(
+                '{0} - Was a redirect, editing the target "{1}" '
+                'instead.'.format(title, target))
+        results[title] = (target, media_identifiers.get(target))
+    return results
 
 
 def _get_existing_structured_data(media_identifier, target_site):
@@ -172,16 +632,66 @@ def _get_existing_structured_data(media_identifier, target_site):
         action='wbgetentities', ids=media_identifier)
     raw = request.submit()
     data = raw.get('entities').get(media_identifier)
+    return _parse_structured_data(data)
+
+
+def prefetch_structured_data(media_identifiers, target_site, languages=None):
+    """
+    Return pre-existing Structured Data, if any, for multiple files.
+
+    Only captions and statements are fetched, for up to api_batch_limit()
+    files per API call.
+
+    @param media_identifiers: iterable of Mids of the files
+    @param target_site: pywikibot.Site object to which files should be uploaded
+    @param languages: iterable of the caption languages to fetch, allowing
+        captions in any other language to be ignored. Defaults to fetching all
+        languages.
+    @return: dict of Mids and the corresponding Structured Data in the same
+        format as returned by _get_existing_structured_data.
+    """
+    props = ['labels', 'claims']
+    params = {'action': 'wbgetentities'}
+    if languages is not None:
+        languages = sorted(set(languages))
+        if languages:
+            params['languages'] = languages
+        else:
+            props.remove('labels')
+    params['props'] = props
+
+    prefetched = dict()
+    unique_ids = OrderedDict.fromkeys(media_identifiers)
+    for chunk in common.chunked(unique_ids, api_batch_limit(target_site)):
+        request = target_site._simple_request(ids=chunk, **params)
+        entities = request.submit().get('entities')
+        for media_identifier in chunk:
+            prefetched[media_identifier] = _parse_structured_data(
+                entities.get(media_identifier))
+    return prefetched
+
+
+def _parse_structured_data(data):
+    """
+    Return the Structured Data of a wbgetentities entity, if any.
+
+    @param data: the entity as returned by the wbgetentities API
+    @return The Structured Data of the file or None if no data was ever present
+        or if the data has since been removed.
+    """
     if ('missing' not in data.keys()
             and (data.get('labels') or data.get('statements'))):
         # statements are a list when empty but dict when populated,
         # changing empty to also be a dict for consistency
         if not data.get('statements'):
             data['statements'] = dict()
+        if not data.get('labels'):
+            data['labels'] = dict()
         return data
 
 
-def merge_strategy(media_identifier, target_site, sdc_data, strategy):
+def merge_strategy(media_identifier, target_site, sdc_data, strategy,
+                   prefetched=None):
     """
     Check if the file already holds Structured Data, if so resolve what to do.
 
@@ -189,12 +699,20 @@ def merge_strategy(media_identifier, target_site, sdc_data, strategy):
     @param target_site: pywikibot.Site object to which file should be uploaded
     @param sdc_data: internally formatted Structured Data in json format
     @param strategy: Strategy used for merging uploaded data with pre-existing
-        data. Allowed values are None, "New", "Blind", "Add" and "Nuke".
+        data. Allowed values are None, "New", "Blind", "Add", "Merge" and
+        "Nuke".
+    @param prefetched: dict of pre-existing Structured Data per Mid, as
+        returned by prefetch_structured_data(). If the Mid is not present the
+        data is looked up separately.
     @return: dict of pids and caption languages removed from sdc_data due to
         conflicts.
     @raises: ValueError, SdcException
     """
-    prior_data = _get_existing_structured_data(media_identifier, target_site)
+    if prefetched is not None and media_identifier in prefetched:
+        prior_data = prefetched[media_identifier]
+    else:
+        prior_data = _get_existing_structured_data(
+            media_identifier, target_site)
     if not prior_data:
         # even unknown strategies should pass if there is no prior data
         return
@@ -237,6 +755,8 @@ def merge_strategy(media_identifier, target_site, sdc_data, strategy):
                 ('Found pre-existing SDC data, no new data will be added. '
                  'Found data: {}'.format(prior_data))
             )
+    elif strategy == 'merge':
+        return _drop_present_data(prior_data, sdc_data, target_site)
     elif strategy not in STRATEGIES:
         raise ValueError(
             'The `strategy` parameter must be None, "{0}" or "{1}" '
@@ -247,6 +767,77 @@ def merge_strategy(media_identifier, target_site, sdc_data, strategy):
     # pass if strategy is "Blind" or "Nuke"
 
 
+def _drop_present_data(prior_data, sdc_data, target_site):
+    """
+    Remove the statements and captions which are already present.
+
+    Statements are compared by their value, rank and qualifiers, see
+    canonical.statement_key(), so only those which are missing are kept.
+    Captions identical to the pre-existing ones are dropped silently while
+    those which differ are dropped as conflicts.
+
+    @param prior_data: the pre-existing Structured Data of the file
+    @param sdc_data: internally formatted, or compiled, Structured Data
+    @param target_site: pywikibot.Site object to which file should be uploaded
+    @return: dict of pids and caption languages removed from sdc_data due to
+        conflicts.
+    @raises: SdcException
+    """
+    present = {canonical.statement_key(statement)
+               for statements in prior_data['statements'].values()
+               for statement in statements}
+    for pid in [key for key in sdc_data.keys() if is_prop_key(key)]:
+        values = sdc_data[pid]
+        missing = []
+        for value in (values if isinstance(values, list) else [values]):
+            key = canonical.statement_key(
+                _statement_json(value, pid, target_site))
+            if key not in present:
+                # also drops any duplicates within the new data
+                present.add(key)
+                missing.append(value)
+        if missing:
+            sdc_data[pid] = missing
+        else:
+            sdc_data.pop(pid)
+
+    lang_clash = set()
+    captions = sdc_data.get('caption') or dict()
+    for lang in [lang for lang in captions if lang in prior_data['labels']]:
+        if prior_data['labels'][lang].get('value') != captions[lang]:
+            lang_clash.add(lang)
+        captions.pop(lang)
+
+    if (not any(is_prop_key(key) for key in sdc_data.keys())
+            and not sdc_data.get('caption')):
+        if lang_clash:
+            raise SdcException(
+                'warning', 'all conflicting pre-existing sdc-data',
+                ('Found pre-existing SDC data, no new non-conflicting '
+                 'data could be added. Found data: {}'.format(prior_data))
+            )
+        raise SdcException(
+            'warning', 'all sdc-data already present',
+            'All of the SDC data is already present, nothing was added.')
+    if lang_clash:
+        return {'pids': set(), 'langs': lang_clash}
+
+
+def _statement_json(value, prop, target_site):
+    """
+    Return the json of a statement of internally formatted or compiled data.
+
+    @param value: str|dict The internally formatted claim value, or the
+        compiled statement
+    @param prop: str Property of the claim
+    @param target_site: pywikibot.Site to which Structured Data is uploaded
+    @return: dict
+    """
+    if isinstance(value, dict) and 'mainsnak' in value:
+        return value
+    return make_claim_json(value, prop, target_site)
+
+
 def format_sdc_payload(target_site, data):
     """
     Translate from internal sdc data format to that expected by MediaWiki.
@@ -273,11 +864,11 @@ def format_sdc_payload(target_site, data):
         for prop, value in prop_data.items():
             if isinstance(value, list):
                 for v in value:
-                    claim = make_claim(v, prop, target_site)
-                    payload['claims'].append(claim.toJSON())
+                    payload['claims'].append(
+                        make_claim_json(v, prop, target_site))
             else:
-                claim = make_claim(value, prop, target_site)
-                payload['claims'].append(claim.toJSON())
+                payload['claims'].append(
+                    make_claim_json(value, prop, target_site))
 
     # raise error if no recognisable sdc data is found
     if not payload:
@@ -288,6 +879,64 @@ def format_sdc_payload(target_site, data):
     return payload
 
 
+def format_compiled_payload(data):
+    """
+    Return the payload of Structured Data compiled by compile_sdc_data().
+
+    @param data: the compiled sdc data, from which conflicting properties and
+        caption languages may have been removed.
+    @return: dict formated sdc data payload
+    @raises: ValueError
+    """
+    payload = dict()
+    if data.get('caption'):
+        payload['labels'] = dict()
+        for k, v in data['caption'].items():
+            payload['labels'][k] = {'language': k, 'value': v}
+
+    claims = []
+    for key, value in data.items():
+        if not is_prop_key(key):
+            continue
+        if not isinstance(value, list) or not all(
+                isinstance(claim, dict) and 'mainsnak' in claim
+                for claim in value):
+            raise ValueError(
+                'The value of {} is not a list of compiled statements'.format(
+                    key))
+        claims.extend(value)
+    if claims:
+        payload['claims'] = claims
+
+    if not payload:
+        raise ValueError(
+            'The provided sdc data contains no recognised labels: {}'.format(
+                ', '.join(data.keys())))
+    return payload
+
+
+def make_claim_json(value, prop, target_site):
+    """
+    Return the json of the claim created by make_claim().
+
+    The json is memoised in the shared ClaimCache, so that a claim repeated
+    across files is only built once.
+
+    @param value: str|dict The internally formatted claim value
+    @param prop: str Property of the claim
+    @param target_site: pywikibot.Site to which Structured Data is uploaded
+    @return: dict
+    @raises: ValueError
+    """
+    cache = get_claim_cache()
+    key = claim_key(target_site.data_repository(), prop, value)
+    claim = cache.get(key)
+    if claim is None:
+        claim = make_claim(value, prop, target_site).toJSON()
+        cache.put(key, claim)
+    return claim
+
+
 def make_claim(value, prop, target_site):
     """
     Create a pywikibot Claim representation of the internally formatted value.
@@ -299,7 +948,8 @@ def make_claim(value, prop, target_site):
     @raises: ValueError
     """
     repo = target_site.data_repository()
-    claim = pywikibot.Claim(repo, prop)
+    claim = pywikibot.Claim(
+        repo, prop, datatype=get_datatype_cache().get(repo, prop))
     if common.is_str(value):
         _set_claim_target(claim, value)
     elif isinstance(value, dict):
@@ -362,7 +1012,9 @@ def format_qualifier_claim_value(value, prop, claim):
         if isinstance(value, dict) and '_' in value:
             value = value.get('_')
 
-        qual_claim = pywikibot.Claim(claim.repo, prop)
+        qual_claim = pywikibot.Claim(
+            claim.repo, prop,
+            datatype=get_datatype_cache().get(claim.repo, prop))
         _set_claim_target(qual_claim, value)
         return qual_claim
     else:
@@ -392,7 +1044,11 @@ def format_claim_value(claim, value):
     @return: pywikibot representation of the claim value
     """
     repo = claim.repo
-    if claim.type == 'wikibase-item':
+    if claim.type in INTERNED_DATATYPES:
+        return get_value_cache().intern(
+            value_key(claim.type, value, (repo.family.name, repo.code)),
+            lambda: _parse_interned_value(claim.type, value, repo))
+    elif claim.type == 'wikibase-item':
         return pywikibot.ItemPage(repo, value)
     elif claim.type == 'commonsMedia':
         return pywikibot.FilePage(_get_commons(), value)
@@ -402,14 +1058,26 @@ def format_claim_value(claim, value):
     elif claim.type == 'tabular-data':
         return pywikibot.WbTabularData(
             pywikibot.Page(repo.tabular_data_repository(), value))
-    elif claim.type == 'monolingualtext':
+
+    # simple strings
+    return value
+
+
+def _parse_interned_value(datatype, value, repo):
+    """
+    Parse a value of one of the INTERNED_DATATYPES, see format_claim_value.
+
+    The returned object is shared by every claim with the same value and so
+    must not be modified.
+    """
+    if datatype == 'monolingualtext':
         if common.is_str(value):
             text, _, lang = value.partition('@')
             value = {'text': text, 'lang': lang}
 
         return pywikibot.WbMonolingualText(
             value.get('text'), value.get('lang'))
-    elif claim.type == 'globe-coordinate':
+    elif datatype == 'globe-coordinate':
         if common.is_str(value):
             parts = value.replace(',', '@').split('@')
             value = {parts[1]: parts[0], parts[3]: parts[2]}
@@ -422,7 +1090,7 @@ def format_claim_value(claim, value):
             float(value.get('lat')),
             float(value.get('lon')),
             precision=precision)
-    elif claim.type == 'quantity':
+    elif datatype == 'quantity':
         if common.is_str(value):
             amount, _, unit = value.partition('@')
             value = {'amount': amount, 'unit': unit}
@@ -433,14 +1101,31 @@ def format_claim_value(claim, value):
                 pywikibot.ItemPage(repo, value.get('unit')),
                 site=repo)
         return pywikibot.WbQuantity(value.get('amount'), site=repo)
-    elif claim.type == 'time':
-        # note that Wikidata only supports precision down to day
-        # as a result pywikibot.WbTime.fromTimestr will produce an incompatible
-        # result for a fully qualified timestamp/timestr
-        return iso_to_wbtime(value)
 
-    # simple strings
-    return value
+    # time, note that Wikidata only supports precision down to day
+    # as a result pywikibot.WbTime.fromTimestr will produce an incompatible
+    # result for a fully qualified timestamp/timestr
+    return iso_to_wbtime(value)
+
+
+def get_property_ids(sdc_data):
+    """
+    Return all of the property ids used in the Structured Data.
+
+    This includes the properties used for qualifiers.
+
+    @param sdc_data: internally formatted Structured Data in json format
+    @return: set of property ids
+    """
+    pids = set()
+    for prop, value in sdc_data.items():
+        if not is_prop_key(prop):
+            continue
+        pids.add(prop)
+        for v in (value if isinstance(value, list) else [value]):
+            if isinstance(v, dict):
+                pids.update(key for key in v.keys() if is_prop_key(key))
+    return pids
 
 
 def is_prop_key(key):
@@ -473,31 +1158,32 @@ def iso_to_wbtime(date):
     @return: The converted result
     @rtype: pywikibot.WbTime
     """
+    year, month, day = parse_iso_date(date)
+    return pywikibot.WbTime(year=year, month=month, day=day)
+
+
+def parse_iso_date(date):
+    """
+    Split an ISO date string into its year, month and day.
+
+    Any time part is discarded. Missing parts, or parts given as zero, are
+    returned as None.
+
+    @param date: An ISO date string, e.g. 1922-09-17Z or 2014-07-11T08:14:46Z
+    @return: (year, month, day) tuple of int|None
+    @raises: ValueError
+    """
     date = date[:len('YYYY-MM-DD')].split('-')
     if len(date) == 3 and all(common.is_int(x) for x in date):
         # 1921-09-17Z or 2014-07-11T08:14:46Z
-        d = int(date[2])
-        if d == 0:
-            d = None
-        m = int(date[1])
-        if m == 0:
-            m = None
-        return pywikibot.WbTime(
-            year=int(date[0]),
-            month=m,
-            day=d)
+        return int(date[0]), int(date[1]) or None, int(date[2]) or None
     elif len(date) == 1 and common.is_int(date[0][:len('YYYY')]):
         # 1921Z
-        return pywikibot.WbTime(year=int(date[0][:len('YYYY')]))
+        return int(date[0][:len('YYYY')]), None, None
     elif (len(date) == 2
             and all(common.is_int(x) for x in (date[0], date[1][:len('MM')]))):
         # 1921-09Z
-        m = int(date[1][:len('MM')])
-        if m == 0:
-            m = None
-        return pywikibot.WbTime(
-            year=int(date[0]),
-            month=m)
+        return int(date[0]), int(date[1][:len('MM')]) or None, None
 
     # once here all interpretations have failed
     raise ValueError(
@@ -0,0 +1,229 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Adaptive control of the edit rate and the number of concurrent edits.
+
+The controller paces edits and limits how many are in flight at once. Both
+limits are adjusted AIMD-style: every successful edit raises them a little,
+while any sign of the wiki being overloaded (a maxlag or ratelimited error
+or a Retry-After header) halves them and pauses all edits for the requested
+time. Over time this settles close to the highest sustainable rate.
+
+The signals are taken from every response received through pywikibot, so
+they are seen even when pywikibot itself waits and retries the request.
+"""
+from __future__ import unicode_literals
+
+import json
+import math
+import threading
+import time
+from builtins import dict
+
+import pywikibot
+
+import pywikibotsdc.http_hooks as http_hooks
+
+DEFAULT_START_RATE = 1.0  # edits per second
+DEFAULT_MIN_RATE = 0.05
+DEFAULT_MAX_RATE = 10.0
+# rate increase per second of successful edits, in edits per second
+RATE_INCREASE = 0.1
+# factor by which the rate and concurrency are cut when throttled
+DECREASE_FACTOR = 0.5
+# successful edits needed before allowing one more concurrent edit
+CONCURRENCY_STEP = 20
+# signals within this many seconds of a decrease only extend the backoff
+DECREASE_INTERVAL = 5.0
+# pause when throttled without a Retry-After header, in seconds
+DEFAULT_BACKOFF = 5.0
+# API error codes asking for fewer requests
+THROTTLE_CODES = ('maxlag', 'ratelimited')
+
+
+class ThroughputController(object):
+    """
+    Thread safe AIMD controller of the edit rate and concurrency.
+
+    Wrap every edit in edit_slot() and call start() to begin watching the
+    responses of the wiki.
+    """
+
+    def __init__(self, max_concurrency=1, start_rate=DEFAULT_START_RATE,
+                 min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE):
+        """
+        Initializer.
+
+        @param max_concurrency: maximum number of concurrent edits, normally
+            the number of workers.
+        @param start_rate: initial edit rate, in edits per second
+        @param min_rate: lowest edit rate, in edits per second
+        @param max_rate: highest edit rate, in edits per second
+        """
+        self.max_concurrency = max_concurrency
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(start_rate, min_rate), max_rate)
+        self.concurrency = 1
+        self.active = 0
+        self.edits = 0
+        self.throttled = dict()
+        self.last_lag = None
+        self._successes = 0
+        self._next_slot = 0.0
+        self._backoff_until = 0.0
+        self._last_decrease = None
+        self._condition = threading.Condition()
+
+    def start(self):
+        """Start watching all responses received through pywikibot."""
+        http_hooks.add_observer(self.observe)
+
+    def stop(self):
+        """Stop watching the responses."""
+        http_hooks.remove_observer(self.observe)
+
+    def acquire(self):
+        """Wait until another edit may be made, then reserve it."""
+        with self._condition:
+            while True:
+                now = time.time()
+                wait = max(self._next_slot, self._backoff_until) - now
+                if wait <= 0 and self.active < self.concurrency:
+                    break
+                self._condition.wait(wait if wait > 0 else None)
+            self.active += 1
+            self._next_slot = max(now, self._next_slot) + 1.0 / self.rate
+
+    def release(self, success=True):
+        """
+        Free a reserved edit, increasing the limits if it was successful.
+
+        @param success: if the edit succeeded
+        """
+        with self._condition:
+            self.active -= 1
+            if success:
+                self.edits += 1
+                self._increase()
+            self._condition.notify_all()
+
+    def edit_slot(self):
+        """Return a context manager reserving an edit for its duration."""
+        return _EditSlot(self)
+
+    def _increase(self):
+        """Additively increase the rate and, every few edits, concurrency."""
+        # dividing by the rate makes the increase per second constant
+        self.rate = min(self.max_rate, self.rate + RATE_INCREASE / self.rate)
+        self._successes += 1
+        if (self._successes >= CONCURRENCY_STEP
+                and self.concurrency < self.max_concurrency):
+            self.concurrency += 1
+            self._successes = 0
+
+    def throttle(self, reason, retry_after=None, lag=None):
+        """
+        Back off after the wiki asked for fewer edits.
+
+        The rate and concurrency are only cut once per DECREASE_INTERVAL but
+        every signal may extend the pause of all edits.
+
+        @param reason: what caused the throttling, e.g. "maxlag"
+        @param retry_after: seconds to pause for, if requested by the wiki
+        @param lag: reported replication lag, in seconds
+        """
+        with self._condition:
+            now = time.time()
+            self.throttled[reason] = self.throttled.get(reason, 0) + 1
+            if lag is not None:
+                self.last_lag = lag
+            pause = retry_after if retry_after is not None else DEFAULT_BACKOFF
+            self._backoff_until = max(self._backoff_until, now + pause)
+            if (self._last_decrease is None
+                    or now - self._last_decrease >= DECREASE_INTERVAL):
+                self._last_decrease = now
+                self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+                self.concurrency = max(
+                    1, int(math.ceil(self.concurrency * DECREASE_FACTOR)))
+                self._successes = 0
+                pywikibot.log(
+                    'Throttled by {0}, reducing to {1}'.format(
+                        reason, self.status()))
+            self._condition.notify_all()
+
+    def observe(self, uri, kwargs, response):
+        """
+        Look for throttling signals in a response.
+
+        @param uri: the requested uri
+        @param kwargs: the keyword arguments of the request
+        @param response: the response
+        """
+        headers = getattr(response, 'headers', None) or dict()
+        retry_after = _to_float(headers.get('retry-after'))
+        lag = _to_float(headers.get('x-database-lag'))
+        code = _error_code(getattr(response, 'content', None))
+        if code in THROTTLE_CODES:
+            self.throttle(code, retry_after, lag)
+        elif retry_after:
+            self.throttle('retry-after', retry_after, lag)
+
+    def status(self):
+        """Return a one line description of the current state."""
+        with self._condition:
+            backoff = max(0.0, self._backoff_until - time.time())
+            text = ('{0:.2f} edits/s, {1}/{2} concurrent edits, '
+                    '{3} edits'.format(self.rate, self.concurrency,
+                                       self.max_concurrency, self.edits))
+            if backoff:
+                text += ', backing off for {0:.1f}s'.format(backoff)
+            if self.throttled:
+                text += ', throttled by ' + ', '.join(
+                    '{0} x{1}'.format(reason, count)
+                    for reason, count in sorted(self.throttled.items()))
+            if self.last_lag is not None:
+                text += ', last lag {0:g}s'.format(self.last_lag)
+            return text
+
+
+class _EditSlot(object):
+    """Context manager reserving an edit from a ThroughputController."""
+
+    def __init__(self, controller):
+        self.controller = controller
+
+    def __enter__(self):
+        self.controller.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.controller.release(success=exc_type is None)
+        return False
+
+
+def _error_code(content):
+    """Return the API error code of a response body, if any."""
+    if not content:
+        return None
+    if isinstance(content, bytes):
+        # only error responses need to be parsed
+        if b'"error"' not in content:
+            return None
+        content = content.decode('utf-8', 'replace')
+    elif '"error"' not in content:
+        return None
+    try:
+        error = json.loads(content).get('error')
+    except (ValueError, AttributeError):
+        return None
+    if isinstance(error, dict):
+        return error.get('code')
+
+
+def _to_float(value):
+    """Return a header value as a float, or None if missing or invalid."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
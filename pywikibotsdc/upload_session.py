@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Edit token and user rights shared by all uploads to a site.
+
+Rather than looking up the csrf token and the user rights for every file
+they are fetched once per session and shared by all files and threads. The
+token is only refetched if the API rejects it as a badtoken.
+
+A session may also hold a ThroughputController pacing all of its edits, and a
+PurgeQueue to which null edits are deferred. It holds the RetryPolicy applied
+to any edit which fails.
+"""
+from __future__ import unicode_literals
+
+import threading
+from builtins import dict
+
+import pywikibot
+
+from pywikibotsdc.retry import RetryPolicy
+
+# times an edit is retried with a refetched token after a badtoken error
+MAX_BADTOKEN_RETRIES = 2
+
+
+class _NoSlot(object):
+    """Context manager doing nothing, used when edits are not paced."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NO_SLOT = _NoSlot()
+
+
+class UploadSession(object):
+    """Cached csrf token and user rights of a site."""
+
+    def __init__(self, target_site, max_badtoken_retries=MAX_BADTOKEN_RETRIES,
+                 controller=None, retry_policy=None, purge_queue=None):
+        """
+        Initializer.
+
+        @param target_site: pywikibot.Site to which edits are made
+        @param max_badtoken_retries: times an edit is retried with a new token
+            if the token is rejected.
+        @param controller: ThroughputController pacing the edits, if any
+        @param retry_policy: RetryPolicy of edits which fail, defaults to a
+            RetryPolicy with the default settings.
+        @param purge_queue: PurgeQueue to which null edits are deferred. If not
+            provided null edits are made right after each upload.
+        """
+        self.site = target_site
+        self.max_badtoken_retries = max_badtoken_retries
+        self.controller = controller
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.purge_queue = purge_queue
+        self._token = None
+        self._rights = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def token(self):
+        """Return the csrf token, fetching it if needed."""
+        with self._lock:
+            if self._token is None:
+                self._token = self.site.tokens['csrf']
+            return self._token
+
+    def has_right(self, right):
+        """Return if the user has the given right, looking it up only once."""
+        with self._lock:
+            if right not in self._rights:
+                self._rights[right] = self.site.has_right(right)
+            return self._rights[right]
+
+    @property
+    def bot(self):
+        """Return if edits should be flagged as bot edits."""
+        return self.has_right('bot')
+
+    def edit_slot(self):
+        """Return a context manager to wrap each edit in."""
+        if self.controller is None:
+            return _NO_SLOT
+        return self.controller.edit_slot()
+
+    def invalidate_token(self, bad_token):
+        """
+        Refetch the csrf token after it was rejected.
+
+        Threads which were rejected for the same token share a single
+        refetch.
+
+        @param bad_token: the token which was rejected
+        """
+        with self._lock:
+            if self._token != bad_token:
+                # already refetched by another thread
+                return
+            pywikibot.log('The csrf token was rejected, fetching a new one.')
+            self.site.tokens.load_tokens(['csrf'])
+            self._token = self.site.tokens['csrf']
+
+    def with_token(self, func):
+        """
+        Call func with the csrf token, retrying with a new token on badtoken.
+
+        @param func: callable taking the token as its only argument
+        @return: the return value of func
+        @raises: pywikibot.data.api.APIError
+        """
+        attempt = 0
+        while True:
+            token = self.token
+            try:
+                return func(token)
+            except pywikibot.data.api.APIError as error:
+                if (error.code != 'badtoken'
+                        or attempt >= self.max_badtoken_retries):
+                    raise
+            attempt += 1
+            self.invalidate_token(token)
@@ -0,0 +1,316 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Offline validation of Structured Data against the documented in-data format.
+
+Validating needs neither the network nor any pywikibot objects, so a whole
+dataset can be checked before a single file is looked up. Every error is
+reported, together with the path to the offending value, rather than
+stopping at the first one.
+
+The values of a property can only be fully checked if its datatype is known.
+For properties missing from the datatype table only the structure of the
+claims is checked.
+"""
+from __future__ import unicode_literals
+
+import re
+from builtins import dict
+
+import pywikibotsdc.common as common
+
+# the special values allowed for any datatype
+SPECIAL_VALUES = ('_some_value_', '_no_value_')
+# datatypes for which the value is used as is
+STRING_TYPES = ('string', 'url', 'math', 'external-id', 'musical-notation')
+# required filetype-like ending of data pages per datatype
+DATA_PAGE_ENDINGS = {'geo-shape': '.map', 'tabular-data': '.tab'}
+# datatypes which may be given as a dict rather than a string
+DICT_TYPES = ('monolingualtext', 'globe-coordinate', 'quantity')
+
+# the same properties as accepted by sdc_upload.is_prop_key()
+_PROP_KEY = re.compile(r'P0*[1-9]\d*\Z')
+# keys which were probably meant as properties
+_PROP_LIKE_KEY = re.compile(r'[Pp]\s*[-+]?\d')
+_ITEM_ID = re.compile(r'\s*[Qq][1-9]\d*\s*\Z')
+# the dates accepted by sdc_upload.parse_iso_date(), e.g. 2014-07-11T08:14Z
+_DATE = re.compile(
+    r'(\d{1,4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?(?:T[\d:.]*)?Z?\Z')
+_COORDINATE = re.compile(r'[+-]?\d+(?:\.\d+)?\Z')
+_COORDINATE_PAIR = re.compile(r'([^@,]*)@([^@,]*),([^@,]*)@([^@,]*)\Z')
+_AMOUNT = re.compile(
+    r'[+-]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?\Z')
+_LANGUAGE = re.compile(r'[a-z][a-z0-9]*(?:-[a-z0-9]+)*\Z')
+_TITLE_ILLEGAL_CHARS = re.compile(r'[#<>\[\]|{}]')
+
+
+def validate_sdc_data(sdc_data, datatypes=None):
+    """
+    Return all of the errors in the Structured Data of a single file.
+
+    @param sdc_data: internally formatted Structured Data in json format
+    @param datatypes: dict of property id to datatype, e.g. from
+        wikibase_json.get_datatype_table(). A datatype of None marks a
+        property which does not exist.
+    @return: list of (path, message) tuples, empty if the data is valid. The
+        path is e.g. "P180[1].P580" for the second claim of P180's qualifier.
+    """
+    errors = []
+    if not isinstance(sdc_data, dict):
+        errors.append(('', 'the data must be an object, not {}'.format(
+            _type_name(sdc_data))))
+        return errors
+    datatypes = datatypes or dict()
+
+    has_data = False
+    for key, value in sdc_data.items():
+        if key == 'caption':
+            has_data = _check_caption(value, errors) or has_data
+        elif key == 'edit_summary':
+            _check_summary(value, errors)
+        elif common.is_str(key) and _PROP_KEY.match(key):
+            has_data = True
+            _check_claims(value, key, datatypes, errors)
+        elif common.is_str(key) and _PROP_LIKE_KEY.match(key):
+            errors.append((key, 'not a valid property id'))
+
+    if not has_data:
+        errors.append(('', 'contains neither a caption nor any claims'))
+    return errors
+
+
+def validate_batch_sdc_data(file_data, datatypes=None):
+    """
+    Validate the Structured Data of many files.
+
+    The input is consumed lazily so it may be a generator over a very large
+    dataset.
+
+    @param file_data: iterable of (file_name, sdc_data) tuples
+    @param datatypes: dict of property id to datatype, see
+        validate_sdc_data()
+    @return: generator of (file_name, errors) tuples, only for the files with
+        any errors, where errors is as returned by validate_sdc_data().
+    """
+    for file_name, sdc_data in file_data:
+        errors = validate_sdc_data(sdc_data, datatypes)
+        if errors:
+            yield file_name, errors
+
+
+def _type_name(value):
+    """Return the json name of the type of a value."""
+    if common.is_str(value):
+        return 'a string'
+    elif isinstance(value, dict):
+        return 'an object'
+    elif isinstance(value, list):
+        return 'a list'
+    elif isinstance(value, bool):
+        return 'a boolean'
+    elif value is None:
+        return 'null'
+    return 'a number'
+
+
+def _check_caption(captions, errors):
+    """Check the captions, returning if there are any."""
+    if not isinstance(captions, dict):
+        errors.append(('caption', 'must be an object, not {}'.format(
+            _type_name(captions))))
+        return False
+    for lang, caption in captions.items():
+        path = 'caption.{}'.format(lang)
+        if not _LANGUAGE.match(lang):
+            errors.append((path, 'not a valid language code'))
+        if not common.is_str(caption) or not caption.strip():
+            errors.append((path, 'must be a non-empty string'))
+    return bool(captions)
+
+
+def _check_summary(summary, errors):
+    """Check that the edit summary is a string only using {count}."""
+    if not common.is_str(summary):
+        errors.append(('edit_summary', 'must be a string, not {}'.format(
+            _type_name(summary))))
+        return
+    try:
+        summary.format(count=0)
+    except (IndexError, KeyError, ValueError) as error:
+        errors.append((
+            'edit_summary',
+            'may only use the {{count}} placeholder: {}'.format(error)))
+
+
+def _check_claims(value, prop, datatypes, errors):
+    """Check the value of a property, in any of the claim formats."""
+    if prop in datatypes and datatypes[prop] is None:
+        errors.append((prop, 'the property does not exist'))
+    if isinstance(value, list):
+        if not value:
+            errors.append((prop, 'the list of claims is empty'))
+        for i, claim in enumerate(value):
+            _check_claim(
+                claim, prop, '{0}[{1}]'.format(prop, i), datatypes, errors)
+    else:
+        _check_claim(value, prop, prop, datatypes, errors)
+
+
+def _check_claim(value, prop, path, datatypes, errors):
+    """Check a single claim, in the simple or complex claim format."""
+    if common.is_str(value):
+        _check_value(value, datatypes.get(prop), path, errors)
+    elif isinstance(value, dict):
+        if '_' not in value:
+            errors.append((path, 'a complex claim must have a "_" value'))
+        else:
+            _check_value(
+                value['_'], datatypes.get(prop), path + '._', errors)
+        if not isinstance(value.get('prominent', False), bool):
+            errors.append((path + '.prominent', 'must be true or false'))
+        for key, qualifier in value.items():
+            if not common.is_str(key):
+                continue
+            if _PROP_KEY.match(key):
+                _check_qualifiers(
+                    qualifier, key, '{0}.{1}'.format(path, key), datatypes,
+                    errors)
+            elif _PROP_LIKE_KEY.match(key):
+                errors.append((
+                    '{0}.{1}'.format(path, key), 'not a valid property id'))
+    else:
+        errors.append((path, 'a claim must be a string or an object, not '
+                             '{}'.format(_type_name(value))))
+
+
+def _check_qualifiers(value, prop, path, datatypes, errors):
+    """Check the value of a qualifier property, in any claim format."""
+    if prop in datatypes and datatypes[prop] is None:
+        errors.append((path, 'the property does not exist'))
+    if isinstance(value, list):
+        if not value:
+            errors.append((path, 'the list of qualifiers is empty'))
+        for i, qualifier in enumerate(value):
+            _check_qualifier(
+                qualifier, prop, '{0}[{1}]'.format(path, i), datatypes,
+                errors)
+    else:
+        _check_qualifier(value, prop, path, datatypes, errors)
+
+
+def _check_qualifier(value, prop, path, datatypes, errors):
+    """Check a single qualifier, with its value given directly or as "_"."""
+    if isinstance(value, dict) and '_' in value:
+        value = value['_']
+        path += '._'
+    if not (common.is_str(value) or isinstance(value, dict)):
+        errors.append((path, 'a qualifier must be a string or an object, not '
+                             '{}'.format(_type_name(value))))
+        return
+    _check_value(value, datatypes.get(prop), path, errors)
+
+
+def _check_value(value, datatype, path, errors):
+    """Check a value against its datatype, if known."""
+    if common.is_str(value):
+        if value in SPECIAL_VALUES:
+            return
+    elif not isinstance(value, dict):
+        errors.append((path, 'a value must be a string or an object, not '
+                             '{}'.format(_type_name(value))))
+        return
+    elif datatype and datatype not in DICT_TYPES:
+        errors.append((path, 'a {} value must be a string'.format(datatype)))
+        return
+
+    if not datatype:
+        return
+    message = None
+    if datatype == 'wikibase-item':
+        if not _ITEM_ID.match(value):
+            message = 'not a valid item id'
+    elif datatype == 'time':
+        message = _date_error(value)
+    elif datatype == 'globe-coordinate':
+        message = _coordinate_error(value)
+    elif datatype == 'quantity':
+        message = _quantity_error(value)
+    elif datatype == 'monolingualtext':
+        message = _monolingual_error(value)
+    elif datatype == 'commonsMedia':
+        if not value.strip() or _TITLE_ILLEGAL_CHARS.search(value):
+            message = 'not a valid file name'
+    elif datatype in DATA_PAGE_ENDINGS:
+        message = _data_page_error(value, DATA_PAGE_ENDINGS[datatype])
+    elif datatype not in STRING_TYPES:
+        message = 'the {} datatype is not supported'.format(datatype)
+    if message:
+        errors.append((path, '{0}: {1!r}'.format(message, value)))
+
+
+def _date_error(value):
+    """Return why a date string is invalid, or None."""
+    match = _DATE.match(value)
+    if not match:
+        return 'not a valid ISO date'
+    _, month, day = match.groups()
+    if month and int(month) > 12:
+        return 'not a valid month'
+    if day and int(day) > 31:
+        return 'not a valid day'
+
+
+def _coordinate_error(value):
+    """Return why a coordinate is invalid, or None."""
+    if common.is_str(value):
+        match = _COORDINATE_PAIR.match(value)
+        if not match:
+            return ('a coordinate must be given as '
+                    '"lat_value@lat,lon_value@lon"')
+        first, first_key, second, second_key = match.groups()
+        if {first_key, second_key} != {'lat', 'lon'}:
+            return 'a coordinate must have one "lat" and one "lon" value'
+        value = {first_key: first, second_key: second}
+    for key in ('lat', 'lon'):
+        number = value.get(key)
+        if not common.is_str(number) or not _COORDINATE.match(number):
+            return 'the {} must be a decimal number given as a string'.format(
+                key)
+    if abs(float(value['lat'])) > 90:
+        return 'the latitude must be between -90 and 90'
+
+
+def _quantity_error(value):
+    """Return why a quantity is invalid, or None."""
+    if common.is_str(value):
+        amount, _, unit = value.partition('@')
+    else:
+        amount, unit = value.get('amount'), value.get('unit')
+    if isinstance(amount, bool) or not (
+            isinstance(amount, (int, float))
+            or common.is_str(amount) and _AMOUNT.match(amount)):
+        return 'not a valid amount'
+    if unit and not (common.is_str(unit) and _ITEM_ID.match(unit)):
+        return 'the unit must be an item id'
+
+
+def _monolingual_error(value):
+    """Return why a monolingual text is invalid, or None."""
+    if common.is_str(value):
+        text, _, lang = value.partition('@')
+    else:
+        text, lang = value.get('text'), value.get('lang')
+    if not common.is_str(text) or not text:
+        return 'the text cannot be empty'
+    if not common.is_str(lang) or not _LANGUAGE.match(lang):
+        return 'not a valid language code'
+
+
+def _data_page_error(value, ending):
+    """Return why the title of a data page is invalid, or None."""
+    namespace, colon, title = value.partition(':')
+    if (not colon or namespace.strip().lower() != 'data'
+            or not title.strip().endswith(ending)
+            or _TITLE_ILLEGAL_CHARS.search(title)):
+        return "the page must be in the 'Data:' namespace and end in " \
+               "'{}'".format(ending)
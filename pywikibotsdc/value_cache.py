@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Bounded in-memory interning of parsed claim values, shared by all files.
+
+Dates, coordinates, quantities and monolingual texts repeat heavily across
+the files of a batch, also where the claims they are part of differ. Rather
+than re-parsing the same strings into new objects for every claim, the
+parsed value, be it a pywikibot object or its json, is interned per datatype,
+context (e.g. the data repository) and canonical form of the internally
+formatted value. The least recently used values are evicted once the cache is
+full.
+
+Interned pywikibot objects are shared by every claim using the value and so
+must never be modified. Interned json is returned as a shallow copy.
+"""
+from __future__ import unicode_literals
+
+import json
+import threading
+from builtins import dict
+from collections import OrderedDict
+
+import pywikibotsdc.common as common
+
+DEFAULT_MAXSIZE = 10000
+# the datatypes whose values are worth parsing only once
+INTERNED_DATATYPES = (
+    'time', 'globe-coordinate', 'quantity', 'monolingualtext')
+
+_VALUE_CACHE = None
+
+
+def get_value_cache():
+    """Return the shared ValueCache."""
+    global _VALUE_CACHE
+    if not _VALUE_CACHE:
+        _VALUE_CACHE = ValueCache()
+    return _VALUE_CACHE
+
+
+def value_key(datatype, value, context=None):
+    """
+    Return the cache key of a value.
+
+    @param datatype: the datatype of the property
+    @param value: str|dict The internally formatted value
+    @param context: hashable describing anything else the parsed value
+        depends on, e.g. the data repository
+    @return: hashable tuple
+    """
+    if not common.is_str(value):
+        value = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return context, datatype, value
+
+
+class ValueCache(object):
+    """Thread safe LRU cache of parsed values."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        """
+        Initializer.
+
+        @param maxsize: maximum number of values held
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of values held."""
+        return len(self._data)
+
+    def intern(self, key, parse):
+        """
+        Return the interned value, parsing and adding it if missing.
+
+        Values which fail to parse are not cached, the exception is raised
+        each time they are looked up.
+
+        @param key: the key of the value, see value_key()
+        @param parse: callable without arguments returning the parsed value
+        @return: the parsed value, a shallow copy if it is a dict
+        @raises: any exception raised by parse
+        """
+        with self._lock:
+            value = self._data.pop(key, None)
+            if value is not None:
+                # reinsert as the most recently used
+                self._data[key] = value
+                self.hits += 1
+            else:
+                self.misses += 1
+        if value is None:
+            # parse outside of the lock, a value parsed by two threads at
+            # once is simply added twice
+            value = parse()
+            with self._lock:
+                self._data[key] = value
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        if isinstance(value, dict):
+            return dict(value)
+        return value
+
+    def clear(self):
+        """Remove all values and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Return the size and hit/miss/eviction counters as a dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': float(self.hits) / lookups if lookups else None,
+            }
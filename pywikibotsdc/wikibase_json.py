@@ -0,0 +1,543 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Compile Structured Data straight to the json expected by wbeditentity.
+
+This produces exactly the same payload as format_sdc_payload but without
+building any pywikibot Claim, page or Wikibase value objects. Everything the
+compiler needs to know about the data repository is passed in explicitly,
+as a table of property datatypes and a RepoInfo, so compiling never touches
+the network and both can be pickled.
+
+Unlike the pywikibot objects, the compiler does not verify that the pages
+referred to by geo-shape and tabular-data values exist.
+"""
+from __future__ import unicode_literals
+
+import re
+from builtins import dict
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from pywikibot.tools import first_upper
+
+import pywikibotsdc.common as common
+import pywikibotsdc.metrics as metrics
+from pywikibotsdc.datatype_cache import get_datatype_cache
+from pywikibotsdc.sdc_exception import SdcException
+from pywikibotsdc.sdc_upload import (
+    _get_commons,
+    coord_precision,
+    get_property_ids,
+    is_prop_key,
+    parse_iso_date
+)
+from pywikibotsdc.value_cache import (
+    INTERNED_DATATYPES,
+    get_value_cache,
+    value_key
+)
+
+# type of the datavalue, for datatypes where this differs from the datatype
+VALUE_TYPES = {
+    'wikibase-item': 'wikibase-entityid',
+    'commonsMedia': 'string',
+    'url': 'string',
+    'globe-coordinate': 'globecoordinate',
+    'math': 'string',
+    'external-id': 'string',
+    'geo-shape': 'string',
+    'tabular-data': 'string',
+    'musical-notation': 'string',
+}
+# datatypes for which the value is used as is
+STRING_TYPES = ('string', 'url', 'math', 'external-id', 'musical-notation')
+# required filetype-like ending of data pages per datatype
+DATA_PAGE_ENDINGS = {'geo-shape': '.map', 'tabular-data': '.tab'}
+FILE_NAMESPACES = ('file', 'image')
+WBTIME_FORMAT = '{0:+012d}-{1:02d}-{2:02d}T00:00:00Z'
+WBTIME_PRECISION = {'year': 9, 'month': 10, 'day': 11}
+# Mediawiki requires error bounds for quantities on older versions
+MW_VERSION_OPTIONAL_BOUNDS = '1.29.0-wmf.2'
+
+# number of files for which property datatypes are looked up at the time
+COMPILE_BATCH_SIZE = 500
+# number of files compiled per task when compiling in several processes
+COMPILE_CHUNK_SIZE = 50
+
+_ITEM_ID = re.compile(r'^[Qq]([1-9]\d*)$')
+_TITLE_WHITESPACE = re.compile(
+    '[ _\u00a0\u1680\u180e\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]+')
+_TITLE_DIRECTION_MARKS = re.compile('[\u200e\u200f\u202a-\u202e]')
+_TITLE_ILLEGAL_CHARS = re.compile(r'[#<>\[\]|{}]')
+
+
+class RepoInfo(object):
+    """The properties of a data repository which end up in the json."""
+
+    def __init__(self, calendarmodel, concept_base_uri, globe,
+                 require_bounds=False):
+        """
+        Initializer.
+
+        @param calendarmodel: uri of the calendar model used for dates
+        @param concept_base_uri: base uri of the entities in the repository
+        @param globe: uri of the globe used for coordinates
+        @param require_bounds: if quantities must be given with error bounds
+        """
+        self.calendarmodel = calendarmodel
+        self.concept_base_uri = concept_base_uri
+        self.globe = globe
+        self.require_bounds = require_bounds
+
+    @classmethod
+    def from_site(cls, target_site):
+        """
+        Create the RepoInfo for the data repository of a site.
+
+        @param target_site: pywikibot.Site to which Structured Data is uploaded
+        @return: RepoInfo
+        """
+        repo = target_site.data_repository()
+        return cls(
+            calendarmodel=repo.calendarmodel(),
+            concept_base_uri=repo.concept_base_uri,
+            globe=repo.globes()[repo.default_globe()],
+            require_bounds=repo.mw_version < MW_VERSION_OPTIONAL_BOUNDS)
+
+    def _key(self):
+        return (self.calendarmodel, self.concept_base_uri, self.globe,
+                self.require_bounds)
+
+    def __eq__(self, other):
+        """Compare by the properties of the data repository."""
+        return isinstance(other, RepoInfo) and self._key() == other._key()
+
+    def __ne__(self, other):
+        """Compare by the properties of the data repository."""
+        return not self == other
+
+    def __hash__(self):
+        """Hash by the properties of the data repository."""
+        return hash(self._key())
+
+    def __repr__(self):
+        """Return a more complete string representation."""
+        return 'RepoInfo({0!r}, {1!r}, {2!r}, {3!r})'.format(
+            self.calendarmodel, self.concept_base_uri, self.globe,
+            self.require_bounds)
+
+
+def get_datatype_table(target_site, sdc_data):
+    """
+    Return the datatypes of all properties used in the Structured Data.
+
+    @param target_site: pywikibot.Site to which Structured Data is uploaded
+    @param sdc_data: internally formatted Structured Data in json format
+    @return: dict of property id to datatype
+    """
+    return get_datatype_cache().table(
+        target_site.data_repository(), get_property_ids(sdc_data))
+
+
+def compile_sdc_payload(data, datatypes, repo_info):
+    """
+    Translate from internal sdc data format to that expected by MediaWiki.
+
+    The counterpart of format_sdc_payload. This takes no responsibility for
+    validating the passed in sdc data.
+
+    @param data: internally formatted sdc data.
+    @param datatypes: dict of property id to datatype, covering at least all
+        of the properties used in the data.
+    @param repo_info: RepoInfo of the data repository
+    @return: dict formated sdc data payload
+    @raises: ValueError
+    """
+    allowed_non_property_keys = ('caption', 'summary')
+    payload = dict()
+
+    if data.get('caption'):
+        payload['labels'] = dict()
+        for k, v in data['caption'].items():
+            payload['labels'][k] = {'language': k, 'value': v}
+
+    if set(data.keys()) - set(allowed_non_property_keys):
+        prop_data = {key: data[key] for key in data.keys() if is_prop_key(key)}
+        if prop_data:
+            payload['claims'] = []
+        for prop, value in prop_data.items():
+            for v in (value if isinstance(value, list) else [value]):
+                payload['claims'].append(
+                    compile_claim(v, prop, datatypes, repo_info))
+
+    # raise error if no recognisable sdc data is found
+    if not payload:
+        raise ValueError(
+            'The provided sdc data contains no recognised labels: {}'.format(
+                ', '.join(data.keys())))
+
+    return payload
+
+
+def compile_sdc_data(data, datatypes, repo_info):
+    """
+    Compile the statements of Structured Data while keeping its structure.
+
+    The result is in the internal format but with each property holding the
+    list of its compiled statements. Conflicts with pre-existing data can
+    therefore still be resolved per property and caption language before
+    the payload is built with format_compiled_payload().
+
+    @param data: internally formatted sdc data.
+    @param datatypes: dict of property id to datatype, covering at least all
+        of the properties used in the data.
+    @param repo_info: RepoInfo of the data repository
+    @return: dict of compiled sdc data
+    @raises: ValueError
+    """
+    compiled = dict()
+    for key, value in data.items():
+        if is_prop_key(key):
+            compiled[key] = [
+                compile_claim(v, key, datatypes, repo_info)
+                for v in (value if isinstance(value, list) else [value])]
+        elif key in ('caption', 'edit_summary'):
+            compiled[key] = value
+
+    # raise error if no recognisable sdc data is found
+    if not compiled.get('caption') and not any(
+            is_prop_key(key) for key in compiled):
+        raise ValueError(
+            'The provided sdc data contains no recognised labels: {}'.format(
+                ', '.join(data.keys())))
+    return compiled
+
+
+def compile_batch_sdc_data(file_data, target_site=None, summary=None,
+                           processes=1):
+    """
+    Compile the Structured Data of many files.
+
+    The property datatypes are looked up for COMPILE_BATCH_SIZE files at the
+    time, after which no further API calls are made. Neither edit rights nor
+    the Mids of the files are needed.
+
+    With several processes the files of each batch are compiled in a pool of
+    worker processes, COMPILE_CHUNK_SIZE files per task. The processes are
+    only given the datatype table of the batch and the RepoInfo, never any
+    pywikibot objects.
+
+    @param file_data: iterable of (file_name, sdc_data) tuples
+    @param target_site: pywikibot.Site to which Structured Data will be
+        uploaded. Defaults to Wikimedia Commons.
+    @param summary: edit summary to store with each file, replacing any
+        edit_summary in the sdc_data.
+    @param processes: number of worker processes to compile in. If 1 all
+        files are compiled in the current process.
+    @return: generator of (file_name, compiled sdc data, SdcException) tuples
+        where either the compiled data or the exception is None. These are
+        in the same order as the input.
+    @raises: ValueError
+    """
+    if processes < 1:
+        raise ValueError('At least one process is needed.')
+    target_site = target_site or _get_commons()
+    repo = target_site.data_repository()
+    repo_info = RepoInfo.from_site(target_site)
+    executor = None
+    if processes > 1:
+        executor = ProcessPoolExecutor(max_workers=processes)
+    try:
+        for batch in common.chunked(file_data, COMPILE_BATCH_SIZE):
+            with metrics.phase('datatypes'):
+                datatypes = get_datatype_cache().table(
+                    repo, {pid for _, sdc_data in batch
+                           for pid in get_property_ids(sdc_data)})
+            if executor:
+                futures = [
+                    executor.submit(
+                        _compile_chunk, chunk, datatypes, repo_info, summary)
+                    for chunk in common.chunked(batch, COMPILE_CHUNK_SIZE)]
+                results = (result for future in futures
+                           for result in future.result())
+            else:
+                results = _compile_chunk(batch, datatypes, repo_info, summary)
+            for file_name, compiled, error in results:
+                if error is not None:
+                    error = SdcException(
+                        'error', error,
+                        'Formatting SDC data failed: {0}'.format(error))
+                yield file_name, compiled, error
+    finally:
+        if executor:
+            executor.shutdown()
+
+
+def _compile_chunk(file_data, datatypes, repo_info, summary):
+    """
+    Compile the Structured Data of a few files, as a task of a worker.
+
+    @param file_data: list of (file_name, sdc_data) tuples
+    @param datatypes: dict of property id to datatype, covering at least all
+        of the properties used in the data.
+    @param repo_info: RepoInfo of the data repository
+    @param summary: edit summary to store with each file, if any
+    @return: list of (file_name, compiled sdc data, exception) tuples where
+        either the compiled data or the exception is None.
+    """
+    results = []
+    for file_name, sdc_data in file_data:
+        try:
+            with metrics.phase('format'):
+                compiled = compile_sdc_data(sdc_data, datatypes, repo_info)
+        except Exception as error:
+            results.append((file_name, None, error))
+            continue
+        if summary:
+            compiled['edit_summary'] = summary
+        results.append((file_name, compiled, None))
+    return results
+
+
+def compile_claim(value, prop, datatypes, repo_info):
+    """
+    Compile the json of a single statement.
+
+    The counterpart of make_claim(...).toJSON().
+
+    @param value: str|dict The internally formatted claim value
+    @param prop: str Property of the claim
+    @param datatypes: dict of property id to datatype
+    @param repo_info: RepoInfo of the data repository
+    @return: dict
+    @raises: ValueError
+    """
+    if common.is_str(value):
+        target = value
+    elif isinstance(value, dict):
+        target = value['_']
+    else:
+        raise ValueError(
+            'Incorrectly formatted property value: {}'.format(value))
+
+    claim = {
+        'mainsnak': compile_snak(target, prop, datatypes, repo_info),
+        'type': 'statement',
+        'rank': 'normal',
+    }
+    if not isinstance(value, dict):
+        return claim
+
+    if value.get('prominent'):
+        claim['rank'] = 'preferred'
+
+    qualifiers = dict()
+    for qual_prop in (key for key in value.keys() if is_prop_key(key)):
+        qual_value = value[qual_prop]
+        for q_v in (qual_value if isinstance(qual_value, list)
+                    else [qual_value]):
+            qualifiers.setdefault(qual_prop, []).append(
+                _compile_qualifier(q_v, qual_prop, datatypes, repo_info))
+    if qualifiers:
+        claim['qualifiers'] = qualifiers
+        claim['qualifiers-order'] = list(qualifiers.keys())
+    return claim
+
+
+def _compile_qualifier(value, prop, datatypes, repo_info):
+    """Compile the json of a qualifier, see format_qualifier_claim_value."""
+    if not (common.is_str(value) or isinstance(value, dict)):
+        raise ValueError(
+            'Incorrectly formatted qualifier: {}'.format(value))
+    # support using exactly the same format as for complex claims
+    if isinstance(value, dict) and '_' in value:
+        value = value.get('_')
+    return compile_snak(value, prop, datatypes, repo_info)
+
+
+def compile_snak(value, prop, datatypes, repo_info):
+    """
+    Compile the json of a snak, i.e. a property with a value or value type.
+
+    @param value: str|dict encoding the value
+    @param prop: str Property of the snak
+    @param datatypes: dict of property id to datatype
+    @param repo_info: RepoInfo of the data repository
+    @return: dict
+    @raises: ValueError
+    """
+    snak = {'snaktype': 'value', 'property': prop}
+    if common.is_str(value) and value in ('_some_value_', '_no_value_'):
+        snak['snaktype'] = value.replace('_', '')
+        return snak
+
+    datatype = datatypes.get(prop)
+    if not datatype:
+        raise ValueError('The datatype of {} is not known.'.format(prop))
+    snak['datatype'] = datatype
+    snak['datavalue'] = {
+        'value': compile_value(datatype, value, repo_info),
+        'type': VALUE_TYPES.get(datatype, datatype),
+    }
+    return snak
+
+
+def compile_value(datatype, value, repo_info):
+    """
+    Compile the json of the value of a snak.
+
+    The counterpart of format_claim_value(...).toWikibase().
+
+    @param datatype: the datatype of the property
+    @param value: str|dict encoding the value
+    @param repo_info: RepoInfo of the data repository
+    @return: str|dict
+    @raises: ValueError
+    """
+    if datatype in INTERNED_DATATYPES:
+        return get_value_cache().intern(
+            value_key(datatype, value, repo_info),
+            lambda: _compile_interned_value(datatype, value, repo_info))
+    elif datatype == 'wikibase-item':
+        return {'entity-type': 'item', 'numeric-id': _item_number(value)}
+    elif datatype == 'commonsMedia':
+        return _file_title(value)
+    elif datatype in DATA_PAGE_ENDINGS:
+        return _data_page_title(value, DATA_PAGE_ENDINGS[datatype])
+    elif datatype in STRING_TYPES:
+        if not common.is_str(value):
+            raise ValueError(
+                'A {0} value must be a string, not {1}'.format(
+                    datatype, value))
+        return value
+
+    raise ValueError('The {} datatype is not supported.'.format(datatype))
+
+
+def _compile_interned_value(datatype, value, repo_info):
+    """Compile a value of one of the INTERNED_DATATYPES, see compile_value."""
+    if datatype == 'monolingualtext':
+        if common.is_str(value):
+            text, _, lang = value.partition('@')
+            value = {'text': text, 'lang': lang}
+        if not value.get('text') or not value.get('lang'):
+            raise ValueError('text and language cannot be empty')
+        return {'text': value.get('text'), 'language': value.get('lang')}
+    elif datatype == 'globe-coordinate':
+        if common.is_str(value):
+            parts = value.replace(',', '@').split('@')
+            value = {parts[1]: parts[0], parts[3]: parts[2]}
+
+        # set precision to the least precise of the values
+        precision = max(
+            coord_precision(value.get('lat')),
+            coord_precision(value.get('lon')))
+        return {
+            'latitude': float(value.get('lat')),
+            'longitude': float(value.get('lon')),
+            'altitude': None,
+            'globe': repo_info.globe,
+            'precision': precision,
+        }
+    elif datatype == 'quantity':
+        return _quantity(value, repo_info)
+    return _time(value, repo_info)
+
+
+def _item_number(value):
+    """Return the numeric id of an item id like Q123."""
+    match = common.is_str(value) and _ITEM_ID.match(value.strip())
+    if not match:
+        raise ValueError('Not a valid item id: {}'.format(value))
+    return int(match.group(1))
+
+
+def _quantity(value, repo_info):
+    """Compile a quantity, see pywikibot.WbQuantity."""
+    if common.is_str(value):
+        amount, _, unit = value.partition('@')
+        value = {'amount': amount, 'unit': unit}
+
+    if value.get('amount') is None:
+        raise ValueError('no amount given')
+    try:
+        amount = Decimal(str(value.get('amount')))
+    except InvalidOperation:
+        raise ValueError('Not a valid amount: {}'.format(value.get('amount')))
+
+    bounds = None
+    if repo_info.require_bounds:
+        bounds = (amount + Decimal(0), amount - Decimal(0))
+    unit = '1'
+    if value.get('unit'):
+        unit = '{0}Q{1}'.format(
+            repo_info.concept_base_uri, _item_number(value.get('unit')))
+    return {
+        'amount': format(amount, '+g'),
+        'upperBound': format(bounds[0], '+g') if bounds else None,
+        'lowerBound': format(bounds[1], '+g') if bounds else None,
+        'unit': unit,
+    }
+
+
+def _time(value, repo_info):
+    """Compile a point in time, see pywikibot.WbTime."""
+    year, month, day = parse_iso_date(value)
+    precision = WBTIME_PRECISION['day']
+    if day is None:
+        precision = WBTIME_PRECISION['month']
+        day = 1
+    if month is None:
+        precision = WBTIME_PRECISION['year']
+        month = 1
+    return {
+        'time': WBTIME_FORMAT.format(year, month, day),
+        'precision': precision,
+        'after': 0,
+        'before': 0,
+        'timezone': 0,
+        'calendarmodel': repo_info.calendarmodel,
+    }
+
+
+def _normalise_title(title, namespaces):
+    """
+    Normalise a page title the way MediaWiki does.
+
+    @param title: the page title
+    @param namespaces: lower case names of the namespaces which may prefix
+        the title
+    @return: (namespace, title) tuple where namespace is the lower case
+        namespace prefix, or None if there was none.
+    @raises: ValueError
+    """
+    if not common.is_str(title):
+        raise ValueError('A page title must be a string: {}'.format(title))
+    title = _TITLE_DIRECTION_MARKS.sub('', title)
+    title = _TITLE_WHITESPACE.sub(' ', title).strip()
+    namespace, colon, rest = title.partition(':')
+    namespace = namespace.strip().lower()
+    if colon and namespace in namespaces:
+        title = rest.strip()
+    else:
+        namespace = None
+    if not title or _TITLE_ILLEGAL_CHARS.search(title):
+        raise ValueError('Not a valid page title: {}'.format(title))
+    return namespace, first_upper(title)
+
+
+def _file_title(value):
+    """Return the normalised file name, without namespace."""
+    return _normalise_title(value, FILE_NAMESPACES)[1]
+
+
+def _data_page_title(value, ending):
+    """Return the normalised title of a data page, with namespace."""
+    namespace, title = _normalise_title(value, ('data', ))
+    title = 'Data:{}'.format(title)
+    if not namespace or not title.endswith(ending):
+        raise ValueError(
+            "Page must be in 'Data:' namespace and end in '{0}': {1}".format(
+                ending, value))
+    return title
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Bounded thread pool for processing many files concurrently.
+
+Pywikibot's throttle and maxlag handling live on the shared site object and
+are thread safe, so they keep applying to all workers combined.
+"""
+from __future__ import unicode_literals
+
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait
+)
+
+ORDERS = ('input', 'completion')
+
+
+def _run_inline(func, item):
+    """Run func on item in the current thread, returning a done Future."""
+    future = Future()
+    try:
+        future.set_result(func(item))
+    except Exception as error:
+        future.set_exception(error)
+    return future
+
+
+def process_concurrently(func, items, workers=1, order='input'):
+    """
+    Call func on each item, using a bounded pool of worker threads.
+
+    Items are only pulled from the iterable as workers become available, so
+    at most 2 * workers items are in flight at any time.
+
+    @param func: callable taking a single item
+    @param items: iterable of items to process
+    @param workers: number of worker threads. If 1 all calls are made in the
+        current thread.
+    @param order: "input" to yield results in the same order as the items,
+        "completion" to yield them as soon as they are done.
+    @return: generator of (item, concurrent.futures.Future) tuples, where the
+        future is done and holds the result, or exception, of func(item).
+    @raises: ValueError
+    """
+    if order not in ORDERS:
+        raise ValueError(
+            'The order must be one of "{0}" but "{1}" was provided'.format(
+                '", "'.join(ORDERS), order))
+    if workers < 1:
+        raise ValueError('At least one worker is needed.')
+
+    if workers == 1:
+        for item in items:
+            yield item, _run_inline(func, item)
+        return
+
+    max_pending = 2 * workers
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                else:
+                    pending.append((item, executor.submit(func, item)))
+            if not pending:
+                break
+
+            if order == 'input':
+                item, future = pending.popleft()
+                wait([future])
+                yield item, future
+            else:
+                done, _ = wait(
+                    [future for _, future in pending],
+                    return_when=FIRST_COMPLETED)
+                for entry in [e for e in pending if e[1] in done]:
+                    pending.remove(entry)
+                    yield entry
@@ -14,6 +14,7 @@ setup(
     packages=['pywikibotsdc'],
     install_requires=[
         'future',
+        'futures; python_version < "3"',
         'mwparserfromhell',
         'setuptools>50.0.0; python_version >= "3.6"',
         'pathlib; python_version < "3.6"',
@@ -0,0 +1,191 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""
+Offline stand-ins for the Commons and Wikidata sites.
+
+These implement just enough of pywikibot's site interface for pages, claims
+and Wikibase values to be built and serialised without any network access.
+"""
+from __future__ import unicode_literals
+
+import mock
+
+import pywikibot
+from pywikibot.site import APISite, DataSite, Namespace, NamespacesDict
+from pywikibot.tools import MediaWikiVersion
+
+from pywikibotsdc.claim_cache import ClaimCache
+from pywikibotsdc.value_cache import ValueCache
+
+CONCEPT_BASE_URI = 'http://www.wikidata.org/entity/'
+CALENDAR_MODEL = 'http://www.wikidata.org/entity/Q1985727'
+GLOBES = {
+    'earth': 'http://www.wikidata.org/entity/Q2',
+    'moon': 'http://www.wikidata.org/entity/Q405',
+}
+
+
+def _family(name):
+    family = mock.MagicMock()
+    family.name = name
+    return family
+
+
+class _StubSite(object):
+    """Shared methods of the stub sites."""
+
+    def encodings(self):
+        return ['utf-8']
+
+    def encoding(self):
+        return 'utf-8'
+
+    def case(self):
+        return 'first-letter'
+
+    @property
+    def namespaces(self):
+        return self._namespaces
+
+    def interwiki(self, prefix):
+        raise KeyError(prefix)
+
+
+class StubCommons(_StubSite, APISite):
+    """Offline Commons, also serving the Data: namespace."""
+
+    def __init__(self):
+        self._family = _family('commons')
+        self._namespaces = NamespacesDict({
+            0: Namespace(0, '', case='first-letter'),
+            1: Namespace(1, 'Talk', case='first-letter'),
+            6: Namespace(6, 'File', aliases=['Image'], case='first-letter'),
+            7: Namespace(7, 'File talk', case='first-letter'),
+            486: Namespace(486, 'Data', case='first-letter'),
+            487: Namespace(487, 'Data talk', case='first-letter'),
+        })
+
+    @property
+    def code(self):
+        return 'commons'
+
+    @property
+    def family(self):
+        return self._family
+
+
+class StubRepo(_StubSite, DataSite):
+    """Offline Wikidata."""
+
+    def __init__(self, mw_version='1.36', commons=None):
+        self._mw_version = MediaWikiVersion(mw_version)
+        self._commons = commons or StubCommons()
+        self._family = _family('wikidata')
+        self._namespaces = NamespacesDict({
+            0: Namespace(0, '', case='first-letter'),
+            120: Namespace(120, 'Property', case='first-letter'),
+        })
+
+    @property
+    def code(self):
+        return 'wikidata'
+
+    @property
+    def family(self):
+        return self._family
+
+    @property
+    def mw_version(self):
+        return self._mw_version
+
+    @property
+    def concept_base_uri(self):
+        return CONCEPT_BASE_URI
+
+    @property
+    def item_namespace(self):
+        return self.namespaces[0]
+
+    @property
+    def property_namespace(self):
+        return self.namespaces[120]
+
+    def calendarmodel(self):
+        return CALENDAR_MODEL
+
+    def default_globe(self):
+        return 'earth'
+
+    def globes(self):
+        return GLOBES
+
+    def geo_shape_repository(self):
+        return self._commons
+
+    def tabular_data_repository(self):
+        return self._commons
+
+    def data_repository(self):
+        return self
+
+
+class StubDatatypeCache(object):
+    """Stand-in for the PropertyDatatypeCache backed by a fixed dict."""
+
+    def __init__(self, datatypes):
+        self.datatypes = datatypes
+
+    def get(self, repo, pid):
+        return self.datatypes.get(pid.upper())
+
+    def warm(self, repo, pids):
+        return {}
+
+    def table(self, repo, pids):
+        return {pid.upper(): self.get(repo, pid) for pid in pids}
+
+
+def offline_patches(repo, datatypes):
+    """
+    Return the patches making the sdc_upload claim building run offline.
+
+    Patches the default site, the Commons site and the datatype cache, and
+    treats every data page as existing. Fresh claim and value caches are used,
+    so that no claims or values are shared with other repos.
+
+    @param repo: the StubRepo to use as the default data repository
+    @param datatypes: dict of property id to datatype
+    @return: list of unstarted patchers
+    """
+    commons = repo.geo_shape_repository()
+    cache = StubDatatypeCache(datatypes)
+    claim_cache = ClaimCache()
+    value_cache = ValueCache()
+    # plain functions rather than mocks to keep the overhead negligible
+    return [
+        mock.patch('pywikibot.Site', new=lambda *args, **kwargs: repo),
+        mock.patch('pywikibotsdc.sdc_upload._get_commons',
+                   new=lambda: commons),
+        mock.patch('pywikibotsdc.sdc_upload.get_datatype_cache',
+                   new=lambda: cache),
+        mock.patch('pywikibotsdc.sdc_upload.get_claim_cache',
+                   new=lambda: claim_cache),
+        mock.patch('pywikibotsdc.sdc_upload.get_value_cache',
+                   new=lambda: value_cache),
+        mock.patch('pywikibotsdc.wikibase_json.get_value_cache',
+                   new=lambda: value_cache),
+        mock.patch.object(pywikibot.Page, 'exists', new=lambda self: True),
+    ]
+
+
+def patch_offline(test_case, repo, datatypes):
+    """
+    Start the offline_patches for the duration of a test case.
+
+    @param test_case: unittest.TestCase for which patches are started
+    @param repo: the StubRepo to use as the default data repository
+    @param datatypes: dict of property id to datatype
+    """
+    for patcher in offline_patches(repo, datatypes):
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
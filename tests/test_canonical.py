@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for canonical.py."""
+from __future__ import unicode_literals
+
+import unittest
+
+from pywikibotsdc.canonical import snak_key, statement_key, value_key
+
+
+def item_snak(prop, qid, **value):
+    value.setdefault('entity-type', 'item')
+    value.setdefault('numeric-id', int(qid[1:]))
+    return {'snaktype': 'value', 'property': prop,
+            'datavalue': {'type': 'wikibase-entityid', 'value': value}}
+
+
+class TestValueKey(unittest.TestCase):
+    """Test the value_key method."""
+
+    def test_value_key_item_with_and_without_id(self):
+        self.assertEqual(
+            value_key({'type': 'wikibase-entityid',
+                       'value': {'entity-type': 'item', 'numeric-id': 42}}),
+            value_key({'type': 'wikibase-entityid',
+                       'value': {'entity-type': 'item', 'numeric-id': 42,
+                                 'id': 'Q42'}}))
+
+    def test_value_key_quantity_amount_format(self):
+        self.assertEqual(
+            value_key({'type': 'quantity',
+                       'value': {'amount': '+5', 'unit': '1'}}),
+            value_key({'type': 'quantity',
+                       'value': {'amount': '+5.0', 'unit': '1',
+                                 'upperBound': None, 'lowerBound': None}}))
+        self.assertNotEqual(
+            value_key({'type': 'quantity',
+                       'value': {'amount': '+5', 'unit': '1'}}),
+            value_key({'type': 'quantity',
+                       'value': {'amount': '+6', 'unit': '1'}}))
+
+    def test_value_key_time_year_digits(self):
+        compiled = {'type': 'time', 'value': {
+            'time': '+00000002014-07-11T00:00:00Z', 'precision': 11,
+            'after': 0, 'before': 0, 'timezone': 0,
+            'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}}
+        fetched = {'type': 'time', 'value': {
+            'time': '+2014-07-11T00:00:00Z', 'precision': 11,
+            'after': 0, 'before': 0, 'timezone': 0,
+            'calendarmodel': 'http://www.wikidata.org/entity/Q1985727'}}
+        self.assertEqual(value_key(compiled), value_key(fetched))
+
+    def test_value_key_time_ignores_parts_beyond_precision(self):
+        self.assertEqual(
+            value_key({'type': 'time', 'value': {
+                'time': '+2014-01-01T00:00:00Z', 'precision': 9}}),
+            value_key({'type': 'time', 'value': {
+                'time': '+2014-00-00T00:00:00Z', 'precision': 9}}))
+        self.assertNotEqual(
+            value_key({'type': 'time', 'value': {
+                'time': '+2014-01-01T00:00:00Z', 'precision': 11}}),
+            value_key({'type': 'time', 'value': {
+                'time': '+2014-01-02T00:00:00Z', 'precision': 11}}))
+
+    def test_value_key_coordinate(self):
+        self.assertEqual(
+            value_key({'type': 'globecoordinate', 'value': {
+                'latitude': 59.3, 'longitude': 18, 'altitude': None,
+                'precision': 0.1, 'globe': 'Q2'}}),
+            value_key({'type': 'globecoordinate', 'value': {
+                'latitude': 59.3, 'longitude': 18.0, 'precision': 0.1,
+                'globe': 'Q2'}}))
+
+    def test_value_key_monolingualtext(self):
+        self.assertNotEqual(
+            value_key({'type': 'monolingualtext',
+                       'value': {'text': 'Foo', 'language': 'en'}}),
+            value_key({'type': 'monolingualtext',
+                       'value': {'text': 'Foo', 'language': 'sv'}}))
+
+    def test_value_key_string(self):
+        self.assertEqual(
+            value_key({'type': 'string', 'value': 'Foo'}),
+            ('string', 'Foo'))
+
+
+class TestSnakKey(unittest.TestCase):
+    """Test the snak_key method."""
+
+    def test_snak_key_ignores_datatype(self):
+        snak = item_snak('P1', 'Q2')
+        self.assertEqual(
+            snak_key(snak), snak_key(dict(snak, datatype='wikibase-item')))
+
+    def test_snak_key_somevalue(self):
+        self.assertEqual(
+            snak_key({'snaktype': 'somevalue', 'property': 'P1'}),
+            ('P1', 'somevalue', None))
+
+
+class TestStatementKey(unittest.TestCase):
+    """Test the statement_key method."""
+
+    def setUp(self):
+        self.statement = {
+            'mainsnak': item_snak('P1', 'Q2'), 'type': 'statement',
+            'rank': 'normal'}
+
+    def test_statement_key_ignores_id_and_references(self):
+        fetched = dict(self.statement, id='M1$abc', references=[{}])
+        self.assertEqual(
+            statement_key(self.statement), statement_key(fetched))
+
+    def test_statement_key_rank(self):
+        self.assertNotEqual(
+            statement_key(self.statement),
+            statement_key(dict(self.statement, rank='preferred')))
+
+    def test_statement_key_qualifier_order(self):
+        first = dict(self.statement, qualifiers={
+            'P3': [item_snak('P3', 'Q3')], 'P4': [item_snak('P4', 'Q4')]},
+            **{'qualifiers-order': ['P3', 'P4']})
+        second = dict(self.statement, qualifiers={
+            'P4': [item_snak('P4', 'Q4')], 'P3': [item_snak('P3', 'Q3')]},
+            **{'qualifiers-order': ['P4', 'P3']})
+        self.assertEqual(statement_key(first), statement_key(second))
+        self.assertNotEqual(
+            statement_key(first), statement_key(self.statement))
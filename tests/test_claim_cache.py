@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for claim_cache.py."""
+from __future__ import unicode_literals
+
+import unittest
+
+import mock
+
+from pywikibotsdc.claim_cache import ClaimCache, claim_key
+
+
+class TestClaimKey(unittest.TestCase):
+    """Test the claim_key method."""
+
+    def setUp(self):
+        self.mock_repo = mock.MagicMock()
+        self.mock_repo.family.name = 'wikidata'
+        self.mock_repo.code = 'wikidata'
+
+    def test_claim_key_string_value(self):
+        self.assertEqual(
+            claim_key(self.mock_repo, 'P1', 'Q2'),
+            ('wikidata:wikidata', 'P1', 'Q2'))
+
+    def test_claim_key_dict_value_canonical(self):
+        self.assertEqual(
+            claim_key(self.mock_repo, 'P1', {'_': 'Q2', 'P3': ['Q4', 'Q5']}),
+            claim_key(self.mock_repo, 'P1', {'P3': ['Q4', 'Q5'], '_': 'Q2'}))
+        self.assertNotEqual(
+            claim_key(self.mock_repo, 'P1', {'_': 'Q2', 'P3': ['Q4', 'Q5']}),
+            claim_key(self.mock_repo, 'P1', {'_': 'Q2', 'P3': ['Q5', 'Q4']}))
+
+    def test_claim_key_differs_per_property_and_repo(self):
+        key = claim_key(self.mock_repo, 'P1', 'Q2')
+        self.assertNotEqual(key, claim_key(self.mock_repo, 'P2', 'Q2'))
+        self.mock_repo.code = 'test'
+        self.assertNotEqual(key, claim_key(self.mock_repo, 'P1', 'Q2'))
+
+
+class TestClaimCache(unittest.TestCase):
+    """Test the ClaimCache class."""
+
+    def setUp(self):
+        self.cache = ClaimCache(maxsize=2)
+        self.claim = {'mainsnak': {'property': 'P1'}, 'rank': 'normal'}
+
+    def test_claim_cache_miss_then_hit(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.put('a', self.claim)
+        self.assertEqual(self.cache.get('a'), self.claim)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_claim_cache_returns_copies(self):
+        self.cache.put('a', self.claim)
+        self.cache.get('a')['rank'] = 'preferred'
+        self.claim['rank'] = 'deprecated'
+        self.assertEqual(self.cache.get('a')['rank'], 'normal')
+
+    def test_claim_cache_evicts_least_recently_used(self):
+        self.cache.put('a', self.claim)
+        self.cache.put('b', self.claim)
+        self.cache.get('a')
+        self.cache.put('c', self.claim)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('c'))
+
+    def test_claim_cache_clear(self):
+        self.cache.put('a', self.claim)
+        self.cache.get('a')
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+    def test_claim_cache_stats(self):
+        self.assertIsNone(self.cache.stats()['hit_rate'])
+        self.cache.put('a', self.claim)
+        self.cache.get('a')
+        self.cache.get('a')
+        self.cache.get('b')
+        self.assertEqual(self.cache.stats(), {
+            'size': 1, 'maxsize': 2, 'hits': 2, 'misses': 1,
+            'hit_rate': 2 / 3.0})
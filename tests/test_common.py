@@ -5,7 +5,7 @@ from __future__ import unicode_literals
 
 import unittest
 
-from pywikibotsdc.common import is_int, is_pos_int
+from pywikibotsdc.common import chunked, is_int, is_pos_int
 
 
 class TestIsInt(unittest.TestCase):
@@ -74,3 +74,23 @@ class TestIsPosInt(unittest.TestCase):
         s = '123'
         result = is_pos_int(s)
         self.assertEqual(result, True)
+
+
+class TestChunked(unittest.TestCase):
+    """Test the chunked method."""
+
+    def test_empty_iterable(self):
+        result = list(chunked([], 2))
+        self.assertEqual(result, [])
+
+    def test_exact_multiple(self):
+        result = list(chunked(range(4), 2))
+        self.assertEqual(result, [[0, 1], [2, 3]])
+
+    def test_remainder_in_last_chunk(self):
+        result = list(chunked(range(5), 2))
+        self.assertEqual(result, [[0, 1], [2, 3], [4]])
+
+    def test_generator_input(self):
+        result = list(chunked((i for i in range(3)), 5))
+        self.assertEqual(result, [[0, 1, 2]])
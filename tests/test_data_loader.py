@@ -0,0 +1,144 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for data_loader.py."""
+from __future__ import unicode_literals
+
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import shutil
+import tempfile
+import unittest
+
+from pywikibotsdc.data_loader import (
+    detect_format,
+    iter_json_lines,
+    iter_json_object,
+    iter_sdc_data,
+    open_data_file
+)
+
+
+class TestIterJsonObject(unittest.TestCase):
+    """Test the iter_json_object method."""
+
+    def setUp(self):
+        self.data = {
+            'File:A.jpg': {'caption': {'en': 'Foo }{ "bar"'}, 'P1': 'Q1'},
+            'B.jpg': {'P2': ['Q2', {'_': 'Q3', 'P4': '2020-01-01'}]},
+            'C ö.jpg': {'P5': '12.3@Q4', 'weird': [1, 2.5, None, True]},
+            'D.jpg': 123456789,
+        }
+
+    def parse(self, text, chunk_size=3):
+        return list(iter_json_object(io.StringIO(text), chunk_size))
+
+    def test_iter_json_object_empty(self):
+        self.assertEqual(self.parse('{}'), [])
+        self.assertEqual(self.parse(' \n{ \n } '), [])
+
+    def test_iter_json_object_matches_json_load(self):
+        text = json.dumps(self.data, indent=4)
+        for chunk_size in (1, 2, 7, 1000):
+            self.assertEqual(
+                dict(self.parse(text, chunk_size)), self.data,
+                msg=chunk_size)
+
+    def test_iter_json_object_preserves_order(self):
+        text = '{"b": 1, "a": 2, "c": 3}'
+        self.assertEqual(
+            [k for k, _ in self.parse(text)], ['b', 'a', 'c'])
+
+    def test_iter_json_object_number_across_chunks(self):
+        self.assertEqual(self.parse('{"a":123456}', 6), [('a', 123456)])
+
+    def test_iter_json_object_is_lazy(self):
+        entries = iter_json_object(io.StringIO('{"a": 1, "b": [}'), 2)
+        self.assertEqual(next(entries), ('a', 1))
+        with self.assertRaises(ValueError):
+            next(entries)
+
+    def test_iter_json_object_not_object_raises(self):
+        with self.assertRaises(ValueError):
+            self.parse('["a", "b"]')
+
+    def test_iter_json_object_truncated_raises(self):
+        with self.assertRaises(ValueError):
+            self.parse('{"a": 1, ')
+
+
+class TestIterJsonLines(unittest.TestCase):
+    """Test the iter_json_lines method."""
+
+    def test_iter_json_lines(self):
+        text = (
+            '{"filename": "A.jpg", "data": {"P1": "Q1"}}\n'
+            '\n'
+            '{"data": {"P2": "Q2"}, "filename": "B.jpg"}\n')
+        self.assertEqual(
+            list(iter_json_lines(io.StringIO(text))),
+            [('A.jpg', {'P1': 'Q1'}), ('B.jpg', {'P2': 'Q2'})])
+
+    def test_iter_json_lines_missing_key_raises(self):
+        text = '{"filename": "A.jpg"}\n'
+        with self.assertRaises(ValueError) as ve:
+            list(iter_json_lines(io.StringIO(text)))
+        self.assertTrue('line 1' in str(ve.exception))
+
+
+class TestDetectFormat(unittest.TestCase):
+    """Test the detect_format method."""
+
+    def test_detect_format(self):
+        self.assertEqual(detect_format('data.json'), 'json')
+        self.assertEqual(detect_format('data.json.gz'), 'json')
+        self.assertEqual(detect_format('data.jsonl'), 'jsonl')
+        self.assertEqual(detect_format('data.NDJSON.xz'), 'jsonl')
+        self.assertEqual(detect_format('data'), 'json')
+
+
+class TestOpenDataFile(unittest.TestCase):
+    """Test the open_data_file and iter_sdc_data methods."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.data = {'A.jpg': {'caption': {'sv': 'Hämppi'}}, 'B.jpg': {}}
+        self.text = json.dumps(self.data, ensure_ascii=False)
+
+    def write(self, name, opener=io.open):
+        path = os.path.join(self.tmp_dir, name)
+        with opener(path, 'wb') as f:
+            f.write(self.text.encode('utf-8'))
+        return path
+
+    def test_open_data_file_plain(self):
+        with open_data_file(self.write('data.json')) as f:
+            self.assertEqual(f.read(), self.text)
+
+    def test_open_data_file_compressed(self):
+        openers = {'gz': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+        for suffix, opener in openers.items():
+            # name is deliberately misleading, detection uses the contents
+            path = self.write('data_{}.json'.format(suffix), opener)
+            with open_data_file(path) as f:
+                self.assertEqual(f.read(), self.text, msg=suffix)
+
+    def test_iter_sdc_data_json(self):
+        path = self.write('data.json.gz', gzip.open)
+        self.assertEqual(dict(iter_sdc_data(path)), self.data)
+
+    def test_iter_sdc_data_jsonl(self):
+        self.text = '\n'.join(
+            json.dumps({'filename': k, 'data': v})
+            for k, v in self.data.items())
+        path = self.write('data.txt')
+        self.assertEqual(dict(iter_sdc_data(path, 'jsonl')), self.data)
+
+    def test_iter_sdc_data_unknown_format_raises(self):
+        path = self.write('data.json')
+        with self.assertRaises(ValueError):
+            list(iter_sdc_data(path, 'xml'))
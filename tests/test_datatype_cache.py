@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for datatype_cache.py."""
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+from pywikibotsdc.datatype_cache import PropertyDatatypeCache
+
+
+class TestPropertyDatatypeCache(unittest.TestCase):
+    """Test the PropertyDatatypeCache class."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'datatypes.json')
+
+        self.mock_repo = mock.MagicMock()
+        self.mock_repo.family.name = 'wikidata'
+        self.mock_repo.code = 'wikidata'
+        self.mock_request = self.mock_repo._simple_request
+        self.mock_request.return_value.submit.side_effect = (
+            lambda: self.response)
+        self.response = {
+            'entities': {
+                'P1': {'type': 'property', 'id': 'P1',
+                       'datatype': 'wikibase-item'},
+                'P2': {'type': 'property', 'id': 'P2', 'datatype': 'time'},
+                'P3': {'id': 'P3', 'missing': ''},
+            },
+            'success': 1
+        }
+
+    def test_warm_single_request(self):
+        cache = PropertyDatatypeCache(self.path)
+        result = cache.warm(self.mock_repo, ['P2', 'p1', 'P3'])
+        self.mock_request.assert_called_once_with(
+            action='wbgetentities', ids=['P1', 'P2', 'P3'],
+            props='datatype')
+        self.assertEqual(result, {'P1': 'wikibase-item', 'P2': 'time'})
+
+    def test_warm_skips_cached(self):
+        cache = PropertyDatatypeCache(self.path)
+        cache.warm(self.mock_repo, ['P1', 'P2'])
+        result = cache.warm(self.mock_repo, ['P1', 'P2'])
+        self.mock_request.assert_called_once()
+        self.assertEqual(result, {})
+
+    def test_get_cached_no_request(self):
+        cache = PropertyDatatypeCache(self.path)
+        cache.warm(self.mock_repo, ['P1', 'P2'])
+        self.assertEqual(cache.get(self.mock_repo, 'P2'), 'time')
+        self.mock_request.assert_called_once()
+
+    def test_get_uncached_looks_up(self):
+        cache = PropertyDatatypeCache(self.path)
+        self.assertEqual(cache.get(self.mock_repo, 'P1'), 'wikibase-item')
+        self.mock_request.assert_called_once()
+
+    def test_get_missing_property_none(self):
+        cache = PropertyDatatypeCache(self.path)
+        self.assertIsNone(cache.get(self.mock_repo, 'P3'))
+
+    def test_persisted_between_instances(self):
+        PropertyDatatypeCache(self.path).warm(self.mock_repo, ['P1'])
+        cache = PropertyDatatypeCache(self.path)
+        self.assertEqual(cache.get(self.mock_repo, 'P1'), 'wikibase-item')
+        self.mock_request.assert_called_once()
+
+    def test_stored_per_repository(self):
+        PropertyDatatypeCache(self.path).warm(self.mock_repo, ['P1'])
+        other_repo = mock.MagicMock()
+        other_repo.family.name = 'wikidata'
+        other_repo.code = 'test'
+        other_repo._simple_request.return_value.submit.return_value = {
+            'entities': {'P1': {'id': 'P1', 'datatype': 'string'}}}
+        cache = PropertyDatatypeCache(self.path)
+        self.assertEqual(cache.get(other_repo, 'P1'), 'string')
+        self.assertEqual(cache.get(self.mock_repo, 'P1'), 'wikibase-item')
+
+    def test_expired_entry_refetched(self):
+        with open(self.path, 'w') as f:
+            json.dump({'wikidata:wikidata': {'P1': ['string', 0]}}, f)
+        cache = PropertyDatatypeCache(self.path, ttl=60)
+        self.assertEqual(cache.get(self.mock_repo, 'P1'), 'wikibase-item')
+        self.mock_request.assert_called_once()
+
+    def test_corrupt_file_ignored(self):
+        with open(self.path, 'w') as f:
+            f.write('not json')
+        cache = PropertyDatatypeCache(self.path)
+        self.assertEqual(cache.get(self.mock_repo, 'P1'), 'wikibase-item')
+
+    def test_memory_only_cache(self):
+        cache = PropertyDatatypeCache()
+        cache.warm(self.mock_repo, ['P1'])
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+        self.assertEqual(cache.get(self.mock_repo, 'P1'), 'wikibase-item')
+
+    def test_table(self):
+        cache = PropertyDatatypeCache()
+        cache.warm(self.mock_repo, ['P1', 'P2'])
+        self.assertEqual(
+            cache.table(self.mock_repo, ['p1', 'P2', 'P3']),
+            {'P1': 'wikibase-item', 'P2': 'time', 'P3': None})
+        self.assertEqual(self.mock_request.call_count, 2)
+        self.mock_request.assert_called_with(
+            action='wbgetentities', ids=['P3'], props='datatype')
+
+    def test_known(self):
+        with open(self.path, 'w') as f:
+            json.dump({'wikidata:wikidata': {'P1': ['string', 0],
+                                             'P2': ['time', time.time()]},
+                       'wikidata:test': {'P3': ['url', time.time()]}}, f)
+        cache = PropertyDatatypeCache(self.path, ttl=60)
+        self.assertEqual(cache.known(self.mock_repo), {'P2': 'time'})
+        self.mock_request.assert_not_called()
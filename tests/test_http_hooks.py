@@ -0,0 +1,46 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for http_hooks.py."""
+from __future__ import unicode_literals
+
+import unittest
+
+import mock
+
+import pywikibotsdc.http_hooks as http_hooks
+
+
+class TestHttpHooks(unittest.TestCase):
+    """Test the add_observer and remove_observer methods."""
+
+    def setUp(self):
+        patcher = mock.patch('pywikibotsdc.http_hooks.http')
+        self.mock_http = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_fetch = self.mock_http.fetch
+        self.observer_1 = mock.MagicMock()
+        self.observer_2 = mock.MagicMock()
+        self.addCleanup(http_hooks.remove_observer, self.observer_1)
+        self.addCleanup(http_hooks.remove_observer, self.observer_2)
+
+    def test_add_observer_observes_requests(self):
+        http_hooks.add_observer(self.observer_1)
+        http_hooks.add_observer(self.observer_2)
+        response = self.mock_http.fetch('http://x', method='POST', data='a')
+        self.assertIs(response, self.mock_fetch.return_value)
+        self.mock_fetch.assert_called_once_with(
+            'http://x', method='POST', data='a')
+        for observer in (self.observer_1, self.observer_2):
+            observer.assert_called_once_with(
+                'http://x', {'method': 'POST', 'data': 'a'}, response)
+
+    def test_remove_observer_restores_fetch_once_unused(self):
+        http_hooks.add_observer(self.observer_1)
+        http_hooks.add_observer(self.observer_2)
+        http_hooks.remove_observer(self.observer_1)
+        self.assertIsNot(self.mock_http.fetch, self.mock_fetch)
+        self.mock_http.fetch('http://x')
+        self.observer_1.assert_not_called()
+        self.observer_2.assert_called_once()
+        http_hooks.remove_observer(self.observer_2)
+        self.assertIs(self.mock_http.fetch, self.mock_fetch)
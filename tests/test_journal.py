@@ -0,0 +1,79 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for journal.py."""
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from pywikibotsdc.journal import Journal, load_completed
+from pywikibotsdc.sdc_exception import SdcException
+from pywikibotsdc.sdc_result import SdcResult
+
+
+class TestJournal(unittest.TestCase):
+    """Test the Journal class and load_completed method."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.path = os.path.join(self.tmp_dir, 'journal.jsonl')
+
+        self.success = SdcResult('A.jpg', 'M1', 3, revision_id=123)
+        self.warning = SdcResult('B.jpg', 'M2', error=SdcException(
+            'warning', 'pre-existing sdc-data', 'Foo'))
+        self.error = SdcResult('C.jpg', None, error=SdcException(
+            'error', 'missing file', 'Bar'))
+
+    def read_entries(self):
+        with io.open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_journal_record(self):
+        with Journal(self.path) as journal:
+            journal.record(self.success)
+            journal.record(self.error)
+        entries = self.read_entries()
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[0]['filename'], 'A.jpg')
+        self.assertEqual(entries[0]['mid'], 'M1')
+        self.assertEqual(entries[0]['revid'], 123)
+        self.assertEqual(entries[0]['statements'], 3)
+        self.assertEqual(entries[0]['status'], 'success')
+        self.assertEqual(entries[1]['status'], 'error')
+
+    def test_journal_appends(self):
+        with Journal(self.path) as journal:
+            journal.record(self.success)
+        with Journal(self.path) as journal:
+            journal.record(self.warning)
+        self.assertEqual(len(self.read_entries()), 2)
+
+    def test_journal_recovers_from_cut_short_line(self):
+        with io.open(self.path, 'w', encoding='utf-8') as f:
+            f.write('{"filename": "X.jpg", "sta')
+        with Journal(self.path) as journal:
+            journal.record(self.success)
+        self.assertEqual(load_completed(self.path), {'A.jpg'})
+
+    def test_load_completed_missing_journal(self):
+        self.assertEqual(load_completed(self.path), set())
+
+    def test_load_completed_skips_errors(self):
+        with Journal(self.path) as journal:
+            journal.record(self.success)
+            journal.record(self.warning)
+            journal.record(self.error)
+        self.assertEqual(load_completed(self.path), {'A.jpg', 'B.jpg'})
+
+    def test_load_completed_latest_entry_wins(self):
+        with Journal(self.path) as journal:
+            journal.record(self.error)
+            journal.record(SdcResult('C.jpg', 'M3', 1))
+            journal.record(SdcResult('A.jpg', 'M1', error=SdcException(
+                'error', 'mock', 'Foo')))
+        self.assertEqual(load_completed(self.path), {'C.jpg'})
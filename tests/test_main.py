@@ -4,10 +4,11 @@
 from __future__ import unicode_literals
 
 import unittest
+from collections import deque
 
 import mock
 
-from pywikibotsdc.__main__ import handle_args
+from pywikibotsdc.__main__ import _with_failures, handle_args
 
 
 class TestHandleArgs(unittest.TestCase):
@@ -39,9 +40,109 @@ class TestHandleArgs(unittest.TestCase):
         self.mock_pwb_handle_args.assert_called_once_with(['-simulate'])
         self.mock_argparse_error.assert_not_called()
 
+    def test_handle_args_workers_default(self):
+        args = handle_args(['data.json'])
+        self.assertEqual(args.workers, 1)
+        self.assertEqual(args.order, 'input')
+
+    def test_handle_args_workers(self):
+        args = handle_args('--workers 4 --order completion data.json'.split())
+        self.assertEqual(args.workers, 4)
+        self.assertEqual(args.order, 'completion')
+        self.mock_argparse_error.assert_not_called()
+
+    def test_handle_args_workers_non_positive_raises(self):
+        self.mock_argparse_error.side_effect = SystemExit
+        with self.assertRaises(SystemExit):
+            handle_args('--workers 0 data.json'.split())
+        self.mock_argparse_error.assert_called_once()
+
+    def test_handle_args_resume(self):
+        args = handle_args('--resume run.journal data.json'.split())
+        self.assertEqual(str(args.resume), 'run.journal')
+        self.assertIsNone(args.journal)
+
+    def test_handle_args_metrics(self):
+        args = handle_args('--metrics metrics.json data.json'.split())
+        self.assertEqual(str(args.metrics), 'metrics.json')
+        self.assertIsNone(handle_args(['data.json']).metrics)
+
+    def test_handle_args_compile_submit(self):
+        args = handle_args('--compile out.jsonl data.json'.split())
+        self.assertEqual(str(args.compile), 'out.jsonl')
+        self.assertFalse(args.submit)
+        args = handle_args('--submit out.jsonl'.split())
+        self.assertIsNone(args.compile)
+        self.assertTrue(args.submit)
+
+    def test_handle_args_compile_and_submit_raises(self):
+        self.mock_argparse_error.side_effect = SystemExit
+        with self.assertRaises(SystemExit):
+            handle_args('--compile out.jsonl --submit data.json'.split())
+
+    def test_handle_args_validate(self):
+        self.assertFalse(handle_args(['data.json']).validate)
+        self.assertTrue(handle_args('--validate data.json'.split()).validate)
+
+    def test_handle_args_validate_and_compile_raises(self):
+        self.mock_argparse_error.side_effect = SystemExit
+        with self.assertRaises(SystemExit):
+            handle_args(
+                '--validate --compile out.jsonl data.json'.split())
+
+    def test_handle_args_adaptive(self):
+        args = handle_args('--adaptive --max-rate 2.5 data.json'.split())
+        self.assertTrue(args.adaptive)
+        self.assertEqual(args.max_rate, 2.5)
+        self.mock_argparse_error.assert_not_called()
+
+    def test_handle_args_max_rate_non_positive_raises(self):
+        self.mock_argparse_error.side_effect = SystemExit
+        with self.assertRaises(SystemExit):
+            handle_args('--max-rate 0 data.json'.split())
+
+    def test_handle_args_max_retries(self):
+        args = handle_args('--max-retries 7 data.json'.split())
+        self.assertEqual(args.max_retries, 7)
+        args = handle_args('data.json'.split())
+        self.assertEqual(args.max_retries, 4)
+        self.mock_argparse_error.assert_not_called()
+
+    def test_handle_args_processes(self):
+        args = handle_args('--processes 8 data.json'.split())
+        self.assertEqual(args.processes, 8)
+        args = handle_args('data.json'.split())
+        self.assertEqual(args.processes, 1)
+        self.mock_argparse_error.assert_not_called()
+
+    def test_handle_args_lookahead(self):
+        args = handle_args('--lookahead 20 data.json'.split())
+        self.assertEqual(args.lookahead, 20)
+        args = handle_args('data.json'.split())
+        self.assertEqual(args.lookahead, 0)
+        self.mock_argparse_error.side_effect = SystemExit
+        with self.assertRaises(SystemExit):
+            handle_args('--lookahead 0 data.json'.split())
+
     def test_handle_args_argparse_raise_on_unknown_args(self):
         call = '--foobar data.json'
         self.mock_pwb_handle_args.return_value = ['--foobar']
         handle_args(call.split(' '))
         self.mock_pwb_handle_args.assert_called_once()
         self.mock_argparse_error.assert_called_once()
+
+
+class TestWithFailures(unittest.TestCase):
+    """Test the _with_failures method."""
+
+    def test_with_failures_interleaved(self):
+        failures = deque()
+
+        def results():
+            yield 'a'
+            failures.append('x')
+            yield 'b'
+            failures.extend(['y', 'z'])
+
+        self.assertEqual(list(_with_failures(results(), failures)),
+                         ['a', 'x', 'b', 'y', 'z'])
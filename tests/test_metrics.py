@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for metrics.py."""
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import pywikibotsdc.metrics as metrics
+from pywikibotsdc.metrics import Histogram, Metrics
+
+
+class TestHistogram(unittest.TestCase):
+    """Test the Histogram class."""
+
+    def setUp(self):
+        self.histogram = Histogram()
+
+    def test_histogram_empty(self):
+        self.assertIsNone(self.histogram.mean)
+        self.assertIsNone(self.histogram.percentile(0.5))
+        self.assertEqual(self.histogram.to_dict()['buckets'], [])
+
+    def test_histogram_observe(self):
+        for seconds in (0.002, 0.003, 0.2, 100):
+            self.histogram.observe(seconds)
+        data = self.histogram.to_dict()
+        self.assertEqual(data['count'], 4)
+        self.assertEqual(data['min'], 0.002)
+        self.assertEqual(data['max'], 100)
+        self.assertAlmostEqual(data['mean'], 100.205 / 4)
+        self.assertEqual(
+            data['buckets'], [[0.0025, 1], [0.005, 1], [0.25, 1], [None, 1]])
+
+    def test_histogram_percentile(self):
+        for seconds in (0.002, 0.003, 0.004, 0.2):
+            self.histogram.observe(seconds)
+        self.assertEqual(self.histogram.percentile(0.5), 0.005)
+        # the estimate is limited by the largest observed value
+        self.assertEqual(self.histogram.percentile(0.9), 0.2)
+
+
+class TestMetrics(unittest.TestCase):
+    """Test the Metrics class."""
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_metrics_phase(self):
+        with self.metrics.phase('submit'):
+            pass
+        with self.metrics.phase('submit'):
+            pass
+        self.assertEqual(self.metrics.histograms['submit'].count, 2)
+
+    def test_metrics_record_request_attributed_to_innermost_phase(self):
+        self.metrics.record_request(1, 2)
+        with self.metrics.phase('submit'):
+            with self.metrics.phase('resolve'):
+                self.metrics.record_request(10, 20)
+            self.metrics.record_request(100, 200)
+        self.assertEqual(
+            self.metrics.requests, {'other': 1, 'resolve': 1, 'submit': 1})
+        self.assertEqual(self.metrics.bytes_sent['submit'], 100)
+        self.assertEqual(self.metrics.bytes_received['resolve'], 20)
+
+    def test_metrics_phase_names_ordered(self):
+        self.metrics.observe('custom', 1)
+        self.metrics.observe('submit', 1)
+        self.metrics.observe('resolve', 1)
+        self.metrics.record_request(1, 1)
+        self.assertEqual(
+            self.metrics.phase_names(),
+            ['resolve', 'submit', 'custom', 'other'])
+
+    def test_metrics_to_dict(self):
+        self.metrics.observe('format', 0.5)
+        self.metrics.count('files')
+        self.metrics.count('statements', 3)
+        with self.metrics.phase('submit'):
+            self.metrics.record_request(10, 20)
+        data = self.metrics.to_dict()
+        self.assertEqual(data['counters'], {'files': 1, 'statements': 3})
+        self.assertEqual(data['requests'], 1)
+        self.assertEqual(data['bytes_sent'], 10)
+        self.assertEqual(data['phases']['format']['requests'], 0)
+        self.assertEqual(data['phases']['format']['total'], 0.5)
+        self.assertEqual(data['phases']['submit']['bytes_received'], 20)
+
+    def test_metrics_save(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'metrics.json')
+        self.metrics.observe('format', 0.5)
+        self.metrics.save(path)
+        with io.open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertEqual(data['phases']['format']['count'], 1)
+
+    def test_metrics_summary(self):
+        self.metrics.observe('format', 0.5)
+        self.metrics.count('files', 2)
+        with self.metrics.phase('submit'):
+            self.metrics.record_request(1500, 20)
+        lines = self.metrics.summary()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('phase'))
+        self.assertIn('500.0ms', lines[1])
+        self.assertIn('1.5kB', lines[2])
+        self.assertIn('1 requests', lines[3])
+        self.assertIn('files/s', lines[3])
+
+
+class TestEnableMetrics(unittest.TestCase):
+    """Test the enable_metrics, disable_metrics and phase methods."""
+
+    def setUp(self):
+        patcher = mock.patch('pywikibotsdc.http_hooks.http')
+        self.mock_http = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_fetch = self.mock_http.fetch
+        self.mock_fetch.return_value.content = b'{"a": 1}'
+        self.addCleanup(metrics.disable_metrics)
+
+    def test_phase_disabled(self):
+        self.assertIsNone(metrics.get_metrics())
+        with metrics.phase('submit'):
+            pass
+
+    def test_enable_metrics_counts_requests(self):
+        run_metrics = metrics.enable_metrics()
+        self.assertIs(metrics.get_metrics(), run_metrics)
+        with metrics.phase('submit'):
+            response = self.mock_http.fetch(
+                'http://x', method='POST', data={'a': 'b'})
+        self.assertIs(response, self.mock_fetch.return_value)
+        self.mock_fetch.assert_called_once_with(
+            'http://x', method='POST', data={'a': 'b'})
+        self.assertEqual(run_metrics.requests, {'submit': 1})
+        self.assertEqual(run_metrics.bytes_sent, {'submit': 8 + 3})
+        self.assertEqual(run_metrics.bytes_received, {'submit': 8})
+        self.assertEqual(run_metrics.histograms['submit'].count, 1)
+
+    def test_disable_metrics_restores_fetch(self):
+        metrics.enable_metrics()
+        run_metrics = metrics.disable_metrics()
+        self.assertIs(self.mock_http.fetch, self.mock_fetch)
+        self.assertIsNone(metrics.get_metrics())
+        self.mock_http.fetch('http://x')
+        self.assertEqual(run_metrics.requests, {})
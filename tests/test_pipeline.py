@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for pipeline.py."""
+from __future__ import unicode_literals
+
+import threading
+import time
+import unittest
+
+from pywikibotsdc.pipeline import stage
+
+
+class TestStage(unittest.TestCase):
+    """Test the stage method."""
+
+    def test_stage_keeps_order(self):
+        self.assertEqual(
+            list(stage(lambda value: value * value, range(5), maxsize=2)),
+            [0, 1, 4, 9, 16])
+
+    def test_stage_without_func_passes_items_on(self):
+        self.assertEqual(list(stage(None, iter('abc'))), ['a', 'b', 'c'])
+
+    def test_stage_runs_in_background_thread(self):
+        threads = []
+
+        def items():
+            for value in range(3):
+                threads.append(threading.current_thread())
+                yield value
+
+        list(stage(None, items()))
+        self.assertEqual(len(set(threads)), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_stage_bounded_lookahead(self):
+        pulled = []
+
+        def items():
+            for value in range(10):
+                pulled.append(value)
+                yield value
+
+        results = stage(None, items(), maxsize=2)
+        self.assertEqual(next(results), 0)
+        time.sleep(0.05)
+        # one item held by the thread, waiting for room in the queue
+        self.assertEqual(len(pulled), 4)
+        results.close()
+
+    def test_stage_overlaps_with_consumer(self):
+        def slow(value):
+            time.sleep(0.02)
+            return value
+
+        started = time.time()
+        for _ in stage(slow, range(5), maxsize=5):
+            time.sleep(0.02)
+        self.assertLess(time.time() - started, 0.18)
+
+    def test_stage_exception_reraised_in_order(self):
+        def func(value):
+            if value == 2:
+                raise ValueError('two')
+            return value
+
+        results = stage(func, range(5))
+        self.assertEqual([next(results), next(results)], [0, 1])
+        with self.assertRaises(ValueError):
+            next(results)
+
+    def test_stage_chained(self):
+        results = stage(lambda value: value + 1,
+                        stage(lambda value: value * 2, range(3)))
+        self.assertEqual(list(results), [1, 3, 5])
+
+    def test_stage_stops_when_closed(self):
+        results = stage(None, iter(range(100)), maxsize=1)
+        next(results)
+        results.close()
+        time.sleep(0.25)
+        self.assertFalse(any(thread.name == 'pipeline-stage'
+                             for thread in threading.enumerate()))
+
+    def test_stage_non_positive_maxsize_raises(self):
+        with self.assertRaises(ValueError):
+            stage(None, range(3), maxsize=0)
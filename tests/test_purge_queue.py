@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for purge_queue.py."""
+from __future__ import unicode_literals
+
+import unittest
+
+import mock
+
+import pywikibot
+
+from pywikibotsdc.purge_queue import PurgeQueue
+from pywikibotsdc.retry import RetryPolicy
+
+
+def purge_response(titles, **kwargs):
+    purged = []
+    for title in titles.split('|') if titles else []:
+        entry = {'ns': 6, 'title': title}
+        if title.startswith('Missing'):
+            entry['missing'] = ''
+        else:
+            entry.update(purged='', linkupdate='')
+        purged.append(entry)
+    return {'batchcomplete': '', 'purge': purged}
+
+
+class TestPurgeQueue(unittest.TestCase):
+    """Test the PurgeQueue class."""
+
+    def setUp(self):
+        self.mock_site = mock.MagicMock()
+        self.requests = []
+
+        def simple_request(**kwargs):
+            self.requests.append(kwargs)
+            request = mock.MagicMock()
+            request.submit.side_effect = lambda: purge_response(
+                '|'.join(kwargs['titles']))
+            return request
+
+        self.mock_site._simple_request.side_effect = simple_request
+        self.queue = PurgeQueue(
+            self.mock_site, batch_size=2, retry_policy=RetryPolicy(
+                max_retries=1, base_delay=0))
+
+    def test_purge_queue_add_only_queues(self):
+        self.queue.add('A.jpg')
+        self.assertEqual(len(self.queue), 1)
+        self.assertEqual(self.requests, [])
+
+    def test_purge_queue_add_file_page(self):
+        file_page = mock.MagicMock()
+        file_page.title.return_value = 'File:A.jpg'
+        self.queue.add(file_page)
+        self.queue.flush()
+        self.assertEqual(self.requests[0]['titles'], ['File:A.jpg'])
+
+    def test_purge_queue_full_batch_purged_in_background(self):
+        for title in ('A.jpg', 'B.jpg', 'C.jpg'):
+            self.queue.add(title)
+        self.assertEqual(len(self.queue), 1)
+        self.queue.flush()
+        self.assertEqual(self.requests, [
+            {'action': 'purge', 'titles': ['A.jpg', 'B.jpg'],
+             'forcelinkupdate': True},
+            {'action': 'purge', 'titles': ['C.jpg'],
+             'forcelinkupdate': True}])
+        self.assertEqual(self.queue.purged, 3)
+        self.assertEqual(len(self.queue), 0)
+
+    def test_purge_queue_flush_empty(self):
+        self.queue.flush()
+        self.assertEqual(self.requests, [])
+
+    def test_purge_queue_pages_not_updated_failed(self):
+        self.queue.add('A.jpg')
+        self.queue.add('Missing.jpg')
+        self.queue.close()
+        self.assertEqual(self.queue.purged, 1)
+        self.assertEqual(self.queue.failed, ['Missing.jpg'])
+
+    def test_purge_queue_api_error_failed(self):
+        self.mock_site._simple_request.side_effect = None
+        self.mock_site._simple_request.return_value.submit.side_effect = (
+            pywikibot.data.api.APIError('permissiondenied', 'mock'))
+        self.queue.add('A.jpg')
+        self.queue.close()
+        self.assertEqual(self.queue.purged, 0)
+        self.assertEqual(self.queue.failed, ['A.jpg'])
+
+    def test_purge_queue_transient_error_retried(self):
+        submit = self.mock_site._simple_request.return_value.submit
+        self.mock_site._simple_request.side_effect = None
+        submit.side_effect = [
+            pywikibot.data.api.APIError('ratelimited', 'mock'),
+            purge_response('A.jpg')]
+        self.queue.add('A.jpg')
+        self.queue.close()
+        self.assertEqual(submit.call_count, 2)
+        self.assertEqual(self.queue.purged, 1)
+
+    def test_purge_queue_other_error_raised_on_flush(self):
+        self.mock_site._simple_request.side_effect = ValueError('mock')
+        self.queue.add('A.jpg')
+        self.queue.add('B.jpg')
+        with self.assertRaises(ValueError):
+            self.queue.close()
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for retry.py."""
+from __future__ import unicode_literals
+
+import unittest
+
+import mock
+
+import pywikibot
+from pywikibot.exceptions import (
+    FatalServerError,
+    MaxlagTimeoutError,
+    ServerError,
+    TimeoutError
+)
+
+from pywikibotsdc.retry import (
+    PERMANENT,
+    TRANSIENT,
+    UNKNOWN,
+    RetryPolicy,
+    classify,
+    is_retryable
+)
+
+
+def api_error(code):
+    return pywikibot.data.api.APIError(code, 'mock info')
+
+
+class TestClassify(unittest.TestCase):
+    """Test the classify method."""
+
+    def test_classify_transient_codes(self):
+        for code in ('maxlag', 'ratelimited', 'readonly', 'editconflict'):
+            self.assertEqual(classify(api_error(code)), TRANSIENT, msg=code)
+
+    def test_classify_permanent_codes(self):
+        for code in ('modification-failed', 'no-such-entity', 'failed-save',
+                     'permissiondenied'):
+            self.assertEqual(classify(api_error(code)), PERMANENT, msg=code)
+
+    def test_classify_internal_error_unknown(self):
+        self.assertEqual(
+            classify(api_error('internal_api_error_DBQueryError')), UNKNOWN)
+
+    def test_classify_timeouts(self):
+        self.assertEqual(classify(TimeoutError('mock')), UNKNOWN)
+        self.assertEqual(classify(MaxlagTimeoutError('mock')), TRANSIENT)
+
+    def test_classify_server_errors(self):
+        self.assertEqual(classify(ServerError('mock')), UNKNOWN)
+        self.assertEqual(classify(FatalServerError('mock')), PERMANENT)
+
+    def test_classify_other_error(self):
+        self.assertIsNone(classify(ValueError('mock')))
+
+    def test_is_retryable(self):
+        self.assertTrue(is_retryable(api_error('editconflict')))
+        self.assertTrue(is_retryable(TimeoutError('mock')))
+        self.assertFalse(is_retryable(api_error('no-such-entity')))
+        self.assertFalse(is_retryable(ValueError('mock')))
+        self.assertFalse(is_retryable('missing file'))
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """Test the RetryPolicy class."""
+
+    def setUp(self):
+        self.policy = RetryPolicy(max_retries=2, base_delay=1.0, max_delay=3.0)
+        self.func = mock.MagicMock(return_value='result')
+
+        patcher = mock.patch('pywikibotsdc.retry.time.sleep')
+        self.mock_sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retry_policy_delay_bounded(self):
+        with mock.patch('pywikibotsdc.retry.random.uniform') as mock_uniform:
+            mock_uniform.side_effect = lambda low, high: high
+            self.assertEqual(
+                [self.policy.delay(attempt) for attempt in range(4)],
+                [1.0, 2.0, 3.0, 3.0])
+            mock_uniform.assert_called_with(0, 3.0)
+
+    def test_retry_policy_call_success(self):
+        self.assertEqual(self.policy.call(self.func), 'result')
+        self.func.assert_called_once_with()
+        self.mock_sleep.assert_not_called()
+
+    def test_retry_policy_call_retries_transient(self):
+        self.func.side_effect = [
+            api_error('editconflict'), api_error('ratelimited'), 'result']
+        self.assertEqual(self.policy.call(self.func), 'result')
+        self.assertEqual(self.func.call_count, 3)
+        self.assertEqual(self.mock_sleep.call_count, 2)
+
+    def test_retry_policy_call_permanent_raises(self):
+        self.func.side_effect = api_error('no-such-entity')
+        with self.assertRaises(pywikibot.data.api.APIError):
+            self.policy.call(self.func)
+        self.func.assert_called_once_with()
+        self.mock_sleep.assert_not_called()
+
+    def test_retry_policy_call_other_error_raises(self):
+        self.func.side_effect = ValueError('mock')
+        with self.assertRaises(ValueError):
+            self.policy.call(self.func)
+        self.func.assert_called_once_with()
+
+    def test_retry_policy_call_exhausted_raises_last_error(self):
+        self.func.side_effect = [
+            api_error('editconflict'), api_error('editconflict'),
+            api_error('readonly')]
+        with self.assertRaises(pywikibot.data.api.APIError) as cm:
+            self.policy.call(self.func)
+        self.assertEqual(cm.exception.code, 'readonly')
+        self.assertEqual(self.func.call_count, 3)
+
+    def test_retry_policy_call_unknown_outcome_verified(self):
+        self.func.side_effect = TimeoutError('mock')
+        verify = mock.MagicMock(return_value='saved')
+        self.assertEqual(self.policy.call(self.func, verify), 'saved')
+        self.func.assert_called_once_with()
+        verify.assert_called_once_with()
+
+    def test_retry_policy_call_unknown_outcome_not_saved_retries(self):
+        self.func.side_effect = [TimeoutError('mock'), 'result']
+        verify = mock.MagicMock(return_value=None)
+        self.assertEqual(self.policy.call(self.func, verify), 'result')
+        self.assertEqual(self.func.call_count, 2)
+        verify.assert_called_once_with()
+
+    def test_retry_policy_call_transient_not_verified(self):
+        self.func.side_effect = [api_error('editconflict'), 'result']
+        verify = mock.MagicMock()
+        self.policy.call(self.func, verify)
+        verify.assert_not_called()
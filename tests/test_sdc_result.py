@@ -0,0 +1,34 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for sdc_result.py."""
+from __future__ import unicode_literals
+
+import unittest
+
+import mock
+
+import pywikibot
+
+from pywikibotsdc.sdc_exception import SdcException
+from pywikibotsdc.sdc_result import SdcResult
+
+
+class TestSdcResult(unittest.TestCase):
+    """Test the SdcResult class."""
+
+    def test_sdc_result_success(self):
+        result = SdcResult('Foo.jpg', 'M123', 4)
+        self.assertTrue(result.success)
+        self.assertEqual(result.title, 'Foo.jpg')
+
+    def test_sdc_result_error(self):
+        error = SdcException('warning', 'pre-existing sdc-data', 'Foo')
+        result = SdcResult('Foo.jpg', 'M123', error=error)
+        self.assertFalse(result.success)
+        self.assertIsNone(result.num_statements)
+
+    def test_sdc_result_file_page_title(self):
+        file_page = mock.MagicMock(spec=pywikibot.FilePage)
+        file_page.title.return_value = 'File:Foo.jpg'
+        result = SdcResult(file_page)
+        self.assertEqual(result.title, 'File:Foo.jpg')
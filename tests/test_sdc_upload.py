@@ -3,24 +3,43 @@
 """Unit tests for sdc_upload.py."""
 from __future__ import unicode_literals
 
+import time
 import unittest
+from collections import OrderedDict
 from copy import deepcopy
 
 import mock
 
 import pywikibot
 
+from pywikibotsdc.claim_cache import ClaimCache
+from pywikibotsdc.retry import RetryPolicy
 from pywikibotsdc.sdc_exception import SdcException
+from pywikibotsdc.sdc_result import SdcResult
 from pywikibotsdc.sdc_upload import (
+    _caption_languages,
+    _find_saved_edit,
     _get_existing_structured_data,
+    _resolve_titles,
+    _upload_sdc_data,
+    api_batch_limit,
     coord_precision,
     format_claim_value,
+    format_compiled_payload,
     format_sdc_payload,
+    get_media_identifiers,
+    get_property_ids,
     is_prop_key,
     iso_to_wbtime,
+    make_claim_json,
     merge_strategy,
+    parse_iso_date,
+    prefetch_structured_data,
+    upload_batch_sdc_data,
     upload_single_sdc_data
 )
+from pywikibotsdc.upload_session import UploadSession
+from pywikibotsdc.value_cache import ValueCache
 
 
 class TestIsPropKey(unittest.TestCase):
@@ -45,6 +64,24 @@ class TestIsPropKey(unittest.TestCase):
         self.assertFalse(is_prop_key('42'))
 
 
+class TestGetPropertyIds(unittest.TestCase):
+    """Test the get_property_ids method."""
+
+    def test_get_property_ids_no_claims(self):
+        data = {'caption': {'en': 'Foo'}, 'edit_summary': 'Bar'}
+        self.assertEqual(get_property_ids(data), set())
+
+    def test_get_property_ids_claims_and_qualifiers(self):
+        data = {
+            'caption': {'en': 'Foo'},
+            'P1': 'Q1',
+            'P2': {'_': 'Q2', 'prominent': True, 'P3': 'Q3'},
+            'P4': ['Q4', {'_': 'Q5', 'P5': ['Q6', 'Q7']}],
+        }
+        self.assertEqual(
+            get_property_ids(data), {'P1', 'P2', 'P3', 'P4', 'P5'})
+
+
 class TestIsoToWbtime(unittest.TestCase):
     """Test the iso_to_wbtime method."""
 
@@ -107,6 +144,25 @@ class TestIsoToWbtime(unittest.TestCase):
         self.assertEqual(iso_to_wbtime(date), expected)
 
 
+class TestParseIsoDate(unittest.TestCase):
+    """Test the parse_iso_date method."""
+
+    def test_parse_iso_date_invalid_raises(self):
+        for date in ('', 'late 1980s', '2014-july'):
+            with self.assertRaises(ValueError):
+                parse_iso_date(date)
+
+    def test_parse_iso_date(self):
+        self.assertEqual(parse_iso_date('2014-07-11T08:14:46Z'), (2014, 7, 11))
+        self.assertEqual(parse_iso_date('2014-07Z'), (2014, 7, None))
+        self.assertEqual(parse_iso_date('2014Z'), (2014, None, None))
+
+    def test_parse_iso_date_zeroes(self):
+        self.assertEqual(parse_iso_date('2014-07-00'), (2014, 7, None))
+        self.assertEqual(parse_iso_date('2014-00-00'), (2014, None, None))
+        self.assertEqual(parse_iso_date('2014-00'), (2014, None, None))
+
+
 class TestCoordPrecision(unittest.TestCase):
     """Test the coord_precision method."""
 
@@ -156,6 +212,168 @@ class TestCoordPrecision(unittest.TestCase):
         self.assertEqual(coord_precision('12.34456'), 0.00001)
 
 
+class TestApiBatchLimit(unittest.TestCase):
+    """Test the api_batch_limit method."""
+
+    def setUp(self):
+        self.mock_site = mock.MagicMock()
+
+    def test_api_batch_limit_normal(self):
+        self.mock_site.has_right.return_value = False
+        self.assertEqual(api_batch_limit(self.mock_site), 50)
+        self.mock_site.has_right.assert_called_once_with('apihighlimits')
+
+    def test_api_batch_limit_apihighlimits(self):
+        self.mock_site.has_right.return_value = True
+        self.assertEqual(api_batch_limit(self.mock_site), 500)
+
+
+class TestResolveTitles(unittest.TestCase):
+    """Test the _resolve_titles method."""
+
+    def setUp(self):
+        self.mock_site = mock.MagicMock()
+
+    def set_mock_response_data(self, pages, normalized=None, redirects=None):
+        """Set the mock response of the API call."""
+        data = {'batchcomplete': '', 'query': {'pages': pages}}
+        if normalized:
+            data['query']['normalized'] = normalized
+        if redirects:
+            data['query']['redirects'] = redirects
+        self.mock_site._simple_request.return_value.submit.return_value = data
+
+    def test_resolve_titles_single_request(self):
+        self.set_mock_response_data({})
+        _resolve_titles(['File:A.jpg', 'File:B.jpg'], self.mock_site)
+        self.mock_site._simple_request.assert_called_once_with(
+            action='query', titles=['File:A.jpg', 'File:B.jpg'],
+            redirects=True, prop='info')
+
+    def test_resolve_titles_existing_and_missing(self):
+        self.set_mock_response_data({
+            '-1': {'ns': 6, 'title': 'File:B.jpg', 'missing': ''},
+            '123': {'pageid': 123, 'ns': 6, 'title': 'File:A.jpg'}})
+        result = _resolve_titles(['File:A.jpg', 'File:B.jpg'], self.mock_site)
+        self.assertEqual(result, {
+            'File:A.jpg': ('File:A.jpg', 'M123'),
+            'File:B.jpg': ('File:B.jpg', None)})
+
+    def test_resolve_titles_redirect(self):
+        self.set_mock_response_data(
+            {'456': {'pageid': 456, 'ns': 6, 'title': 'File:C.jpg'}},
+            redirects=[{'from': 'File:A.jpg', 'to': 'File:C.jpg'}])
+        result = _resolve_titles(['File:A.jpg'], self.mock_site)
+        self.assertEqual(result, {'File:A.jpg': ('File:C.jpg', 'M456')})
+
+    def test_resolve_titles_normalized_redirect(self):
+        self.set_mock_response_data(
+            {'456': {'pageid': 456, 'ns': 6, 'title': 'File:C.jpg'}},
+            normalized=[{'from': 'File:a.jpg', 'to': 'File:A.jpg'}],
+            redirects=[{'from': 'File:A.jpg', 'to': 'File:C.jpg'}])
+        result = _resolve_titles(['File:a.jpg'], self.mock_site)
+        self.assertEqual(result, {'File:a.jpg': ('File:C.jpg', 'M456')})
+
+    def test_resolve_titles_formatversion_2(self):
+        self.set_mock_response_data([
+            {'ns': 6, 'title': 'File:B.jpg', 'missing': True},
+            {'pageid': 123, 'ns': 6, 'title': 'File:A.jpg'}])
+        result = _resolve_titles(['File:A.jpg', 'File:B.jpg'], self.mock_site)
+        self.assertEqual(result, {
+            'File:A.jpg': ('File:A.jpg', 'M123'),
+            'File:B.jpg': ('File:B.jpg', None)})
+
+
+class TestFindSavedEdit(unittest.TestCase):
+    """Test the _find_saved_edit method."""
+
+    def setUp(self):
+        self.mock_site = mock.MagicMock()
+        self.mock_site.user.return_value = 'Bot'
+        self.since = 1600000000  # 2020-09-13T12:26:40Z
+
+    def set_mock_revisions(self, revisions):
+        """Set the revisions of the mock response of the API call."""
+        self.mock_site._simple_request.return_value.submit.return_value = {
+            'query': {'pages': {'123': {
+                'pageid': 123, 'ns': 6, 'title': 'File:A.jpg',
+                'revisions': revisions}}}}
+
+    def revision(self, revid, timestamp='2020-09-13T12:27:00Z', user='Bot',
+                 comment='/* wbeditentity-update:0| */ Added 2 statements'):
+        return {'revid': revid, 'timestamp': timestamp, 'user': user,
+                'comment': comment}
+
+    def test_find_saved_edit_request(self):
+        self.set_mock_revisions([])
+        _find_saved_edit(self.mock_site, 'M123', 'Added 2', self.since)
+        self.mock_site._simple_request.assert_called_once_with(
+            action='query', prop='revisions', pageids='123',
+            rvprop=['ids', 'timestamp', 'user', 'comment'], rvlimit=5)
+
+    def test_find_saved_edit_found(self):
+        self.set_mock_revisions([
+            self.revision(2, user='Other', comment='Other edit'),
+            self.revision(1)])
+        self.assertEqual(
+            _find_saved_edit(
+                self.mock_site, 'M123', 'Added 2 statements', self.since),
+            1)
+
+    def test_find_saved_edit_other_summary_or_user(self):
+        self.set_mock_revisions([
+            self.revision(2, comment='Other edit'),
+            self.revision(1, user='Other')])
+        self.assertIsNone(_find_saved_edit(
+            self.mock_site, 'M123', 'Added 2 statements', self.since))
+
+    def test_find_saved_edit_too_old(self):
+        self.set_mock_revisions([
+            self.revision(1, timestamp='2020-09-13T12:00:00Z')])
+        self.assertIsNone(_find_saved_edit(
+            self.mock_site, 'M123', 'Added 2 statements', self.since))
+
+
+class TestGetMediaIdentifiers(unittest.TestCase):
+    """Test the get_media_identifiers method."""
+
+    def setUp(self):
+        self.mock_site = mock.MagicMock(spec=pywikibot.Site)
+
+        patcher = mock.patch('pywikibotsdc.sdc_upload._resolve_titles')
+        self.mock__resolve_titles = patcher.start()
+        self.mock__resolve_titles.side_effect = lambda titles, site: {
+            t: (t, 'M{}'.format(len(t))) for t in titles}
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('pywikibotsdc.sdc_upload.api_batch_limit')
+        self.mock_api_batch_limit = patcher.start()
+        self.mock_api_batch_limit.return_value = 2
+        self.addCleanup(patcher.stop)
+
+    def make_file_page(self, title):
+        """Create a mock FilePage with the given title."""
+        file_page = mock.MagicMock(spec=pywikibot.FilePage)
+        file_page.title.return_value = title
+        return file_page
+
+    def test_get_media_identifiers_batches_requests(self):
+        file_pages = [self.make_file_page('File:{}.jpg'.format('a' * i))
+                      for i in range(1, 6)]
+        result = get_media_identifiers(file_pages, self.mock_site)
+        self.assertEqual(self.mock__resolve_titles.call_count, 3)
+        self.assertEqual(list(result.keys()),
+                         [fp.title() for fp in file_pages])
+
+    def test_get_media_identifiers_deduplicates_titles(self):
+        file_pages = [self.make_file_page('File:A.jpg'),
+                      self.make_file_page('File:A.jpg')]
+        result = get_media_identifiers(file_pages, self.mock_site)
+        self.mock__resolve_titles.assert_called_once_with(
+            ['File:A.jpg'], self.mock_site)
+        self.assertEqual(result, {'File:A.jpg': ('File:A.jpg', 'M10')})
+
+
 class TestGetExistingStructuredData(unittest.TestCase):
     """
     Test the _get_existing_structured_data method.
@@ -257,6 +475,64 @@ class TestGetExistingStructuredData(unittest.TestCase):
         self.assertEqual(result, data)
 
 
+class TestPrefetchStructuredData(unittest.TestCase):
+    """Test the prefetch_structured_data method."""
+
+    def setUp(self):
+        self.mock_site = mock.MagicMock()
+        self.mock_request = self.mock_site._simple_request
+        self.mock_request.return_value.submit.side_effect = (
+            lambda: self.response)
+
+        patcher = mock.patch('pywikibotsdc.sdc_upload.api_batch_limit')
+        self.mock_api_batch_limit = patcher.start()
+        self.mock_api_batch_limit.return_value = 50
+        self.addCleanup(patcher.stop)
+
+        self.response = {
+            'entities': {
+                'M1': {'id': 'M1', 'missing': ''},
+                'M2': {'type': 'mediainfo', 'id': 'M2',
+                       'labels': {'en': {'language': 'en', 'value': 'hi'}},
+                       'statements': []},
+                'M3': {'type': 'mediainfo', 'id': 'M3',
+                       'labels': {}, 'statements': []},
+            },
+            'success': 1
+        }
+
+    def test_prefetch_structured_data_single_request(self):
+        result = prefetch_structured_data(
+            ['M1', 'M2', 'M3'], self.mock_site)
+        self.mock_request.assert_called_once_with(
+            action='wbgetentities', ids=['M1', 'M2', 'M3'],
+            props=['labels', 'claims'])
+        self.assertEqual(result, {
+            'M1': None,
+            'M2': {'type': 'mediainfo', 'id': 'M2',
+                   'labels': {'en': {'language': 'en', 'value': 'hi'}},
+                   'statements': {}},
+            'M3': None})
+
+    def test_prefetch_structured_data_batches_requests(self):
+        self.mock_api_batch_limit.return_value = 2
+        result = prefetch_structured_data(
+            ['M1', 'M2', 'M3', 'M1'], self.mock_site)
+        self.assertEqual(self.mock_request.call_count, 2)
+        self.assertEqual(list(result.keys()), ['M1', 'M2', 'M3'])
+
+    def test_prefetch_structured_data_limit_languages(self):
+        prefetch_structured_data(['M2'], self.mock_site, ['sv', 'en', 'sv'])
+        self.mock_request.assert_called_once_with(
+            action='wbgetentities', ids=['M2'], props=['labels', 'claims'],
+            languages=['en', 'sv'])
+
+    def test_prefetch_structured_data_no_languages_skips_labels(self):
+        prefetch_structured_data(['M2'], self.mock_site, [])
+        self.mock_request.assert_called_once_with(
+            action='wbgetentities', ids=['M2'], props=['claims'])
+
+
 class TestMergeStrategy(unittest.TestCase):
     """Test the merge_strategy method."""
 
@@ -286,9 +562,30 @@ class TestMergeStrategy(unittest.TestCase):
         }
         self.mock__get_existing_structured_data.return_value = data
 
+    def test_merge_strategy_use_prefetched_data(self):
+        prefetched = {self.mid: {'labels': {'sv': 'hello'}, 'statements': {}}}
+        with self.assertRaises(SdcException) as se:
+            merge_strategy(self.mid, self.mock_site, self.base_sdc, None,
+                           prefetched)
+        self.assertEqual(se.exception.data, 'pre-existing sdc-data')
+        self.mock__get_existing_structured_data.assert_not_called()
+
+    def test_merge_strategy_use_prefetched_no_data(self):
+        r = merge_strategy(self.mid, self.mock_site, self.base_sdc, None,
+                           {self.mid: None})
+        self.assertIsNone(r)
+        self.mock__get_existing_structured_data.assert_not_called()
+
+    def test_merge_strategy_fetch_data_not_prefetched(self):
+        merge_strategy(self.mid, self.mock_site, self.base_sdc, None,
+                       {'M456': None})
+        self.mock__get_existing_structured_data.assert_called_once_with(
+            self.mid, self.mock_site)
+
     def test_merge_strategy_any_strategy_no_data(self):
         # Any strategy, even an unknown one, should pass if no prior data.
-        for strategy in (None, 'new', 'blind', 'add', 'nuke', 'foo'):
+        for strategy in (None, 'new', 'blind', 'add', 'merge', 'nuke',
+                         'foo'):
             input_data = deepcopy(self.base_sdc)
             r = merge_strategy(
                 self.mid, self.mock_site, input_data, strategy)
@@ -389,6 +686,82 @@ class TestMergeStrategy(unittest.TestCase):
         self.assertEqual(input_data, self.base_sdc)
         self.assertIsNone(r)
 
+    def item_statement(self, prop, qid, rank='normal'):
+        return {
+            'mainsnak': {
+                'snaktype': 'value', 'property': prop,
+                'datavalue': {'type': 'wikibase-entityid', 'value': {
+                    'entity-type': 'item', 'numeric-id': int(qid[1:])}}},
+            'type': 'statement', 'rank': rank}
+
+    def set_mock_make_claim_json(self):
+        patcher = mock.patch('pywikibotsdc.sdc_upload.make_claim_json')
+        mock_make_claim_json = patcher.start()
+        mock_make_claim_json.side_effect = (
+            lambda value, prop, site: self.item_statement(prop, value))
+        self.addCleanup(patcher.stop)
+        return mock_make_claim_json
+
+    def test_merge_strategy_merge_strategy_drops_present_statements(self):
+        mock_make_claim_json = self.set_mock_make_claim_json()
+        input_data = {'P123': ['Q456', 'Q789'], 'P1': 'Q2'}
+        fetched = self.item_statement('P123', 'Q456')
+        fetched['id'] = 'M123$abc'
+        self.set_mock_response_data(claims={'P123': [fetched]})
+        r = merge_strategy(self.mid, self.mock_site, input_data, 'Merge')
+        self.assertEqual(input_data, {'P123': ['Q789'], 'P1': ['Q2']})
+        self.assertIsNone(r)
+        mock_make_claim_json.assert_any_call('Q456', 'P123', self.mock_site)
+
+    def test_merge_strategy_merge_strategy_compiled_data(self):
+        input_data = {'P123': [self.item_statement('P123', 'Q456'),
+                               self.item_statement('P123', 'Q456'),
+                               self.item_statement('P123', 'Q789')]}
+        self.set_mock_response_data(
+            claims={'P123': [self.item_statement('P123', 'Q789')]})
+        r = merge_strategy(self.mid, self.mock_site, input_data, 'merge')
+        self.assertEqual(
+            input_data, {'P123': [self.item_statement('P123', 'Q456')]})
+        self.assertIsNone(r)
+
+    def test_merge_strategy_merge_strategy_other_rank_is_missing(self):
+        input_data = {'P123': [self.item_statement('P123', 'Q456')]}
+        self.set_mock_response_data(claims={'P123': [
+            self.item_statement('P123', 'Q456', rank='preferred')]})
+        merge_strategy(self.mid, self.mock_site, input_data, 'merge')
+        self.assertEqual(
+            input_data, {'P123': [self.item_statement('P123', 'Q456')]})
+
+    def test_merge_strategy_merge_strategy_captions(self):
+        input_data = {'caption': {'en': 'Foo', 'sv': 'Bar', 'fr': 'Baz'}}
+        self.set_mock_response_data(captions={
+            'en': {'language': 'en', 'value': 'Foo'},
+            'sv': {'language': 'sv', 'value': 'Other'}})
+        r = merge_strategy(self.mid, self.mock_site, input_data, 'merge')
+        self.assertEqual(input_data, {'caption': {'fr': 'Baz'}})
+        self.assertEqual(r, {'pids': set(), 'langs': {'sv'}})
+
+    def test_merge_strategy_merge_strategy_all_present(self):
+        self.set_mock_make_claim_json()
+        self.set_mock_response_data(
+            captions={'en': {'language': 'en', 'value': 'Foo'},
+                      'sv': {'language': 'sv', 'value': 'Bar'}},
+            claims={'P123': [self.item_statement('P123', 'Q456')]})
+        with self.assertRaises(SdcException) as se:
+            merge_strategy(self.mid, self.mock_site, self.base_sdc, 'merge')
+        self.assertEqual(se.exception.data, 'all sdc-data already present')
+
+    def test_merge_strategy_merge_strategy_all_present_or_conflicting(self):
+        self.set_mock_make_claim_json()
+        self.set_mock_response_data(
+            captions={'en': {'language': 'en', 'value': 'Foo'},
+                      'sv': {'language': 'sv', 'value': 'Other'}},
+            claims={'P123': [self.item_statement('P123', 'Q456')]})
+        with self.assertRaises(SdcException) as se:
+            merge_strategy(self.mid, self.mock_site, self.base_sdc, 'merge')
+        self.assertEqual(
+            se.exception.data, 'all conflicting pre-existing sdc-data')
+
 
 class TestUploadSingleSdcData(unittest.TestCase):
     """Test the upload_single_sdc_data method."""
@@ -435,6 +808,15 @@ class TestUploadSingleSdcData(unittest.TestCase):
         self.mock_get_media_identifier.return_value = 'M123'
         self.addCleanup(patcher.stop)
 
+        patcher = mock.patch('pywikibotsdc.sdc_upload._find_saved_edit')
+        self.mock_find_saved_edit = patcher.start()
+        self.mock_find_saved_edit.return_value = None
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('pywikibotsdc.retry.time.sleep')
+        self.mock_sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
     def test_upload_single_sdc_data_handle_upload_error(self):
         self.mock__submit_data.side_effect = pywikibot.data.api.APIError('mock error', '')  # noqa:E501
         with self.assertRaises(SdcException) as se:
@@ -460,6 +842,96 @@ class TestUploadSingleSdcData(unittest.TestCase):
             payload = call[0][1]
             self.assertEqual(payload.get('clear', 0), 0, msg=strategies[num])
 
+    def test_upload_single_sdc_data_returns_num_statements(self):
+        self.mock_format_sdc_payload.return_value = {
+            'labels': {'en': {}, 'sv': {}}, 'claims': [{}]}
+        num = upload_single_sdc_data(self.mock_file_page, self.base_sdc)
+        self.assertEqual(num, 3)
+
+    def test_upload_sdc_data_stores_revision_id(self):
+        self.mock__submit_data.return_value = {
+            'entity': {'id': 'M123', 'lastrevid': 456}, 'success': 1}
+        result = _upload_sdc_data(
+            self.mock_file_page, self.base_sdc, None, None, None, False,
+            None, None)
+        self.assertEqual(result.media_identifier, 'M123')
+        self.assertEqual(result.revision_id, 456)
+
+    def test_upload_single_sdc_data_compiled(self):
+        compiled = {'caption': {'en': 'foo'}, 'P1': [{'mainsnak': {}}]}
+        num = upload_single_sdc_data(
+            self.mock_file_page, compiled, compiled=True)
+        self.assertEqual(num, 2)
+        self.mock_format_sdc_payload.assert_not_called()
+        payload = self.mock__submit_data.call_args[0][1]
+        self.assertEqual(
+            payload['data'],
+            '{"labels":{"en":{"language":"en","value":"foo"}},'
+            '"claims":[{"mainsnak":{}}]}')
+
+    def test_upload_single_sdc_data_uses_session(self):
+        session = mock.MagicMock()
+        session.bot = 'bot flag'
+        session.retry_policy = RetryPolicy()
+        session.purge_queue = None
+        session.with_token.side_effect = lambda func: func('token')
+        upload_single_sdc_data(
+            self.mock_file_page, self.base_sdc, null_edit=True,
+            session=session)
+        payload = self.mock__submit_data.call_args[0][1]
+        self.assertEqual(payload['token'], 'token')
+        self.assertEqual(payload['bot'], 'bot flag')
+        self.mock_pwb_touch.assert_called_once_with(botflag='bot flag')
+        self.mock_file_page.site.has_right.assert_not_called()
+
+    def test_upload_single_sdc_data_null_edit_deferred_to_purge_queue(self):
+        session = UploadSession(
+            self.mock_file_page.site, purge_queue=mock.MagicMock())
+        session._token = 'token'
+        session._rights['bot'] = True
+        upload_single_sdc_data(
+            self.mock_file_page, self.base_sdc, null_edit=True,
+            session=session)
+        session.purge_queue.add.assert_called_once_with(self.mock_file_page)
+        self.mock_pwb_touch.assert_not_called()
+
+    def test_upload_single_sdc_data_retries_transient_error(self):
+        self.mock__submit_data.side_effect = [
+            pywikibot.data.api.APIError('editconflict', ''),
+            {'entity': {'lastrevid': 456}}]
+        result = _upload_sdc_data(
+            self.mock_file_page, self.base_sdc, None, None, None, False,
+            None, None)
+        self.assertEqual(result.revision_id, 456)
+        self.assertEqual(self.mock__submit_data.call_count, 2)
+        self.mock_find_saved_edit.assert_not_called()
+
+    def test_upload_single_sdc_data_unknown_outcome_already_saved(self):
+        self.mock__submit_data.side_effect = (
+            pywikibot.exceptions.TimeoutError('mock'))
+        self.mock_find_saved_edit.return_value = 789
+        result = _upload_sdc_data(
+            self.mock_file_page, self.base_sdc, None, None, None, False,
+            None, None)
+        self.assertEqual(result.revision_id, 789)
+        self.mock__submit_data.assert_called_once()
+        self.mock_find_saved_edit.assert_called_once_with(
+            self.mock_file_page.site, 'M123',
+            'Added 0 structured data statement(s) #pwbsdc', mock.ANY)
+
+    def test_upload_single_sdc_data_retries_exhausted(self):
+        self.mock__submit_data.side_effect = (
+            pywikibot.exceptions.TimeoutError('mock timeout'))
+        session = mock.MagicMock()
+        session.with_token.side_effect = lambda func: func('token')
+        session.retry_policy = RetryPolicy(max_retries=2)
+        with self.assertRaises(SdcException) as se:
+            upload_single_sdc_data(
+                self.mock_file_page, self.base_sdc, session=session)
+        self.assertTrue('mock timeout' in se.exception.log)
+        self.assertEqual(self.mock__submit_data.call_count, 3)
+        self.assertEqual(self.mock_find_saved_edit.call_count, 3)
+
     def test_upload_single_sdc_data_nuke_triggers_clear(self):
         upload_single_sdc_data(
             self.mock_file_page, self.base_sdc, strategy="Nuke")
@@ -489,6 +961,310 @@ class TestUploadSingleSdcData(unittest.TestCase):
         self.mock_pwb_touch.assert_called()
 
 
+class TestFormatCompiledPayload(unittest.TestCase):
+    """Test the format_compiled_payload method."""
+
+    def test_format_compiled_payload(self):
+        claim_1 = {'mainsnak': {'property': 'P1'}}
+        claim_2 = {'mainsnak': {'property': 'P2'}}
+        data = OrderedDict([
+            ('caption', {'en': 'foo'}),
+            ('edit_summary', 'bar'),
+            ('P1', [claim_1]),
+            ('P2', [claim_2, claim_2]),
+        ])
+        self.assertEqual(
+            format_compiled_payload(data),
+            {'labels': {'en': {'language': 'en', 'value': 'foo'}},
+             'claims': [claim_1, claim_2, claim_2]})
+
+    def test_format_compiled_payload_uncompiled_raises(self):
+        for value in ('Q1', ['Q1'], [{'_': 'Q1'}]):
+            with self.assertRaises(ValueError):
+                format_compiled_payload({'P1': value})
+
+    def test_format_compiled_payload_no_recognised_data_raises(self):
+        with self.assertRaises(ValueError):
+            format_compiled_payload({'edit_summary': 'bar'})
+        with self.assertRaises(ValueError):
+            format_compiled_payload({'caption': {}, 'P1': []})
+
+
+class TestUploadBatchSdcData(unittest.TestCase):
+    """Test the upload_batch_sdc_data method."""
+
+    def setUp(self):
+        self.mock_site = mock.MagicMock()
+        self.file_data = [
+            ('A.jpg', {'caption': {'en': 'Foo'}}),
+            ('B.jpg', {'P1': 'Q1'}),
+            ('C.jpg', {'P2': {'_': 'Q2', 'P3': 'Q3'}}),
+        ]
+        self.mids = {'A.jpg': 'M1', 'B.jpg': None, 'C.jpg': 'M3'}
+
+        patcher = mock.patch('pywikibotsdc.sdc_upload.api_batch_limit')
+        self.mock_api_batch_limit = patcher.start()
+        self.mock_api_batch_limit.return_value = 2
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('pywikibotsdc.sdc_upload.get_media_identifiers')
+        self.mock_get_media_identifiers = patcher.start()
+        self.mock_get_media_identifiers.side_effect = lambda pages, site: {
+            page: ('File:' + page, self.mids[page]) for page in pages}
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch(
+            'pywikibotsdc.sdc_upload.prefetch_structured_data')
+        self.mock_prefetch_structured_data = patcher.start()
+        self.mock_prefetch_structured_data.side_effect = (
+            lambda mids, site, languages: {mid: None for mid in mids})
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('pywikibotsdc.sdc_upload.get_datatype_cache')
+        self.mock_get_datatype_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('pywikibotsdc.sdc_upload._upload_sdc_data')
+        self.mock_upload_sdc_data = patcher.start()
+        self.mock_upload_sdc_data.side_effect = (
+            lambda file_page, sdc_data, site, strategy, summary, null_edit,
+            mid, prefetched, compiled, session: SdcResult(file_page, mid, 2))
+        self.addCleanup(patcher.stop)
+
+    def test_upload_batch_sdc_data_batches_lookups(self):
+        results = list(upload_batch_sdc_data(self.file_data, self.mock_site))
+        self.assertEqual(self.mock_get_media_identifiers.call_count, 2)
+        self.assertEqual(self.mock_prefetch_structured_data.call_count, 2)
+        self.mock_prefetch_structured_data.assert_any_call(
+            ['M1'], self.mock_site, None)
+        warm = self.mock_get_datatype_cache.return_value.warm
+        warm.assert_any_call(self.mock_site.data_repository(), {'P1'})
+        warm.assert_any_call(self.mock_site.data_repository(), {'P2', 'P3'})
+        self.assertEqual([r.title for r in results],
+                         ['A.jpg', 'B.jpg', 'C.jpg'])
+
+    def test_upload_batch_sdc_data_missing_file_error_result(self):
+        results = list(upload_batch_sdc_data(self.file_data, self.mock_site))
+        self.assertEqual(self.mock_upload_sdc_data.call_count, 2)
+        self.assertTrue(results[0].success)
+        self.assertEqual(results[0].num_statements, 2)
+        self.assertEqual(results[0].media_identifier, 'M1')
+        self.assertFalse(results[1].success)
+        self.assertEqual(results[1].error.data, 'missing file')
+
+    def test_upload_batch_sdc_data_passes_prefetched(self):
+        list(upload_batch_sdc_data(
+            self.file_data, self.mock_site, strategy='add', null_edit=True))
+        self.mock_upload_sdc_data.assert_called_with(
+            'C.jpg', self.file_data[2][1], self.mock_site, 'add', None, True,
+            'M3', {'M3': None}, False, mock.ANY)
+
+    def test_upload_batch_sdc_data_shares_session(self):
+        list(upload_batch_sdc_data(self.file_data, self.mock_site))
+        sessions = [call[0][9] for call in
+                    self.mock_upload_sdc_data.call_args_list]
+        self.assertIs(sessions[0], sessions[1])
+        self.assertIs(sessions[0].site, self.mock_site)
+
+    def test_upload_batch_sdc_data_compiled(self):
+        list(upload_batch_sdc_data(
+            self.file_data, self.mock_site, compiled=True))
+        self.mock_get_datatype_cache.return_value.warm.assert_not_called()
+        self.mock_upload_sdc_data.assert_called_with(
+            'C.jpg', self.file_data[2][1], self.mock_site, None, None, False,
+            'M3', {'M3': None}, True, mock.ANY)
+
+    def test_upload_batch_sdc_data_null_edit_purge_queue(self):
+        with mock.patch('pywikibotsdc.sdc_upload.PurgeQueue') as mock_queue:
+            list(upload_batch_sdc_data(
+                self.file_data, self.mock_site, null_edit=True))
+        mock_queue.assert_called_once_with(self.mock_site, 2, None)
+        sessions = [call[0][9] for call in
+                    self.mock_upload_sdc_data.call_args_list]
+        self.assertIs(sessions[0].purge_queue, mock_queue.return_value)
+        mock_queue.return_value.close.assert_called_once_with()
+
+    def test_upload_batch_sdc_data_no_null_edit_no_purge_queue(self):
+        with mock.patch('pywikibotsdc.sdc_upload.PurgeQueue') as mock_queue:
+            list(upload_batch_sdc_data(self.file_data, self.mock_site))
+        mock_queue.assert_not_called()
+        session = self.mock_upload_sdc_data.call_args[0][9]
+        self.assertIsNone(session.purge_queue)
+
+    def test_upload_batch_sdc_data_stopped_early_purges(self):
+        with mock.patch('pywikibotsdc.sdc_upload.PurgeQueue') as mock_queue:
+            results = upload_batch_sdc_data(
+                self.file_data, self.mock_site, null_edit=True)
+            next(results)
+            results.close()
+        mock_queue.return_value.close.assert_called_once_with()
+
+    def test_upload_batch_sdc_data_sdc_exception_does_not_stop(self):
+        self.mock_upload_sdc_data.side_effect = [
+            SdcException('warning', 'pre-existing sdc-data', 'mock'),
+            SdcResult('C.jpg', 'M3', 3)]
+        results = list(upload_batch_sdc_data(self.file_data, self.mock_site))
+        self.assertEqual(results[0].error.data, 'pre-existing sdc-data')
+        self.assertEqual(results[2].num_statements, 3)
+
+    def test_upload_batch_sdc_data_other_exception_raises(self):
+        self.mock_upload_sdc_data.side_effect = ValueError('mock')
+        with self.assertRaises(ValueError):
+            list(upload_batch_sdc_data(self.file_data, self.mock_site))
+
+    def test_upload_batch_sdc_data_requeues_temporary_errors(self):
+        temporary = SdcException(
+            'error', pywikibot.data.api.APIError('editconflict', ''), 'mock')
+        self.mock_upload_sdc_data.side_effect = [
+            temporary, SdcResult('C.jpg', 'M3', 3),
+            SdcResult('A.jpg', 'M1', 1)]
+        results = list(upload_batch_sdc_data(self.file_data, self.mock_site))
+        self.assertEqual([r.title for r in results],
+                         ['B.jpg', 'C.jpg', 'A.jpg'])
+        self.assertEqual(results[2].num_statements, 1)
+        # the pre-existing data is refetched
+        self.mock_upload_sdc_data.assert_called_with(
+            'A.jpg', self.file_data[0][1], self.mock_site, None, None, False,
+            'M1', None, False, mock.ANY)
+
+    def test_upload_batch_sdc_data_requeued_once(self):
+        temporary = SdcException(
+            'error', pywikibot.data.api.APIError('editconflict', ''), 'mock')
+        self.mock_upload_sdc_data.side_effect = [
+            temporary, SdcResult('C.jpg', 'M3', 3), temporary]
+        results = list(upload_batch_sdc_data(self.file_data, self.mock_site))
+        self.assertEqual([r.title for r in results],
+                         ['B.jpg', 'C.jpg', 'A.jpg'])
+        self.assertIs(results[2].error, temporary)
+        self.assertEqual(self.mock_upload_sdc_data.call_count, 3)
+
+    def test_upload_batch_sdc_data_permanent_error_not_requeued(self):
+        self.mock_upload_sdc_data.side_effect = [
+            SdcException(
+                'error', pywikibot.data.api.APIError('no-such-entity', ''),
+                'mock'),
+            SdcResult('C.jpg', 'M3', 3)]
+        results = list(upload_batch_sdc_data(self.file_data, self.mock_site))
+        self.assertEqual([r.title for r in results],
+                         ['A.jpg', 'B.jpg', 'C.jpg'])
+        self.assertEqual(self.mock_upload_sdc_data.call_count, 2)
+
+    def test_upload_batch_sdc_data_concurrent(self):
+        results = list(upload_batch_sdc_data(
+            self.file_data, self.mock_site, workers=3))
+        self.assertEqual([r.title for r in results],
+                         ['A.jpg', 'B.jpg', 'C.jpg'])
+        self.assertEqual(self.mock_upload_sdc_data.call_count, 2)
+
+    def pipelined(self):
+        """Patch the two halves of an upload used by a pipelined batch."""
+        patcher = mock.patch('pywikibotsdc.sdc_upload._prepare_upload')
+        mock_prepare_upload = patcher.start()
+        mock_prepare_upload.side_effect = (
+            lambda file_page, sdc_data, site, strategy, summary, mid,
+            prefetched, compiled: (SdcResult(file_page, mid), file_page,
+                                   {'id': mid}, 2))
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('pywikibotsdc.sdc_upload._submit_upload')
+        mock_submit_upload = patcher.start()
+        mock_submit_upload.side_effect = (
+            lambda upload, null_edit, session: SdcResult(
+                upload[1], upload[2]['id'], upload[3]))
+        self.addCleanup(patcher.stop)
+        return mock_prepare_upload, mock_submit_upload
+
+    def test_upload_batch_sdc_data_lookahead(self):
+        mock_prepare_upload, mock_submit_upload = self.pipelined()
+        results = list(upload_batch_sdc_data(
+            self.file_data, self.mock_site, strategy='add', null_edit=True,
+            lookahead=1))
+        self.assertEqual([(r.title, r.media_identifier, r.num_statements)
+                          for r in results],
+                         [('A.jpg', 'M1', 2), ('B.jpg', None, None),
+                          ('C.jpg', 'M3', 2)])
+        self.assertEqual(results[1].error.data, 'missing file')
+        # batches no larger than the lookahead
+        self.assertEqual(self.mock_get_media_identifiers.call_count, 3)
+        mock_prepare_upload.assert_called_with(
+            'C.jpg', self.file_data[2][1], self.mock_site, 'add', None, 'M3',
+            {'M3': None}, False)
+        mock_submit_upload.assert_called_with(
+            mock.ANY, True, mock.ANY)
+        self.mock_upload_sdc_data.assert_not_called()
+
+    def test_upload_batch_sdc_data_lookahead_prepares_ahead(self):
+        mock_prepare_upload, mock_submit_upload = self.pipelined()
+        prepared_before_submit = []
+        submit_upload = mock_submit_upload.side_effect
+
+        def slow_submit(upload, null_edit, session):
+            time.sleep(0.05)
+            prepared_before_submit.append(mock_prepare_upload.call_count)
+            return submit_upload(upload, null_edit, session)
+
+        mock_submit_upload.side_effect = slow_submit
+        list(upload_batch_sdc_data(
+            self.file_data, self.mock_site, lookahead=2))
+        # C.jpg was prepared while A.jpg was being submitted
+        self.assertEqual(prepared_before_submit, [2, 2])
+
+    def test_upload_batch_sdc_data_lookahead_sdc_exception(self):
+        mock_prepare_upload, mock_submit_upload = self.pipelined()
+        mock_prepare_upload.side_effect = SdcException(
+            'warning', 'pre-existing sdc-data', 'mock')
+        mock_submit_upload.side_effect = SdcException(
+            'error', pywikibot.data.api.APIError('no-such-entity', ''),
+            'mock')
+        results = list(upload_batch_sdc_data(
+            self.file_data, self.mock_site, lookahead=2))
+        self.assertEqual([r.error.data for r in results][::2],
+                         ['pre-existing sdc-data', 'pre-existing sdc-data'])
+        mock_submit_upload.assert_not_called()
+
+    def test_upload_batch_sdc_data_lookahead_requeues_temporary_errors(self):
+        mock_prepare_upload, mock_submit_upload = self.pipelined()
+        temporary = SdcException(
+            'error', pywikibot.data.api.APIError('editconflict', ''), 'mock')
+        mock_submit_upload.side_effect = [
+            temporary, SdcResult('C.jpg', 'M3', 3)]
+        results = list(upload_batch_sdc_data(
+            self.file_data, self.mock_site, lookahead=2))
+        self.assertEqual([r.title for r in results],
+                         ['B.jpg', 'C.jpg', 'A.jpg'])
+        self.mock_upload_sdc_data.assert_called_once_with(
+            'A.jpg', self.file_data[0][1], self.mock_site, None, None, False,
+            'M1', None, False, mock.ANY)
+
+    def test_upload_batch_sdc_data_lookahead_other_exception_raises(self):
+        mock_prepare_upload, _ = self.pipelined()
+        mock_prepare_upload.side_effect = ValueError('mock')
+        with self.assertRaises(ValueError):
+            list(upload_batch_sdc_data(
+                self.file_data, self.mock_site, lookahead=2))
+
+
+class TestCaptionLanguages(unittest.TestCase):
+    """Test the _caption_languages method."""
+
+    def setUp(self):
+        self.file_data = [
+            ('A.jpg', {'caption': {'en': 'Foo', 'sv': 'Bar'}}),
+            ('B.jpg', {'caption': {'fr': 'Baz'}, 'P1': 'Q1'}),
+            ('C.jpg', {'P1': 'Q1'}),
+        ]
+
+    def test_caption_languages_no_strategy_all_languages(self):
+        self.assertIsNone(_caption_languages(self.file_data, None))
+
+    def test_caption_languages_strategy(self):
+        self.assertEqual(
+            _caption_languages(self.file_data, 'add'), {'en', 'sv', 'fr'})
+
+    def test_caption_languages_strategy_no_captions(self):
+        self.assertEqual(_caption_languages(self.file_data[2:], 'add'), set())
+
+
 class TestFormatSdcPayload(unittest.TestCase):
     """Test the format_sdc_payload method."""
 
@@ -544,6 +1320,53 @@ class TestFormatSdcPayload(unittest.TestCase):
         self.assertEqual(data, expected_data)
 
 
+class TestMakeClaimJson(unittest.TestCase):
+    """Test the make_claim_json method."""
+
+    def setUp(self):
+        self.mock_site = mock.MagicMock()
+        self.mock_site.data_repository.return_value.family.name = 'wikidata'
+        self.mock_site.data_repository.return_value.code = 'wikidata'
+        self.cache = ClaimCache()
+
+        patcher = mock.patch('pywikibotsdc.sdc_upload.get_claim_cache')
+        mock_get_claim_cache = patcher.start()
+        mock_get_claim_cache.return_value = self.cache
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('pywikibotsdc.sdc_upload.make_claim')
+        self.mock_make_claim = patcher.start()
+        self.mock_make_claim.side_effect = (
+            lambda value, prop, site: mock.MagicMock(**{
+                'toJSON.return_value': {'mainsnak': {
+                    'property': prop, 'value': value}}}))
+        self.addCleanup(patcher.stop)
+
+    def test_make_claim_json_memoised(self):
+        first = make_claim_json('Q1', 'P1', self.mock_site)
+        second = make_claim_json('Q1', 'P1', self.mock_site)
+        self.assertEqual(
+            first, {'mainsnak': {'property': 'P1', 'value': 'Q1'}})
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.mock_make_claim.assert_called_once_with(
+            'Q1', 'P1', self.mock_site)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_make_claim_json_differing_values(self):
+        make_claim_json('Q1', 'P1', self.mock_site)
+        make_claim_json('Q2', 'P1', self.mock_site)
+        make_claim_json({'_': 'Q1', 'P2': 'Q3'}, 'P1', self.mock_site)
+        self.assertEqual(self.mock_make_claim.call_count, 3)
+
+    def test_make_claim_json_error_not_cached(self):
+        self.mock_make_claim.side_effect = ValueError('mock')
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                make_claim_json('foo', 'P1', self.mock_site)
+        self.assertEqual(len(self.cache), 0)
+
+
 class TestFormatClaimValue(unittest.TestCase):
     """Test the format_claim_value method."""
 
@@ -575,6 +1398,13 @@ class TestFormatClaimValue(unittest.TestCase):
         self.mock_coord_precision.return_value = 0.1
         self.addCleanup(patcher.stop)
 
+        self.value_cache = ValueCache()
+        patcher = mock.patch(
+            'pywikibotsdc.sdc_upload.get_value_cache',
+            return_value=self.value_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def set_claim_type(self, val):
         type(self.mock_claim).type = mock.PropertyMock(return_value=val)
 
@@ -646,6 +1476,24 @@ class TestFormatClaimValue(unittest.TestCase):
         self.assertEqual(data, expected_data)
         self.mock_iso_to_wbtime.assert_called_once_with('2021-03-02')
 
+    def test_format_claim_value_time_interned(self):
+        self.set_claim_type('time')
+        first = format_claim_value(self.mock_claim, '2021-03-02')
+        second = format_claim_value(self.mock_claim, '2021-03-02')
+        self.assertIs(first, second)
+        self.mock_iso_to_wbtime.assert_called_once_with('2021-03-02')
+        format_claim_value(self.mock_claim, '2021-03-03')
+        self.assertEqual(self.mock_iso_to_wbtime.call_count, 2)
+
+    def test_format_claim_value_coord_interned_per_canonical_value(self):
+        self.set_claim_type('globe-coordinate')
+        first = format_claim_value(
+            self.mock_claim, {'lat': '55.70', 'lon': '13.19'})
+        second = format_claim_value(
+            self.mock_claim, {'lon': '13.19', 'lat': '55.70'})
+        self.assertIs(first, second)
+        self.assertEqual(self.value_cache.stats()['hits'], 1)
+
     def test_format_claim_value_coord(self):
         self.set_claim_type('globe-coordinate')
         expected_data = pywikibot.Coordinate(55.7, 13.19, precision=0.1)
@@ -665,6 +1513,7 @@ class TestFormatClaimValue(unittest.TestCase):
         self.assertEqual(data, expected_data)
 
         # ensure order of precisions are irrelevant
+        self.value_cache.clear()
         self.mock_coord_precision.side_effect = [1, 0.1]
         data = format_claim_value(
             self.mock_claim, {'lat': '55.70', 'lon': '13.19'})
@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for throughput.py."""
+from __future__ import unicode_literals
+
+import unittest
+
+import mock
+
+import pywikibotsdc.throughput as throughput
+from pywikibotsdc.throughput import ThroughputController
+
+
+class TestThroughputController(unittest.TestCase):
+    """Test the ThroughputController class."""
+
+    def setUp(self):
+        patcher = mock.patch('pywikibotsdc.throughput.time')
+        self.mock_time = patcher.start()
+        self.mock_time.time.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('pywikibotsdc.throughput.pywikibot')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.controller = ThroughputController(
+            max_concurrency=4, start_rate=2.0, max_rate=10.0)
+
+    def response(self, content=b'{}', headers=None):
+        return mock.MagicMock(content=content, headers=headers or {})
+
+    def test_controller_paces_edits(self):
+        self.controller.acquire()
+        self.controller.release()
+        self.assertEqual(self.controller.active, 0)
+        self.assertEqual(self.controller._next_slot, 1000.5)
+
+    def test_controller_release_increases(self):
+        with self.controller.edit_slot():
+            self.assertEqual(self.controller.active, 1)
+        self.assertEqual(self.controller.edits, 1)
+        self.assertAlmostEqual(
+            self.controller.rate, 2.0 + throughput.RATE_INCREASE / 2.0)
+
+    def test_controller_failed_edit_does_not_increase(self):
+        with self.assertRaises(ValueError):
+            with self.controller.edit_slot():
+                raise ValueError('mock')
+        self.assertEqual(self.controller.active, 0)
+        self.assertEqual(self.controller.edits, 0)
+        self.assertEqual(self.controller.rate, 2.0)
+
+    def test_controller_rate_limited_by_max_rate(self):
+        self.controller.rate = 9.999
+        self.controller.release()
+        self.assertEqual(self.controller.rate, 10.0)
+
+    def test_controller_concurrency_increases_stepwise(self):
+        for _ in range(throughput.CONCURRENCY_STEP - 1):
+            self.controller._increase()
+        self.assertEqual(self.controller.concurrency, 1)
+        self.controller._increase()
+        self.assertEqual(self.controller.concurrency, 2)
+        self.controller.concurrency = 4
+        for _ in range(throughput.CONCURRENCY_STEP):
+            self.controller._increase()
+        self.assertEqual(self.controller.concurrency, 4)
+
+    def test_controller_throttle_decreases_once_per_interval(self):
+        self.controller.concurrency = 3
+        self.controller.throttle('maxlag', retry_after=2, lag=7)
+        self.assertEqual(self.controller.rate, 1.0)
+        self.assertEqual(self.controller.concurrency, 2)
+        self.assertEqual(self.controller._backoff_until, 1002.0)
+        self.assertEqual(self.controller.last_lag, 7)
+
+        self.mock_time.time.return_value = 1001.0
+        self.controller.throttle('ratelimited')
+        self.assertEqual(self.controller.rate, 1.0)
+        self.assertEqual(self.controller._backoff_until,
+                         1001.0 + throughput.DEFAULT_BACKOFF)
+
+        self.mock_time.time.return_value = (
+            1000.0 + throughput.DECREASE_INTERVAL)
+        self.controller.throttle('maxlag', retry_after=1)
+        self.assertEqual(self.controller.rate, 0.5)
+        self.assertEqual(self.controller.concurrency, 1)
+        self.assertEqual(
+            self.controller.throttled, {'maxlag': 2, 'ratelimited': 1})
+
+    def test_controller_throttle_respects_min_rate(self):
+        self.controller.rate = throughput.DEFAULT_MIN_RATE
+        self.controller.throttle('maxlag')
+        self.assertEqual(self.controller.rate, throughput.DEFAULT_MIN_RATE)
+
+    def test_controller_observe_maxlag(self):
+        with mock.patch.object(self.controller, 'throttle') as mock_throttle:
+            self.controller.observe('uri', {}, self.response(
+                b'{"error": {"code": "maxlag", "lag": 6}}',
+                {'retry-after': '5', 'x-database-lag': '6'}))
+        mock_throttle.assert_called_once_with('maxlag', 5.0, 6.0)
+
+    def test_controller_observe_ratelimited(self):
+        with mock.patch.object(self.controller, 'throttle') as mock_throttle:
+            self.controller.observe('uri', {}, self.response(
+                '{"error":{"code":"ratelimited"}}'))
+        mock_throttle.assert_called_once_with('ratelimited', None, None)
+
+    def test_controller_observe_retry_after(self):
+        with mock.patch.object(self.controller, 'throttle') as mock_throttle:
+            self.controller.observe('uri', {}, self.response(
+                headers={'retry-after': '3'}))
+        mock_throttle.assert_called_once_with('retry-after', 3.0, None)
+
+    def test_controller_observe_ignores_other_responses(self):
+        with mock.patch.object(self.controller, 'throttle') as mock_throttle:
+            self.controller.observe('uri', {}, self.response(
+                b'{"paraminfo": {"parameters": [{"name": "maxlag"}]}}'))
+            self.controller.observe('uri', {}, self.response(
+                b'{"error": {"code": "badtoken"}}'))
+            self.controller.observe('uri', {}, self.response(b'"error" <'))
+            self.controller.observe('uri', {}, self.response(None))
+        mock_throttle.assert_not_called()
+
+    def test_controller_status(self):
+        self.assertEqual(
+            self.controller.status(),
+            '2.00 edits/s, 1/4 concurrent edits, 0 edits')
+        self.controller.throttle('maxlag', retry_after=2, lag=7)
+        self.assertEqual(
+            self.controller.status(),
+            '1.00 edits/s, 1/4 concurrent edits, 0 edits, '
+            'backing off for 2.0s, throttled by maxlag x1, last lag 7s')
+
+    def test_controller_start_stop(self):
+        with mock.patch('pywikibotsdc.throughput.http_hooks') as hooks:
+            self.controller.start()
+            hooks.add_observer.assert_called_once_with(self.controller.observe)
+            self.controller.stop()
+            hooks.remove_observer.assert_called_once_with(
+                self.controller.observe)
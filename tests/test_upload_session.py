@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for upload_session.py."""
+from __future__ import unicode_literals
+
+import unittest
+
+import mock
+
+import pywikibot
+
+from pywikibotsdc.upload_session import UploadSession
+
+
+class TestUploadSession(unittest.TestCase):
+    """Test the UploadSession class."""
+
+    def setUp(self):
+        self.mock_site = mock.MagicMock()
+        self.tokens = ['token1', 'token2', 'token3']
+        self.mock_site.tokens.__getitem__.side_effect = (
+            lambda key: self.tokens[0])
+        self.mock_site.tokens.load_tokens.side_effect = (
+            lambda types: self.tokens.pop(0))
+        self.session = UploadSession(self.mock_site)
+
+    def bad_token_error(self):
+        return pywikibot.data.api.APIError('badtoken', 'Invalid CSRF token.')
+
+    def test_upload_session_token_cached(self):
+        self.assertEqual(self.session.token, 'token1')
+        self.assertEqual(self.session.token, 'token1')
+        self.mock_site.tokens.__getitem__.assert_called_once_with('csrf')
+
+    def test_upload_session_has_right_cached(self):
+        self.mock_site.has_right.side_effect = lambda right: right == 'bot'
+        self.assertTrue(self.session.bot)
+        self.assertTrue(self.session.has_right('bot'))
+        self.assertFalse(self.session.has_right('apihighlimits'))
+        self.assertEqual(self.mock_site.has_right.call_count, 2)
+
+    def test_upload_session_edit_slot(self):
+        with self.session.edit_slot():
+            pass
+        controller = mock.MagicMock()
+        session = UploadSession(self.mock_site, controller=controller)
+        self.assertIs(
+            session.edit_slot(), controller.edit_slot.return_value)
+
+    def test_upload_session_invalidate_token(self):
+        self.session.invalidate_token(self.session.token)
+        self.assertEqual(self.session.token, 'token2')
+        self.mock_site.tokens.load_tokens.assert_called_once_with(['csrf'])
+
+    def test_upload_session_invalidate_token_already_refetched(self):
+        self.session.invalidate_token(self.session.token)
+        self.session.invalidate_token('token1')
+        self.assertEqual(self.session.token, 'token2')
+        self.mock_site.tokens.load_tokens.assert_called_once()
+
+    def test_upload_session_with_token(self):
+        func = mock.MagicMock(return_value='response')
+        self.assertEqual(self.session.with_token(func), 'response')
+        func.assert_called_once_with('token1')
+
+    def test_upload_session_with_token_badtoken_retried(self):
+        func = mock.MagicMock(side_effect=[self.bad_token_error(), 'response'])
+        self.assertEqual(self.session.with_token(func), 'response')
+        self.assertEqual(func.call_args_list,
+                         [mock.call('token1'), mock.call('token2')])
+
+    def test_upload_session_with_token_badtoken_gives_up(self):
+        func = mock.MagicMock(side_effect=self.bad_token_error())
+        with self.assertRaises(pywikibot.data.api.APIError):
+            self.session.with_token(func)
+        self.assertEqual(func.call_count, 3)
+
+    def test_upload_session_with_token_other_error_raised(self):
+        func = mock.MagicMock(side_effect=pywikibot.data.api.APIError(
+            'editconflict', 'Edit conflict.'))
+        with self.assertRaises(pywikibot.data.api.APIError):
+            self.session.with_token(func)
+        func.assert_called_once()
+        self.mock_site.tokens.load_tokens.assert_not_called()
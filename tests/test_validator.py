@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for validator.py."""
+from __future__ import unicode_literals
+
+import unittest
+
+from pywikibotsdc.validator import validate_batch_sdc_data, validate_sdc_data
+
+DATATYPES = {
+    'P1': 'wikibase-item',
+    'P2': 'time',
+    'P3': 'globe-coordinate',
+    'P4': 'quantity',
+    'P5': 'monolingualtext',
+    'P6': 'string',
+    'P7': 'commonsMedia',
+    'P8': 'tabular-data',
+    'P9': None,
+}
+
+
+class TestValidateSdcData(unittest.TestCase):
+    """Test the validate_sdc_data method."""
+
+    def assert_errors(self, sdc_data, paths, datatypes=DATATYPES):
+        errors = validate_sdc_data(sdc_data, datatypes)
+        self.assertEqual([path for path, _ in errors], paths, msg=errors)
+        return errors
+
+    def test_validate_sdc_data_valid(self):
+        self.assert_errors({
+            'edit_summary': 'Added {count} statements',
+            'caption': {'en': 'Foo', 'zh-hans': 'Bar'},
+            'P1': ['Q1', {'_': 'Q2', 'prominent': True, 'P2': '2020-01',
+                          'P4': [{'amount': 5, 'unit': 'Q3'}, '1.5e3']}],
+            'P2': '2014-07-11T08:14:46Z',
+            'P3': {'_': {'lat': '59.3', 'lon': '-18'}},
+            'P4': '123.4@Q11570',
+            'P5': 'Spider@en',
+            'P6': '_no_value_',
+            'P7': 'File:Foo.jpg',
+            'P8': 'Data:Foo.tab',
+            'P10': {'_': 'anything', 'P11': {'_': 'qualifier'}},
+            'other': 'ignored',
+        }, [])
+
+    def test_validate_sdc_data_not_an_object(self):
+        self.assert_errors(['P1'], [''])
+
+    def test_validate_sdc_data_no_data(self):
+        self.assert_errors({'edit_summary': 'foo'}, [''])
+        self.assert_errors({'caption': {}, 'other': 'P1'}, [''])
+
+    def test_validate_sdc_data_reports_all_errors_with_paths(self):
+        errors = self.assert_errors({
+            'P1': ['Q1', 'P1', {'_': 'q0', 'P2': ['2020-13-01', 5]}],
+            'P2': {'P4': '5'},
+            'P3': '59@lat,18@lat',
+        }, ['P1[1]', 'P1[2]._', 'P1[2].P2[0]', 'P1[2].P2[1]', 'P2',
+            'P3'])
+        self.assertIn('not a valid month', errors[2][1])
+
+    def test_validate_sdc_data_invalid_property_keys(self):
+        self.assert_errors(
+            {'P1': 'Q1', 'p2': 'x', 'P0': 'x', 'P3a': 'x', 'Pid': 'x'},
+            ['p2', 'P0', 'P3a'])
+        self.assert_errors(
+            {'P1': {'_': 'Q1', 'p2': 'x'}}, ['P1.p2'])
+
+    def test_validate_sdc_data_dates(self):
+        for date in ('2020', '2020-12', '2020-12-31', '2020-12-31Z',
+                     '1922-09-17T08:14:46Z', '2020-00-00'):
+            self.assert_errors({'P2': date}, [])
+        for date in ('20200', '2020-12-32', '12/31/2020', '-2020', ''):
+            self.assert_errors({'P2': date}, ['P2'])
+
+    def test_validate_sdc_data_coordinates(self):
+        self.assert_errors({'P3': '18.1@lon,59.3@lat'}, [])
+        for coordinate in ('59.3,18.1', '59.3@lat,18e1@lon',
+                           '91@lat,18@lon', {'lat': 59.3, 'lon': '18'}):
+            self.assert_errors({'P3': {'_': coordinate}}, ['P3._'])
+
+    def test_validate_sdc_data_quantities(self):
+        for quantity in ('five', '5@kg', {'unit': 'Q1'}, {'amount': True}):
+            self.assert_errors({'P4': {'_': quantity}}, ['P4._'])
+
+    def test_validate_sdc_data_monolingual_texts(self):
+        for text in ('Spider', '@en', {'text': 'Spider'},
+                     {'text': 'Spider', 'lang': 'EN'}):
+            self.assert_errors({'P5': {'_': text}}, ['P5._'])
+
+    def test_validate_sdc_data_dict_for_string_datatype(self):
+        self.assert_errors({'P6': {'_': {'text': 'a', 'lang': 'en'}}},
+                           ['P6._'])
+
+    def test_validate_sdc_data_missing_property(self):
+        self.assert_errors({'P9': 'x'}, ['P9'])
+
+    def test_validate_sdc_data_unknown_datatype_only_structure(self):
+        self.assert_errors({'P2': 'not a date'}, [], datatypes=None)
+        self.assert_errors({'P2': 5, 'P3': []}, ['P2', 'P3'],
+                           datatypes=None)
+
+    def test_validate_sdc_data_complex_claim(self):
+        self.assert_errors(
+            {'P1': {'prominent': 'yes', 'P2': [[]]}},
+            ['P1', 'P1.prominent', 'P1.P2[0]'])
+
+    def test_validate_sdc_data_caption_and_summary(self):
+        self.assert_errors(
+            {'P1': 'Q1', 'caption': {'en': '', 'Not a lang': 'Foo'},
+             'edit_summary': 'Added {num}'},
+            ['caption.en', 'caption.Not a lang', 'edit_summary'])
+        self.assert_errors({'caption': 'Foo'}, ['caption', ''])
+
+
+class TestValidateBatchSdcData(unittest.TestCase):
+    """Test the validate_batch_sdc_data method."""
+
+    def test_validate_batch_sdc_data_only_invalid_files(self):
+        file_data = iter([
+            ('A.jpg', {'P1': 'Q1'}),
+            ('B.jpg', {'P1': 'x'}),
+            ('C.jpg', {'caption': {'en': 'Foo'}}),
+            ('D.jpg', {}),
+        ])
+        results = list(validate_batch_sdc_data(file_data, DATATYPES))
+        self.assertEqual([(name, [path for path, _ in errors])
+                          for name, errors in results],
+                         [('B.jpg', ['P1']), ('D.jpg', [''])])
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for value_cache.py."""
+from __future__ import unicode_literals
+
+import unittest
+
+import mock
+
+from pywikibotsdc.value_cache import ValueCache, value_key
+
+
+class TestValueKey(unittest.TestCase):
+    """Test the value_key method."""
+
+    def test_value_key_string_value(self):
+        self.assertEqual(
+            value_key('time', '2020-01-01', 'repo'),
+            ('repo', 'time', '2020-01-01'))
+
+    def test_value_key_dict_value_canonical(self):
+        self.assertEqual(
+            value_key('quantity', {'amount': '5', 'unit': 'Q1'}),
+            value_key('quantity', {'unit': 'Q1', 'amount': '5'}))
+        self.assertNotEqual(
+            value_key('quantity', {'amount': '5'}),
+            value_key('quantity', {'amount': 5}))
+
+    def test_value_key_differs_per_datatype_and_context(self):
+        key = value_key('string', '5', 'repo')
+        self.assertNotEqual(key, value_key('quantity', '5', 'repo'))
+        self.assertNotEqual(key, value_key('string', '5', 'other'))
+
+
+class TestValueCache(unittest.TestCase):
+    """Test the ValueCache class."""
+
+    def setUp(self):
+        self.cache = ValueCache(maxsize=2)
+        self.parse = mock.MagicMock(side_effect=lambda: object())
+
+    def test_value_cache_miss_then_hit(self):
+        first = self.cache.intern('a', self.parse)
+        self.assertIs(self.cache.intern('a', self.parse), first)
+        self.parse.assert_called_once_with()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_value_cache_returns_copies_of_dicts(self):
+        value = {'time': '+2020', 'precision': 9}
+        self.cache.intern('a', lambda: value)['precision'] = 11
+        self.assertEqual(self.cache.intern('a', self.parse)['precision'], 9)
+        self.parse.assert_not_called()
+
+    def test_value_cache_parse_errors_not_cached(self):
+        self.parse.side_effect = ValueError
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                self.cache.intern('a', self.parse)
+        self.assertEqual(self.parse.call_count, 2)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_value_cache_evicts_least_recently_used(self):
+        self.cache.intern('a', self.parse)
+        self.cache.intern('b', self.parse)
+        self.cache.intern('a', self.parse)
+        self.cache.intern('c', self.parse)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.evictions, 1)
+        self.cache.intern('a', self.parse)
+        self.cache.intern('c', self.parse)
+        self.assertEqual(self.parse.call_count, 3)
+        self.cache.intern('b', self.parse)
+        self.assertEqual(self.parse.call_count, 4)
+
+    def test_value_cache_clear(self):
+        self.cache.intern('a', self.parse)
+        self.cache.intern('a', self.parse)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+
+    def test_value_cache_stats(self):
+        self.assertIsNone(self.cache.stats()['hit_rate'])
+        for key in ('a', 'a', 'a', 'b', 'c'):
+            self.cache.intern(key, self.parse)
+        self.assertEqual(self.cache.stats(), {
+            'size': 2, 'maxsize': 2, 'hits': 2, 'misses': 3, 'evictions': 1,
+            'hit_rate': 2 / 5.0})
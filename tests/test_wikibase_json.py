@@ -0,0 +1,376 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for wikibase_json.py."""
+from __future__ import unicode_literals
+
+import json
+import pickle
+import unittest
+
+import mock
+
+from pywikibotsdc.sdc_upload import format_compiled_payload, format_sdc_payload
+from pywikibotsdc.value_cache import ValueCache
+from pywikibotsdc.wikibase_json import (
+    RepoInfo,
+    compile_batch_sdc_data,
+    compile_claim,
+    compile_sdc_data,
+    compile_sdc_payload,
+    compile_value,
+    get_datatype_table
+)
+from stub_sites import (
+    CALENDAR_MODEL,
+    CONCEPT_BASE_URI,
+    GLOBES,
+    StubDatatypeCache,
+    StubRepo,
+    patch_offline
+)
+
+DATATYPES = {
+    'P1': 'wikibase-item',
+    'P2': 'commonsMedia',
+    'P3': 'geo-shape',
+    'P4': 'tabular-data',
+    'P5': 'monolingualtext',
+    'P6': 'globe-coordinate',
+    'P7': 'quantity',
+    'P8': 'time',
+    'P9': 'string',
+    'P10': 'url',
+    'P11': 'external-id',
+    'P12': 'math',
+    'P13': 'musical-notation',
+    'P14': 'wikibase-property',
+}
+
+
+def dump(payload):
+    """Serialise a payload the way it is sent to the API."""
+    return json.dumps(payload, separators=(',', ':'))
+
+
+class TestPayloadParity(unittest.TestCase):
+    """Test that compile_sdc_payload matches format_sdc_payload exactly."""
+
+    def setUp(self):
+        self.repo = StubRepo()
+        self.repo_info = RepoInfo.from_site(self.repo)
+        patch_offline(self, self.repo, DATATYPES)
+
+    def assert_parity(self, data, repo_info=None):
+        expected = dump(format_sdc_payload(self.repo, data))
+        result = dump(compile_sdc_payload(
+            data, DATATYPES, repo_info or self.repo_info))
+        self.assertEqual(result, expected)
+
+    def test_parity_caption_only(self):
+        self.assert_parity({'caption': {'en': 'foo', 'sv': 'bår'}})
+
+    def test_parity_item(self):
+        self.assert_parity({'P1': 'Q42'})
+        self.assert_parity({'P1': 'q7'})
+
+    def test_parity_commons_media(self):
+        for value in ('Foo.jpg', 'File:foo_bar.jpg', 'image: foo  bar.jpg',
+                      ' File:Foo.jpg ', 'ärta.png'):
+            self.assert_parity({'P2': value})
+
+    def test_parity_data_pages(self):
+        self.assert_parity({'P3': 'Data:sweden_x.map'})
+        self.assert_parity({'P4': 'data:Population data.tab'})
+
+    def test_parity_monolingualtext(self):
+        self.assert_parity({'P5': 'bar@sv'})
+        self.assert_parity({'P5': {'_': {'text': 'bar', 'lang': 'sv'}}})
+
+    def test_parity_coordinate(self):
+        self.assert_parity({'P6': '12.123@lat,-0.5@lon'})
+        self.assert_parity({'P6': {'_': {'lat': '60', 'lon': '200'}}})
+        self.assert_parity({'P6': {'_': {'lat': '0', 'lon': '15.00'}}})
+
+    def test_parity_quantity(self):
+        for value in ('-0.5@Q11573', '1E3', '0.0001234', '1.50',
+                      '12345678901234567890', {'_': {'amount': '42'}},
+                      {'_': {'amount': 3, 'unit': 'Q1'}}):
+            self.assert_parity({'P7': value})
+
+    def test_parity_quantity_required_bounds(self):
+        self.repo = StubRepo(mw_version='1.28')
+        repo_info = RepoInfo.from_site(self.repo)
+        for value in ('-0.5@Q11573', '1.50', '0'):
+            self.assert_parity({'P7': value}, repo_info)
+
+    def test_parity_time(self):
+        for value in ('2014-07-11T08:14:46Z', '1922-09-17Z', '2014-07',
+                      '2014-07-00', '2014-00-00', '1921', '0999-01-01',
+                      '2020-00-05'):
+            self.assert_parity({'P8': value})
+
+    def test_parity_strings(self):
+        self.assert_parity({
+            'P9': 'a string', 'P10': 'https://example.com',
+            'P11': '1234-X', 'P12': 'E=mc^2', 'P13': '\\relative c'})
+
+    def test_parity_some_and_no_value(self):
+        self.assert_parity({
+            'P1': '_some_value_', 'P8': '_no_value_', 'P14': '_some_value_'})
+
+    def test_parity_list(self):
+        self.assert_parity({'P1': ['Q1', 'Q2', {'_': 'Q3'}]})
+
+    def test_parity_prominent(self):
+        self.assert_parity({'P1': {'_': 'Q1', 'prominent': True}})
+        self.assert_parity({'P1': {'_': 'Q1', 'prominent': False}})
+
+    def test_parity_qualifiers(self):
+        self.assert_parity({
+            'P1': {
+                '_': 'Q1',
+                'prominent': True,
+                'P8': '2020-01',
+                'P6': {'lat': '1.5', 'lon': '2'},
+                'P5': ['foo@en', {'_': 'bar@sv'}],
+                'P9': '_no_value_',
+                'P7': '5@Q12',
+                'not_a_prop': 'ignored',
+            }})
+
+    def test_parity_full(self):
+        self.assert_parity({
+            'caption': {'en': 'A caption'},
+            'summary': 'ignored',
+            'P2': 'File:Example.jpg',
+            'P1': ['Q5', {'_': 'Q6', 'P8': '1921', 'P1': ['Q7', 'Q8']}],
+            'P8': '2001-02-03',
+        })
+
+
+class TestCompileSdcPayload(unittest.TestCase):
+    """Test the compile_sdc_payload method."""
+
+    def setUp(self):
+        self.repo_info = RepoInfo(
+            CALENDAR_MODEL, CONCEPT_BASE_URI, GLOBES['earth'])
+
+        self.value_cache = ValueCache()
+        patcher = mock.patch(
+            'pywikibotsdc.wikibase_json.get_value_cache',
+            return_value=self.value_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_compile_sdc_payload_no_recognised_data_raises(self):
+        with self.assertRaises(ValueError):
+            compile_sdc_payload(
+                {'summary': 'foo', 'bar': 'Q1'}, DATATYPES, self.repo_info)
+
+    def test_compile_claim_bad_value_raises(self):
+        with self.assertRaises(ValueError):
+            compile_claim(5, 'P1', DATATYPES, self.repo_info)
+        with self.assertRaises(ValueError):
+            compile_claim({'_': 'Q1', 'P1': 5}, 'P1', DATATYPES,
+                          self.repo_info)
+
+    def test_compile_claim_unknown_datatype_raises(self):
+        with self.assertRaises(ValueError):
+            compile_claim('Q1', 'P99', DATATYPES, self.repo_info)
+
+    def test_compile_claim_unknown_datatype_some_value(self):
+        self.assertEqual(
+            compile_claim('_some_value_', 'P99', {}, self.repo_info),
+            {'mainsnak': {'snaktype': 'somevalue', 'property': 'P99'},
+             'type': 'statement', 'rank': 'normal'})
+
+    def test_compile_value_unsupported_datatype_raises(self):
+        with self.assertRaises(ValueError):
+            compile_value('wikibase-property', 'P1', self.repo_info)
+
+    def test_compile_value_invalid_values_raise(self):
+        invalid = (
+            ('wikibase-item', 'foo'),
+            ('wikibase-item', 'Q0'),
+            ('commonsMedia', 'Foo[1].jpg'),
+            ('commonsMedia', ' _ '),
+            ('geo-shape', 'Sweden.map'),
+            ('tabular-data', 'Data:Sweden.map'),
+            ('monolingualtext', 'foo'),
+            ('monolingualtext', '@en'),
+            ('quantity', 'ten'),
+            ('quantity', '5@foo'),
+            ('time', 'late 1980s'),
+            ('string', {'_': 'foo'}),
+        )
+        for datatype, value in invalid:
+            with self.assertRaises(ValueError, msg=(datatype, value)):
+                compile_value(datatype, value, self.repo_info)
+        self.assertEqual(len(self.value_cache), 0)
+
+    def test_compile_value_interned(self):
+        first = compile_value('time', '2014-07-11Z', self.repo_info)
+        second = compile_value('time', '2014-07-11Z', self.repo_info)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.assertEqual(
+            (self.value_cache.hits, self.value_cache.misses), (1, 1))
+
+    def test_compile_value_interned_per_repo_info(self):
+        compile_value('quantity', '5@Q1', self.repo_info)
+        repo_info = RepoInfo(
+            CALENDAR_MODEL, CONCEPT_BASE_URI, GLOBES['earth'],
+            require_bounds=True)
+        self.assertEqual(
+            compile_value('quantity', '5@Q1', repo_info)['upperBound'], '+5')
+        self.assertEqual(self.value_cache.misses, 2)
+
+    def test_compile_value_only_parsed_values_interned(self):
+        compile_value('wikibase-item', 'Q1', self.repo_info)
+        compile_value('string', 'foo', self.repo_info)
+        self.assertEqual(len(self.value_cache), 0)
+
+
+class TestCompileSdcData(unittest.TestCase):
+    """Test the compile_sdc_data method."""
+
+    def setUp(self):
+        self.repo_info = RepoInfo(
+            CALENDAR_MODEL, CONCEPT_BASE_URI, GLOBES['earth'])
+        self.data = {
+            'caption': {'en': 'A caption'},
+            'edit_summary': 'foo',
+            'summary': 'ignored',
+            'P2': 'File:Example.jpg',
+            'P1': ['Q5', {'_': 'Q6', 'P8': '1921'}],
+        }
+
+    def test_compile_sdc_data_keeps_structure(self):
+        compiled = compile_sdc_data(self.data, DATATYPES, self.repo_info)
+        self.assertEqual(
+            set(compiled.keys()), {'caption', 'edit_summary', 'P1', 'P2'})
+        self.assertEqual(compiled['caption'], {'en': 'A caption'})
+        self.assertEqual(compiled['edit_summary'], 'foo')
+        self.assertEqual(len(compiled['P1']), 2)
+        self.assertEqual(
+            compiled['P2'],
+            [compile_claim('File:Example.jpg', 'P2', DATATYPES,
+                           self.repo_info)])
+
+    def test_compile_sdc_data_payload_parity(self):
+        compiled = compile_sdc_data(self.data, DATATYPES, self.repo_info)
+        self.assertEqual(
+            dump(format_compiled_payload(compiled)),
+            dump(compile_sdc_payload(self.data, DATATYPES, self.repo_info)))
+
+    def test_compile_sdc_data_survives_json(self):
+        compiled = compile_sdc_data(self.data, DATATYPES, self.repo_info)
+        self.assertEqual(
+            format_compiled_payload(json.loads(dump(compiled))),
+            format_compiled_payload(compiled))
+
+    def test_compile_sdc_data_no_recognised_data_raises(self):
+        with self.assertRaises(ValueError):
+            compile_sdc_data(
+                {'edit_summary': 'foo', 'bar': 'Q1'}, DATATYPES,
+                self.repo_info)
+
+
+class TestCompileBatchSdcData(unittest.TestCase):
+    """Test the compile_batch_sdc_data method."""
+
+    def setUp(self):
+        self.repo = StubRepo()
+        self.cache = StubDatatypeCache(DATATYPES)
+        self.cache.table = mock.MagicMock(side_effect=self.cache.table)
+        patcher = mock.patch(
+            'pywikibotsdc.wikibase_json.get_datatype_cache',
+            return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_compile_batch_sdc_data(self):
+        file_data = [
+            ('A.jpg', {'P1': 'Q1', 'edit_summary': 'foo'}),
+            ('B.jpg', {'P1': {'_': 'Q2', 'P8': '2020'}}),
+        ]
+        results = list(compile_batch_sdc_data(file_data, self.repo))
+        self.cache.table.assert_called_once_with(self.repo, {'P1', 'P8'})
+        self.assertEqual([r[0] for r in results], ['A.jpg', 'B.jpg'])
+        self.assertEqual(results[0][1]['edit_summary'], 'foo')
+        self.assertEqual(len(results[1][1]['P1']), 1)
+        self.assertIsNone(results[1][2])
+
+    def test_compile_batch_sdc_data_summary(self):
+        results = list(compile_batch_sdc_data(
+            [('A.jpg', {'P1': 'Q1', 'edit_summary': 'foo'})], self.repo,
+            summary='bar'))
+        self.assertEqual(results[0][1]['edit_summary'], 'bar')
+
+    def test_compile_batch_sdc_data_error_does_not_stop(self):
+        file_data = [
+            ('A.jpg', {'P1': {'P8': '2020'}}),
+            ('B.jpg', {'P99': 'Q1'}),
+            ('C.jpg', {'P1': 'Q1'}),
+        ]
+        results = list(compile_batch_sdc_data(file_data, self.repo))
+        self.assertIsNone(results[0][1])
+        self.assertEqual(results[0][2].level, 'error')
+        self.assertIn('Formatting SDC data failed', results[1][2].log)
+        self.assertIsNone(results[2][2])
+
+    def test_compile_batch_sdc_data_processes(self):
+        file_data = [
+            ('{0}.jpg'.format(i), {'P1': 'Q{0}'.format(i + 1)})
+            for i in range(120)]
+        file_data[7] = ('7.jpg', {'P99': 'Q1'})
+        with mock.patch('pywikibotsdc.wikibase_json.COMPILE_CHUNK_SIZE', 7):
+            results = list(compile_batch_sdc_data(
+                file_data, self.repo, summary='bar', processes=3))
+        inline = compile_batch_sdc_data(file_data, self.repo, summary='bar')
+        self.assertEqual(
+            [(name, compiled, error and error.log)
+             for name, compiled, error in results],
+            [(name, compiled, error and error.log)
+             for name, compiled, error in inline])
+        self.assertEqual([r[0] for r in results],
+                         [file_name for file_name, _ in file_data])
+        self.assertIn('Formatting SDC data failed', results[7][2].log)
+        self.assertEqual(results[8][1]['edit_summary'], 'bar')
+
+    def test_compile_batch_sdc_data_non_positive_processes_raises(self):
+        with self.assertRaises(ValueError):
+            next(compile_batch_sdc_data([], self.repo, processes=0))
+
+
+class TestRepoInfo(unittest.TestCase):
+    """Test the RepoInfo class."""
+
+    def test_repo_info_picklable(self):
+        repo_info = RepoInfo.from_site(StubRepo())
+        self.assertEqual(
+            repr(pickle.loads(pickle.dumps(repo_info))), repr(repo_info))
+        self.assertEqual(
+            repr(repo_info),
+            "RepoInfo('{0}', '{1}', '{2}', False)".format(
+                CALENDAR_MODEL, CONCEPT_BASE_URI, GLOBES['earth']))
+
+    def test_repo_info_equality(self):
+        repo_info = RepoInfo.from_site(StubRepo())
+        self.assertEqual(repo_info, RepoInfo.from_site(StubRepo()))
+        self.assertEqual(
+            hash(repo_info), hash(RepoInfo.from_site(StubRepo())))
+        self.assertNotEqual(
+            repo_info, RepoInfo.from_site(StubRepo(mw_version='1.28')))
+
+
+class TestGetDatatypeTable(unittest.TestCase):
+    """Test the get_datatype_table method."""
+
+    def test_get_datatype_table(self):
+        repo = StubRepo()
+        with mock.patch(
+                'pywikibotsdc.wikibase_json.get_datatype_cache') as cache:
+            get_datatype_table(repo, {'P1': {'_': 'Q1', 'P8': '2020'}})
+        cache.return_value.table.assert_called_once_with(
+            repo, {'P1', 'P8'})
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf-8  -*-
+"""Unit tests for worker_pool.py."""
+from __future__ import unicode_literals
+
+import threading
+import time
+import unittest
+
+from pywikibotsdc.worker_pool import process_concurrently
+
+
+class TestProcessConcurrently(unittest.TestCase):
+    """Test the process_concurrently method."""
+
+    def setUp(self):
+        self.threads = set()
+
+    def slow_square(self, value):
+        """Square value, taking longer for smaller values."""
+        self.threads.add(threading.current_thread().name)
+        time.sleep(0.01 * (5 - value))
+        if value == 3:
+            raise ValueError('three')
+        return value * value
+
+    def collect(self, results):
+        """Return list of (item, result or exception) for all results."""
+        output = []
+        for item, future in results:
+            self.assertTrue(future.done())
+            output.append((item, future.exception() or future.result()))
+        return output
+
+    def test_process_concurrently_single_worker_inline(self):
+        results = self.collect(
+            process_concurrently(self.slow_square, range(5)))
+        self.assertEqual(results[4], (4, 16))
+        self.assertIsInstance(results[3][1], ValueError)
+        self.assertEqual(
+            self.threads, {threading.current_thread().name})
+
+    def test_process_concurrently_input_order(self):
+        results = self.collect(
+            process_concurrently(self.slow_square, range(5), workers=4))
+        self.assertEqual([item for item, _ in results], list(range(5)))
+        self.assertIsInstance(results[3][1], ValueError)
+        self.assertEqual(results[4][1], 16)
+        self.assertTrue(len(self.threads) > 1)
+
+    def test_process_concurrently_completion_order(self):
+        results = self.collect(process_concurrently(
+            self.slow_square, range(5), workers=5, order='completion'))
+        self.assertEqual(sorted(item for item, _ in results), list(range(5)))
+        self.assertEqual(results[0][0], 4)
+
+    def test_process_concurrently_bounded_lookahead(self):
+        pulled = []
+
+        def items():
+            for i in range(100):
+                pulled.append(i)
+                yield i
+
+        results = process_concurrently(lambda x: x, items(), workers=3)
+        next(results)
+        self.assertTrue(len(pulled) <= 7)
+        self.assertEqual(len(self.collect(results)), 99)
+
+    def test_process_concurrently_unknown_order_raises(self):
+        with self.assertRaises(ValueError):
+            list(process_concurrently(abs, [1], order='random'))
+
+    def test_process_concurrently_no_workers_raises(self):
+        with self.assertRaises(ValueError):
+            list(process_concurrently(abs, [1], workers=0))